@@ -3,6 +3,12 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the module production serves (``uvicorn backend.asgi:application``,
+see the deployment guide in documentation.md). The order status stream
+(api/orders/stream/) is an async view that holds its connection open; under
+ASGI each open stream costs a coroutine, whereas a WSGI worker would be tied
+up for as long as the stream stays open.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
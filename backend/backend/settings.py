@@ -86,6 +86,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+# Production is served over ASGI (uvicorn backend.asgi:application) for the status stream
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
@@ -102,6 +104,16 @@ DATABASES = {
     }
 }
 
+# Cache shared by the worker processes. The order stats versions and lock, the pricing
+# matrix version, the branch index version, the rider manifest versions and the eSewa
+# circuit breaker and status cache all rely on every worker seeing the same keys, so
+# production must set CACHE_URL to a shared backend, e.g. redis://127.0.0.1:6379/1.
+# Without it each process gets its own LocMemCache (fine for development and tests);
+# the orders.W001 deploy check warns about that.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -252,6 +264,17 @@ ESEWA_PRODUCT_CODE = 'EPAYTEST'  # UAT Product Code
 ESEWA_PAYMENT_URL = 'https://rc-epay.esewa.com.np/api/epay/main/v2/form'
 ESEWA_STATUS_CHECK_URL = 'https://rc.esewa.com.np/api/epay/transaction/status/'
 
+# Pending eSewa payments are checked by reconcile_esewa_payments once they are this old,
+# and given up as NOT_FOUND when eSewa still does not know them after the expiry
+ESEWA_RECONCILE_AFTER_MINUTES = 15
+ESEWA_PENDING_EXPIRY_MINUTES = 60
+
 
 # Frontend URL for success/failure redirects
-FRONTEND_URL = 'https://laundry-nine-sooty.vercel.app' 
\ No newline at end of file
+FRONTEND_URL = 'https://laundry-nine-sooty.vercel.app' 
+
+# Orders: default number of pickups + drops a branch takes per day and time slot
+ORDER_SLOT_CAPACITY = 20
+
+# Orders: closed orders older than this many days are moved to the archive tables by archive_orders
+ORDER_ARCHIVE_AFTER_DAYS = 180
@@ -0,0 +1,53 @@
+"""
+Management command to store the coordinates embedded in branch and address map links.
+New and edited rows get their coordinates on save; this fills in existing rows.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from branches.models import Branch
+from branches.spatial import invalidate_index
+from orders.models import UserAddress
+from orders.routing import parse_coordinates
+
+
+class Command(BaseCommand):
+    help = 'Backfill latitude/longitude of branches and user addresses from their map links'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be changed without saving',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        summary = {}
+
+        for model in (Branch, UserAddress):
+            changed, located = [], 0
+            for row in model.objects.only('id', 'map_link', 'latitude', 'longitude').iterator():
+                latitude, longitude = parse_coordinates(row.map_link) or (None, None)
+                if latitude is not None:
+                    located += 1
+                if (row.latitude, row.longitude) != (latitude, longitude):
+                    row.latitude, row.longitude = latitude, longitude
+                    changed.append(row)
+            if changed and not dry_run:
+                with transaction.atomic():
+                    model.objects.bulk_update(changed, ['latitude', 'longitude'], batch_size=500)
+            summary[model.__name__] = (len(changed), located)
+
+        if not dry_run:
+            invalidate_index()
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE'))
+        else:
+            self.stdout.write(self.style.SUCCESS('BACKFILL COMPLETE'))
+        for name, (changed, located) in summary.items():
+            self.stdout.write(f'{name}: {changed} updated, {located} with coordinates')
+        self.stdout.write('='*60)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branch',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
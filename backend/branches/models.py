@@ -12,6 +12,9 @@ class Branch(models.Model):
     city = models.CharField(max_length=100)
     # Map location link
     map_link = models.URLField(max_length=500, blank=True, null=True)
+    # Coordinates parsed from map_link on save (used by the nearest-branch index)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     phone = models.CharField(max_length=20)
     email = models.EmailField(max_length=255)
     status = models.CharField(max_length=20, choices=[
@@ -23,7 +26,13 @@ class Branch(models.Model):
     modified = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        """Override save to auto-generate branch_id if not provided."""
+        """Override save to auto-generate branch_id if not provided and store map coordinates."""
+        from orders.routing import parse_coordinates
+        self.latitude, self.longitude = parse_coordinates(self.map_link) or (None, None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'map_link' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude'}
+
         if not self.branch_id:
             # Get the highest existing branch number
             last_branch = Branch.objects.filter(
@@ -133,3 +142,15 @@ class BranchManager(models.Model):
                 self.manager_id = f"MGR-{new_id:04d}"
 
         super().save(*args, **kwargs)
+
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branch_spatial_index(sender, instance, **kwargs):
+    """Make every process reload the nearest-branch index on its next lookup."""
+    from .spatial import invalidate_index
+    invalidate_index()
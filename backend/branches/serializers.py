@@ -21,12 +21,14 @@ class BranchSerializer(serializers.ModelSerializer):
         model = Branch
         fields = [
             'id', 'name', 'branch_id', 'branch_manager', 'address', 'city',
-            'map_link',
+            'map_link', 'latitude', 'longitude',
             'phone', 'email', 'status', 'opening_date', 'created', 'modified',
             'total_orders', 'monthly_revenue', 'monthly_expenses', 'staff_count'
         ]
         extra_kwargs = {
             'branch_id': {'read_only': True},  # Auto-generated, so read-only
+            'latitude': {'read_only': True},  # Parsed from map_link on save
+            'longitude': {'read_only': True},
         }
 
 class BranchStatsSerializer(serializers.ModelSerializer):
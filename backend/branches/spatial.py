@@ -0,0 +1,106 @@
+"""In-process spatial index of active branches for nearest-branch lookups.
+
+Branches are bucketed into a fixed grid of CELL_SIZE degree cells. A k-nearest
+query scans rings of cells outwards from the query's cell and stops as soon as
+no unscanned cell can hold anything closer than the k-th best match, so a
+lookup touches a handful of cells regardless of how many branches exist.
+
+Each process keeps its own copy of the index and reloads it when the
+version key in the cache changes; Branch saves and deletes bump that key. The
+key is only seen by every worker when the default cache is shared between
+processes (CACHE_URL).
+"""
+import math
+import uuid
+
+from django.core.cache import cache
+
+from orders.routing import haversine_km
+
+CELL_SIZE = 0.05  # degrees, roughly 5.5 km of latitude
+KM_PER_DEGREE = 111.32
+VERSION_CACHE_KEY = 'branch-spatial-index-version'
+
+
+class BranchSpatialIndex:
+    """Grid index over ``(lat, lng, branch)`` entries."""
+
+    def __init__(self, entries, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        for entry in entries:
+            self.cells.setdefault(self._cell(entry['latitude'], entry['longitude']), []).append(entry)
+        self.size = sum(len(bucket) for bucket in self.cells.values())
+        # Cell-index bounds of the occupied grid: (min row, max row, min column, max column)
+        rows, columns = [i for i, _ in self.cells], [j for _, j in self.cells]
+        self.bounds = (min(rows), max(rows), min(columns), max(columns)) if self.cells else None
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def _ring(self, ci, cj, radius):
+        """Yield the cells at Chebyshev distance ``radius`` from (ci, cj)."""
+        if radius == 0:
+            yield ci, cj
+            return
+        for dj in range(-radius, radius + 1):
+            yield ci - radius, cj + dj
+            yield ci + radius, cj + dj
+        for di in range(-radius + 1, radius):
+            yield ci + di, cj - radius
+            yield ci + di, cj + radius
+
+    def nearest(self, lat, lng, k=3):
+        """Return up to ``k`` ``(distance_km, entry)`` pairs, closest first."""
+        if not self.cells or k <= 0:
+            return []
+        ci, cj = self._cell(lat, lng)
+        # No occupied cell lies further out than the farthest corner of the bounds
+        min_i, max_i, min_j, max_j = self.bounds
+        max_radius = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj)
+        point = (lat, lng)
+        found = []
+        for radius in range(max_radius + 1):
+            for cell in self._ring(ci, cj, radius):
+                for entry in self.cells.get(cell, ()):
+                    found.append((haversine_km(point, (entry['latitude'], entry['longitude'])), entry))
+            if len(found) >= k:
+                found.sort(key=lambda match: match[0])
+                # Anything in ring radius + 1 is at least `radius` whole cells away
+                shrink = max(math.cos(math.radians(min(abs(lat) + (radius + 1) * self.cell_size, 89.0))), 0.01)
+                if found[k - 1][0] <= radius * self.cell_size * KM_PER_DEGREE * shrink:
+                    break
+        found.sort(key=lambda match: match[0])
+        return found[:k]
+
+
+_index = None
+_index_version = None
+
+
+def invalidate_index():
+    """Tell every process to rebuild its index on the next lookup."""
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def get_index():
+    """Return this process's index of active branches, reloading it when stale."""
+    global _index, _index_version
+    from .models import Branch
+
+    version = cache.get_or_set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    if _index is None or version != _index_version:
+        entries = Branch.objects.filter(
+            status='active', latitude__isnull=False, longitude__isnull=False
+        ).values('id', 'name', 'branch_id', 'address', 'city', 'map_link', 'latitude', 'longitude')
+        _index = BranchSpatialIndex(list(entries))
+        _index_version = version
+    return _index
+
+
+def nearest_branches(lat, lng, k=3):
+    """Return the ``k`` nearest active branches to a point with their distance in km."""
+    return [
+        dict(entry, distance_km=round(distance, 3))
+        for distance, entry in get_index().nearest(lat, lng, k)
+    ]
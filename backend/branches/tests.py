@@ -1,3 +1,62 @@
+import random
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from orders.models import UserAddress
+from orders.routing import haversine_km
+from .models import Branch
+from .spatial import BranchSpatialIndex
+
+User = get_user_model()
+
+
+def osm_link(lat, lng):
+    return f'https://www.openstreetmap.org/?mlat={lat}&mlon={lng}&zoom=16'
+
+
+class BranchSpatialIndexTest(TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        entries = [{'id': i, 'latitude': 26.5 + rng.random() * 3, 'longitude': 80.5 + rng.random() * 7}
+                   for i in range(500)]
+        index = BranchSpatialIndex(entries)
+        # Points inside the grid and well outside its bounds
+        for _ in range(50):
+            point = (25 + rng.random() * 6, 79 + rng.random() * 10)
+            expected = sorted(entries, key=lambda e: haversine_km(point, (e['latitude'], e['longitude'])))[:5]
+            self.assertEqual([e['id'] for _, e in index.nearest(*point, k=5)], [e['id'] for e in expected])
+        self.assertEqual(BranchSpatialIndex([]).nearest(27.7, 85.3), [])
+
+
+class BranchNearestViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', first_name='Test', last_name='User',
+            phone='9841234567'
+        )
+        self.client.force_authenticate(user=self.user)
+        common = {'city': 'Kathmandu', 'address': 'Somewhere', 'phone': '01', 'email': 'b@example.com',
+                  'opening_date': '2023-01-01'}
+        self.patan = Branch.objects.create(name='Patan', map_link=osm_link(27.6713, 85.3240), **common)
+        self.thamel = Branch.objects.create(name='Thamel', map_link=osm_link(27.7150, 85.3123), **common)
+        self.closed = Branch.objects.create(name='Closed', map_link=osm_link(27.7151, 85.3124),
+                                            status='inactive', **common)
+        self.address = UserAddress.objects.create(user=self.user, address='Lazimpat',
+                                                  map_link=osm_link(27.7215, 85.3200))
+
+    def test_returns_nearest_active_branches_for_an_address(self):
+        self.assertEqual((self.address.latitude, self.address.longitude), (27.7215, 85.32))
+        response = self.client.get(reverse('branch-nearest'), {'address': self.address.id, 'k': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([b['name'] for b in response.data['branches']], ['Thamel', 'Patan'])
 
-# Create your tests here.
+        # Moving a branch is picked up by the index straight away
+        self.patan.map_link = osm_link(27.7214, 85.3201)
+        self.patan.save()
+        response = self.client.get(reverse('branch-nearest'), {'lat': 27.7215, 'lng': 85.32, 'k': 1})
+        self.assertEqual([b['name'] for b in response.data['branches']], ['Patan'])
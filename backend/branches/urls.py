@@ -4,13 +4,14 @@ from .views import (
     BranchListView, BranchCreateView, BranchDetailView, BranchUpdateView, BranchDeleteView,
     BranchStatsView, BranchManagerListView, BranchManagerCreateView, BranchManagerDetailView, 
     BranchManagerUpdateView, BranchManagerDeleteView, BranchOverallPerformanceView,
-    BranchPerformanceView, BranchExpenseBreakdownView
+    BranchPerformanceView, BranchExpenseBreakdownView, BranchNearestView
 )
 
 urlpatterns = [
     # Branch URLs
     path('branches/', BranchListView.as_view(), name='branch-list'),
     path('branches/performance/overall/', BranchOverallPerformanceView.as_view(), name='branch-overall-performance'),
+    path('branches/nearest/', BranchNearestView.as_view(), name='branch-nearest'),
     path('branches/create/', BranchCreateView.as_view(), name='branch-create'),
     path('branches/<int:pk>/', BranchDetailView.as_view(), name='branch-detail'),
     path('branches/<int:pk>/stats/', BranchStatsView.as_view(), name='branch-stats'),
@@ -41,6 +41,53 @@ class BranchListView(generics.ListAPIView):
             
         return queryset
 
+class BranchNearestView(generics.GenericAPIView):
+    """View to find the nearest active branches to an address or point.
+
+    Pass ``address`` (a saved UserAddress id; customers may only use their own)
+    or ``lat`` and ``lng``, and optionally ``k`` (default 3, at most 20).
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_RESULTS = 20
+
+    def get(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+        from rest_framework import status
+        from orders.models import UserAddress
+        from .spatial import nearest_branches
+
+        try:
+            k = min(max(int(request.query_params.get('k', 3)), 1), self.MAX_RESULTS)
+        except ValueError:
+            return Response({'error': 'k must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        address_id = request.query_params.get('address')
+        if address_id:
+            addresses = UserAddress.objects.filter(pk=address_id) if str(address_id).isdigit() \
+                else UserAddress.objects.none()
+            if getattr(request.user, 'role', None) not in ('admin', 'branch_manager') and not request.user.is_superuser:
+                addresses = addresses.filter(user=request.user)
+            address = addresses.first()
+            if address is None:
+                return Response({'error': 'Address not found'}, status=status.HTTP_404_NOT_FOUND)
+            if address.latitude is None or address.longitude is None:
+                return Response({'error': 'The address has no map location'}, status=status.HTTP_400_BAD_REQUEST)
+            lat, lng = address.latitude, address.longitude
+        else:
+            try:
+                lat = float(request.query_params['lat'])
+                lng = float(request.query_params['lng'])
+            except (KeyError, ValueError):
+                return Response({'error': 'Pass address, or lat and lng'}, status=status.HTTP_400_BAD_REQUEST)
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                return Response({'error': 'lat/lng out of range'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'origin': {'latitude': lat, 'longitude': lng},
+            'branches': nearest_branches(lat, lng, k),
+        })
+
 class BranchCreateView(generics.CreateAPIView):
     """View to create a new branch - Admin only."""
     queryset = Branch.objects.all()
@@ -0,0 +1,205 @@
+"""Oldest-first allocation of payments to unpaid orders.
+
+The same engine serves both directions: a completed payment is spread over
+the customer's unpaid orders (ProcessPaymentView), and new orders are paid
+from the customer's advance payments (OrderCreateView). The open balances on
+each side are read with one query apiece, the whole plan is computed in
+memory by walking both lists oldest first, and it is written with one
+``bulk_create`` of OrderPayment rows (which adds the amounts to
+Order.amount_paid with one UPDATE) and one ``bulk_update`` of the orders.
+
+bulk_update() sends no signals, so what an order save does when the payment
+status changes is applied here in bulk: the daily income rollups, the stats
+cache and the status stream. The search documents do not include payment
+details and are left alone. The customer wallets are debited by
+OrderPayment's ``bulk_create`` itself.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models
+
+from .models import (
+    ArchivedOrderPayment, BranchDailyStats, CustomerWallet, Order, OrderPayment, applied_amount_subquery,
+    order_rollup,
+)
+
+logger = logging.getLogger(__name__)
+
+UNPAID_STATUSES = ('pending', 'partially_paid')
+
+
+def unpaid_orders(customer_id, branch_id=None):
+    """Lock and return the customer's orders with money still owed, oldest first."""
+    orders = Order.objects.select_for_update().filter(
+        customer_name_id=customer_id,
+        payment_status__in=UNPAID_STATUSES,
+        amount_paid__lt=models.F('total_amount'),
+    )
+    if branch_id:
+        orders = orders.filter(branch_id=branch_id)
+    return orders.order_by('order_date', 'order_id')
+
+
+def open_payments(payments):
+    """Annotate ``payments`` with what they have applied and keep those with money left, oldest first.
+
+    Allocations to archived orders still use up a payment.
+    """
+    return payments.annotate(total_applied=applied_amount_subquery()).filter(
+        total_applied__lt=models.F('total_amount')
+    ).order_by('created_at', 'id')
+
+
+def payment_status_for(order):
+    """Payment status implied by the order's amount_paid."""
+    if order.amount_paid >= order.total_amount:
+        return 'paid'
+    if order.amount_paid > 0:
+        return 'partially_paid'
+    return 'pending'
+
+
+def plan_allocations(payments, orders):
+    """Match payment balances to order balances oldest first.
+
+    ``payments`` carry ``total_applied`` (see open_payments). Returns a list of
+    ``(payment, order, amount)``; nothing is written.
+    """
+    balances = [[payment, payment.total_amount - (payment.total_applied or Decimal('0'))] for payment in payments]
+    balances = [balance for balance in balances if balance[1] > 0]
+    allocations = []
+    position = 0
+    for order in orders:
+        due = order.total_amount - order.amount_paid
+        while due > 0 and position < len(balances):
+            payment, left = balances[position]
+            amount = min(left, due)
+            allocations.append((payment, order, amount))
+            due -= amount
+            balances[position][1] = left - amount
+            if balances[position][1] <= 0:
+                position += 1
+        if position >= len(balances):
+            break
+    return allocations
+
+
+def apply_allocations(allocations, orders=(), esewa_pays_cash_orders=False):
+    """Write a plan from plan_allocations and restate the payment status of the orders involved.
+
+    ``orders`` are restated too even when nothing was allocated to them (new
+    orders start from their amount_paid). With ``esewa_pays_cash_orders``, cash
+    orders that receive money from an eSewa payment become eSewa orders.
+    Returns the orders whose payment status or method changed.
+    """
+    OrderPayment.objects.bulk_create([
+        OrderPayment(order=order, payment=payment, amount_applied=amount)
+        for payment, order, amount in allocations
+    ], batch_size=500)
+
+    # bulk_create() mirrored the paid amounts onto these instances
+    involved = {order.pk: order for order in orders}
+    involved.update((order.pk, order) for _, order, _ in allocations)
+    esewa_paid = {order.pk for payment, order, _ in allocations if payment.payment_type == 'esewa'}
+
+    changed, restated, income = [], [], defaultdict(Decimal)
+    for order in involved.values():
+        before = order_rollup(order.branch_id, order.order_date, order.payment_status, order.total_amount)
+        old_status, old_method = order.payment_status, order.payment_method
+        order.payment_status = payment_status_for(order)
+        if esewa_pays_cash_orders and order.pk in esewa_paid and order.payment_method == 'cash':
+            order.payment_method = 'esewa'
+            logger.info(f"[PAYMENT_ALLOCATION] Order {order.order_id} payment method cash -> esewa")
+        if (old_status, old_method) == (order.payment_status, order.payment_method):
+            continue
+        changed.append(order)
+        if old_status != order.payment_status:
+            restated.append(order)
+            after = order_rollup(order.branch_id, order.order_date, order.payment_status, order.total_amount)
+            if before and after:
+                income[before[:2]] += after[2] - before[2]
+    if not changed:
+        return changed
+
+    Order.objects.bulk_update(changed, ['payment_status', 'payment_method'], batch_size=500)
+    # One row per branch and day the orders were placed on
+    for (branch_id, day), delta in income.items():
+        if delta:
+            BranchDailyStats.record(branch_id, day, 0, delta)
+
+    from .realtime import publish_orders
+    from .stats_cache import invalidate
+    invalidate({order.branch_id for order in involved.values()}, {order.customer_name_id for order in involved.values()})
+    publish_orders(restated, {'payment_status'})
+    return changed
+
+
+def allocate_payment(payment, order_ids=None):
+    """Spread a payment's unapplied balance over its customer's unpaid orders, oldest first.
+
+    The orders are limited to the payment's branch when it has one, and to
+    ``order_ids`` when given. Returns the allocations written.
+    """
+    orders = unpaid_orders(payment.user_id, payment.branch_id)
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+    payments = open_payments(type(payment).objects.filter(pk=payment.pk))
+    allocations = plan_allocations(list(payments), list(orders))
+    apply_allocations(allocations, esewa_pays_cash_orders=True)
+    logger.info(f"[PAYMENT_ALLOCATION] Payment {payment.transaction_uuid} applied to {len(allocations)} orders")
+    return allocations
+
+
+def apply_advance_payments(orders, user):
+    """Pay new orders from the customer's advance payments at each order's branch, oldest first.
+
+    Every order's payment status is restated from what it received. Returns
+    the allocations written.
+    """
+    from payments.models import Payment
+
+    orders = list(orders)
+    if not orders:
+        return []
+    # The wallets say whether there is any credit; only then are the payments holding it read
+    branch_ids = set(CustomerWallet.objects.select_for_update().filter(
+        user=user, branch_id__in={order.branch_id for order in orders}, balance__gt=0
+    ).values_list('branch_id', flat=True))
+    payments = list(open_payments(Payment.objects.select_for_update().filter(
+        user=user, branch_id__in=branch_ids, status='COMPLETE'
+    ))) if branch_ids else []
+    allocations = []
+    for branch_id in dict.fromkeys(order.branch_id for order in orders):
+        allocations.extend(plan_allocations(
+            [payment for payment in payments if payment.branch_id == branch_id],
+            [order for order in orders if order.branch_id == branch_id],
+        ))
+    apply_allocations(allocations, orders)
+    logger.info(f"[ADVANCE_PAYMENT] Applied {len(allocations)} advance payment allocations to "
+                f"{len(orders)} orders for user {user.id}")
+    return allocations
+
+
+def wallet_balances():
+    """Recompute every customer's wallet balance from payment history in one set-based pass.
+
+    Returns ``{(user_id, branch_id): balance}`` for the non-zero balances: the
+    completed payments less what they have been applied to, live or archived.
+    """
+    from payments.models import Payment
+
+    balances = defaultdict(Decimal)
+    credits = Payment.objects.filter(status='COMPLETE').values('user_id', 'branch_id').annotate(
+        total=models.Sum('total_amount')
+    ).order_by()
+    for row in credits:
+        balances[row['user_id'], row['branch_id']] += row['total']
+    for model in (OrderPayment, ArchivedOrderPayment):
+        applied = model.objects.filter(payment__status='COMPLETE').values(
+            'payment__user_id', 'payment__branch_id'
+        ).annotate(total=models.Sum('amount_applied')).order_by()
+        for row in applied:
+            balances[row['payment__user_id'], row['payment__branch_id']] -= row['total']
+    return {key: balance for key, balance in balances.items() if balance}
@@ -0,0 +1,139 @@
+"""Archival of closed orders into the cold ArchivedOrder tables.
+
+An order is archivable once it is closed (cancelled, refunded, or delivered
+and fully paid) and older than the cutoff. Each chunk of orders is copied
+with its items, deliveries and payment allocations into the archive tables,
+its status events are folded into ``ArchivedOrder.status_history``, and the
+live rows are then deleted, all in one transaction.
+
+The live rows are removed with raw DELETEs that send no signals: the spend
+ledger, daily rollups, slot counters and search documents describe history
+that has not changed, so none of them should be decremented.
+"""
+import logging
+
+from django.db import DatabaseError, connection, models, transaction
+
+from .models import (
+    ArchivedDelivery, ArchivedOrder, ArchivedOrderItem, ArchivedOrderPayment, Delivery, Order, OrderItem,
+    OrderPayment, OrderStatusEvent,
+)
+
+from .stats_cache import invalidate
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500
+
+# (live model, archive model) for the rows copied with each order
+CHILD_TABLES = [
+    (OrderItem, ArchivedOrderItem),
+    (Delivery, ArchivedDelivery),
+    (OrderPayment, ArchivedOrderPayment),
+]
+
+
+def archivable_orders(cutoff):
+    """Return the closed orders placed before ``cutoff``."""
+    return Order.objects.filter(order_date__lt=cutoff).filter(
+        models.Q(status__in=('cancelled', 'refunded')) | models.Q(status='delivered', payment_status='paid')
+    )
+
+
+def _copied_fields(archive_model):
+    """Attribute names shared by an archive model and its live model."""
+    return [field.attname for field in archive_model._meta.concrete_fields
+            if field.name not in ('status_history', 'archived_at')]
+
+
+def _status_history(order_ids):
+    history = {}
+    events = OrderStatusEvent.objects.filter(order_id__in=order_ids).order_by('created_at', 'id').values(
+        'id', 'order_id', 'from_status', 'to_status', 'actor_id', 'actor__email', 'note', 'created_at',
+        'time_in_previous_status',
+    )
+    for event in events:
+        spent = event['time_in_previous_status']
+        history.setdefault(event['order_id'], []).append({
+            'id': event['id'],
+            'order': str(event['order_id']),
+            'from_status': event['from_status'],
+            'to_status': event['to_status'],
+            'actor': event['actor_id'],
+            'actor_email': event['actor__email'],
+            'note': event['note'],
+            'created_at': event['created_at'].isoformat(),
+            'time_in_previous_status': spent.total_seconds() if spent is not None else None,
+        })
+    return history
+
+
+def archive_chunk(order_ids):
+    """Move the given orders and their rows into the archive. Returns the number of orders moved."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+    with transaction.atomic():
+        history = _status_history(order_ids)
+        orders = list(Order.objects.filter(pk__in=order_ids).values(*_copied_fields(ArchivedOrder)))
+        archived = ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(status_history=history.get(row['order_id'], []), **row) for row in orders
+        ], batch_size=500)
+        for model, archive_model in CHILD_TABLES:
+            rows = model.objects.filter(order_id__in=order_ids).values(*_copied_fields(archive_model))
+            archive_model.objects.bulk_create([archive_model(**row) for row in rows], batch_size=500)
+
+        # Children first so no foreign key is left dangling; _raw_delete sends no signals
+        for model in (OrderPayment, OrderItem, Delivery, OrderStatusEvent):
+            queryset = model.objects.filter(order_id__in=order_ids)
+            queryset._raw_delete(queryset.db)
+        queryset = Order.objects.filter(pk__in=order_ids)
+        queryset._raw_delete(queryset.db)
+        # Customer stats are computed from the live orders
+        invalidate({row['branch_id'] for row in orders}, {row['customer_name_id'] for row in orders})
+    return len(archived)
+
+
+def archive_orders(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive every archivable order placed before ``cutoff``, ``batch_size`` at a time.
+
+    Returns the number of orders archived.
+    """
+    total = 0
+    while True:
+        order_ids = list(archivable_orders(cutoff).order_by('order_date', 'order_id').values_list(
+            'order_id', flat=True
+        )[:batch_size])
+        if not order_ids:
+            break
+        total += archive_chunk(order_ids)
+        logger.info(f"[ORDER ARCHIVE] Archived {total} orders so far")
+    return total
+
+
+ARCHIVED_TABLES = [Order, OrderItem, Delivery, OrderPayment, OrderStatusEvent]
+
+
+def table_sizes():
+    """Return ``{table: (rows, bytes)}`` for the live order tables.
+
+    bytes counts the pages of the table and its indexes (from SQLite's dbstat
+    table) and is None where dbstat is not available.
+    """
+    tables = [model._meta.db_table for model in ARCHIVED_TABLES]
+    sizes = {}
+    if connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(tables))
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name "
+                    f"WHERE m.tbl_name IN ({placeholders}) GROUP BY m.tbl_name", tables,
+                )
+                sizes = dict(cursor.fetchall())
+        except DatabaseError:
+            sizes = {}
+    return {
+        model._meta.db_table: (model.objects.count(), sizes.get(model._meta.db_table))
+        for model in ARCHIVED_TABLES
+    }
@@ -0,0 +1,155 @@
+"""Rider assignment engine for pickups and drops.
+
+Every open delivery counts towards a RiderLoad row keyed by (rider, day, slot).
+To assign a batch, the engine loads the loads of each (day, slot) once into a
+min-heap and hands every delivery to the rider at the top, so each pick costs
+O(log riders) and no Delivery rows are counted. The new assignments and the
+counter increments are written together in one transaction.
+"""
+import heapq
+import logging
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import Delivery, RiderLoad, OPEN_DELIVERY_STATUSES, delivery_load_key
+from .realtime import publish_deliveries
+from .routing import invalidate_rider_manifests
+
+logger = logging.getLogger(__name__)
+
+
+def eligible_rider_ids():
+    """Return the ids of riders that can take new deliveries.
+
+    Riders are not attached to a branch in this system, so every active rider
+    is eligible for every branch.
+    """
+    User = get_user_model()
+    return list(User.objects.filter(role='rider', is_active=True).order_by('id').values_list('id', flat=True))
+
+
+def _day_and_slot(delivery):
+    """Return the (day, slot) a delivery is scheduled for."""
+    _, day, slot = delivery_load_key(0, 'pending', delivery.delivery_start_time,
+                                     delivery.delivery_date, delivery.delivery_time)
+    return day, slot
+
+
+def assign_deliveries(deliveries, rider_ids=None):
+    """Assign each unassigned open delivery to the least-loaded eligible rider.
+
+    Ties go to the lowest rider id. Returns the deliveries that were assigned.
+    """
+    groups = defaultdict(list)
+    for delivery in deliveries:
+        if delivery.delivery_person_id is None and delivery.status in OPEN_DELIVERY_STATUSES:
+            groups[_day_and_slot(delivery)].append(delivery)
+    if not groups:
+        return []
+
+    if rider_ids is None:
+        rider_ids = eligible_rider_ids()
+    if not rider_ids:
+        logger.warning(f"[RIDER ASSIGN] No active riders to assign {sum(map(len, groups.values()))} deliveries")
+        return []
+
+    assigned = []
+    increments = defaultdict(int)
+    with transaction.atomic():
+        for (day, slot), group in groups.items():
+            # Make sure every eligible rider has a counter row for this day and slot
+            RiderLoad.objects.bulk_create(
+                [RiderLoad(rider_id=rider_id, day=day, slot=slot) for rider_id in rider_ids],
+                ignore_conflicts=True,
+            )
+            heap = list(RiderLoad.objects.select_for_update().filter(
+                day=day, slot=slot, rider_id__in=rider_ids
+            ).values_list('open_deliveries', 'rider_id'))
+            heapq.heapify(heap)
+
+            for delivery in group:
+                load, rider_id = heapq.heappop(heap)
+                delivery.delivery_person_id = rider_id
+                heapq.heappush(heap, (load + 1, rider_id))
+                increments[(rider_id, day, slot)] += 1
+                assigned.append(delivery)
+
+        # bulk_update() sends no signals, so the counters are updated here
+        Delivery.objects.bulk_update(assigned, ['delivery_person'], batch_size=500)
+        for (rider_id, day, slot), count in increments.items():
+            RiderLoad.objects.filter(rider_id=rider_id, day=day, slot=slot).update(
+                open_deliveries=models.F('open_deliveries') + count
+            )
+        invalidate_rider_manifests(*{rider_id for rider_id, _, _ in increments})
+        publish_deliveries(assigned, {'rider'})
+
+    logger.info(f"[RIDER ASSIGN] Assigned {len(assigned)} deliveries across {len(increments)} rider slots")
+    return assigned
+
+
+def pending_deliveries(since=None, branch=None):
+    """Return pending deliveries scheduled on or after ``since`` (default: today)."""
+    since = since or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    deliveries = Delivery.objects.select_related('order').filter(status='pending').filter(
+        models.Q(delivery_start_time__gte=start)
+        | models.Q(delivery_start_time__isnull=True, delivery_date__gte=start)
+    )
+    if branch is not None:
+        deliveries = deliveries.filter(order__branch=branch)
+    return deliveries
+
+
+def rebalance_deliveries(deliveries):
+    """Re-spread pending deliveries evenly across the eligible riders.
+
+    The deliveries are taken off their current riders' loads and assigned
+    again from scratch; deliveries already in progress are never moved.
+    Returns ``(rebalanced, moved)`` counts.
+    """
+    deliveries = [delivery for delivery in deliveries if delivery.status == 'pending']
+    rider_ids = eligible_rider_ids()
+    if not deliveries or not rider_ids:
+        return 0, 0
+
+    with transaction.atomic():
+        previous = {}
+        decrements = defaultdict(int)
+        for delivery in deliveries:
+            previous[delivery.pk] = delivery.delivery_person_id
+            key = delivery.load_key()
+            if key:
+                decrements[key] += 1
+            delivery.delivery_person_id = None
+        for (rider_id, day, slot), count in decrements.items():
+            RiderLoad.objects.filter(rider_id=rider_id, day=day, slot=slot).update(
+                open_deliveries=models.F('open_deliveries') - count
+            )
+        assigned = assign_deliveries(deliveries, rider_ids=rider_ids)
+        invalidate_rider_manifests(*previous.values())
+
+    moved = sum(1 for delivery in assigned if previous[delivery.pk] != delivery.delivery_person_id)
+    logger.info(f"[RIDER ASSIGN] Rebalanced {len(assigned)} pending deliveries, {moved} changed rider")
+    return len(assigned), moved
+
+
+def rebuild_rider_loads():
+    """Recompute every RiderLoad row from the open deliveries. Returns the row count."""
+    counts = defaultdict(int)
+    rows = Delivery.objects.filter(
+        delivery_person__isnull=False, status__in=OPEN_DELIVERY_STATUSES
+    ).values_list('delivery_person_id', 'status', 'delivery_start_time', 'delivery_date', 'delivery_time')
+    for row in rows.iterator():
+        counts[delivery_load_key(*row)] += 1
+
+    with transaction.atomic():
+        RiderLoad.objects.all().delete()
+        created = RiderLoad.objects.bulk_create([
+            RiderLoad(rider_id=rider_id, day=day, slot=slot, open_deliveries=count)
+            for (rider_id, day, slot), count in counts.items()
+        ], batch_size=500)
+    return len(created)
@@ -0,0 +1,24 @@
+"""System checks for settings the order, pricing and payment caches depend on."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when production would keep cache versions, locks and breakers per process."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PER_PROCESS_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is not shared between worker processes.',
+        hint='Set CACHE_URL to a shared backend such as redis://127.0.0.1:6379/1. Until then each worker '
+             'keeps its own stats cache versions, pricing matrix version, branch index version, rider '
+             'manifest versions and eSewa circuit breaker, and may serve stale data after another '
+             "worker's write.",
+        id='orders.W001',
+    )]
@@ -0,0 +1,111 @@
+"""Streaming order exports (CSV and NDJSON).
+
+Orders are read with a ``values()`` projection through ``.iterator()`` and
+handled in batches of EXPORT_BATCH_SIZE: each batch fetches its items and
+payment allocations with one query apiece, is written out, and is dropped
+before the next one is read. Memory therefore stays flat however many orders
+are exported, and the CSV header is yielded before any query runs.
+"""
+import csv
+import json
+from decimal import Decimal
+
+from .models import OrderItem, OrderPayment
+
+EXPORT_BATCH_SIZE = 2000
+
+ORDER_FIELDS = [
+    'order_id', 'order_date', 'branch_id', 'branch__name', 'customer_name_id', 'customer_name__email',
+    'customer_name__first_name', 'customer_name__last_name', 'customer_name__phone', 'status',
+    'payment_method', 'payment_status', 'total_amount', 'discount', 'amount_paid', 'is_urgent',
+    'pickup_enabled', 'delivery_enabled', 'pickup_date', 'pickup_time', 'delivery_date', 'delivery_time',
+    'description',
+]
+ITEM_FIELDS = ['service_type', 'wash_type', 'material', 'quantity', 'pricing_type', 'price_per_unit', 'total_price']
+ALLOCATION_FIELDS = ['payment_id', 'payment__transaction_uuid', 'payment__payment_type', 'amount_applied', 'created_at']
+
+CSV_COLUMNS = [
+    'order_id', 'order_date', 'branch_id', 'branch', 'customer_id', 'customer_email', 'customer_name',
+    'customer_phone', 'status', 'payment_method', 'payment_status', 'total_amount', 'discount', 'amount_paid',
+    'is_urgent', 'pickup_enabled', 'delivery_enabled', 'pickup_date', 'pickup_time', 'delivery_date',
+    'delivery_time', 'description', 'items', 'payments',
+]
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    """Convert a value to something json and csv write losslessly."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_batches(orders):
+    """Yield lists of ``(order, items, allocations)`` for the orders queryset."""
+    batch = []
+    rows = orders.values(*ORDER_FIELDS).order_by('order_date', 'order_id')
+    for row in rows.iterator(chunk_size=EXPORT_BATCH_SIZE):
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield _with_children(batch)
+            batch = []
+    if batch:
+        yield _with_children(batch)
+
+
+def _with_children(batch):
+    order_ids = [row['order_id'] for row in batch]
+    items, allocations = {}, {}
+    for item in OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values('order_id', *ITEM_FIELDS):
+        items.setdefault(item.pop('order_id'), []).append(item)
+    for allocation in OrderPayment.objects.filter(order_id__in=order_ids).order_by('id').values(
+        'order_id', *ALLOCATION_FIELDS
+    ):
+        allocations.setdefault(allocation.pop('order_id'), []).append(allocation)
+    return [(row, items.get(row['order_id'], []), allocations.get(row['order_id'], [])) for row in batch]
+
+
+def stream_csv(orders):
+    """Yield CSV lines: one row per order, items and payments summarised in a cell each."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for batch in export_batches(orders):
+        lines = []
+        for row, items, allocations in batch:
+            lines.append(writer.writerow([
+                row['order_id'], _plain(row['order_date']), row['branch_id'], row['branch__name'],
+                row['customer_name_id'], row['customer_name__email'],
+                f"{row['customer_name__first_name']} {row['customer_name__last_name']}".strip(),
+                row['customer_name__phone'], row['status'], row['payment_method'], row['payment_status'],
+                _plain(row['total_amount']), _plain(row['discount']), _plain(row['amount_paid']),
+                row['is_urgent'], row['pickup_enabled'], row['delivery_enabled'],
+                _plain(row['pickup_date']), row['pickup_time'], _plain(row['delivery_date']), row['delivery_time'],
+                row['description'],
+                '; '.join(f"{i['service_type']} ({i['material']}) x{i['quantity']} = {i['total_price']}" for i in items),
+                '; '.join(f"{a['payment__transaction_uuid']}: {a['amount_applied']}" for a in allocations),
+            ]))
+        yield ''.join(lines)
+
+
+def stream_ndjson(orders):
+    """Yield one JSON object per line per order, with nested items and payments."""
+    for batch in export_batches(orders):
+        lines = []
+        for row, items, allocations in batch:
+            record = {key: _plain(value) for key, value in row.items()}
+            record['order_id'] = str(row['order_id'])
+            record['items'] = [{key: _plain(value) for key, value in item.items()} for item in items]
+            record['payments'] = [
+                {key.replace('payment__', ''): _plain(value) for key, value in allocation.items()}
+                for allocation in allocations
+            ]
+            lines.append(json.dumps(record) + '\n')
+        yield ''.join(lines)
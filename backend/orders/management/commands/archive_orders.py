@@ -0,0 +1,69 @@
+"""
+Management command to move closed orders into the archive tables.
+Cancelled and refunded orders, and delivered orders that are fully paid, are archived
+once they are older than ORDER_ARCHIVE_AFTER_DAYS (or --older-than-days).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from orders.archive import ARCHIVE_BATCH_SIZE, archivable_orders, archive_orders, table_sizes
+
+
+def _format_bytes(size):
+    if size is None:
+        return 'n/a'
+    return f'{size / 1024:.1f} KiB'
+
+
+class Command(BaseCommand):
+    help = 'Move closed orders older than the configured age into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 180),
+            help='Archive closed orders placed more than this many days ago',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help='Number of orders to move per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many orders would be archived without moving them',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0 or options['batch_size'] <= 0:
+            raise CommandError('--older-than-days must be >= 0 and --batch-size must be > 0')
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        before = table_sizes()
+        if options['dry_run']:
+            archived = archivable_orders(cutoff).count()
+            after = before
+        else:
+            archived = archive_orders(cutoff, batch_size=options['batch_size'])
+            after = table_sizes()
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No orders were moved'))
+            self.stdout.write(f'Orders to archive (placed before {cutoff:%Y-%m-%d}): {archived}')
+        else:
+            self.stdout.write(self.style.SUCCESS('ARCHIVE COMPLETE'))
+            self.stdout.write(f'Orders archived (placed before {cutoff:%Y-%m-%d}): {archived}')
+        for table, (rows, size) in before.items():
+            rows_after, size_after = after[table]
+            self.stdout.write(
+                f'{table}: {rows} -> {rows_after} rows, {_format_bytes(size)} -> {_format_bytes(size_after)}'
+            )
+        self.stdout.write('='*60)
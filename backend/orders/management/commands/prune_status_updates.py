@@ -0,0 +1,49 @@
+"""
+Management command to delete old rows of the status stream table.
+Streams only read updates newer than a client's Last-Event-ID, so rows older than
+the longest expected reconnect gap can go; run this from cron.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from orders.models import StatusUpdate
+from orders.realtime import prune_updates
+
+
+class Command(BaseCommand):
+    help = 'Delete status stream updates older than the given number of hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Keep updates from the last this many hours',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many updates would be deleted without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        if options['hours'] < 0:
+            raise CommandError('--hours must be >= 0')
+        before = timezone.now() - timedelta(hours=options['hours'])
+
+        if options['dry_run']:
+            deleted = StatusUpdate.objects.filter(created_at__lt=before).count()
+        else:
+            deleted = prune_updates(before)
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No updates were deleted'))
+            self.stdout.write(f'Updates to delete: {deleted}')
+        else:
+            self.stdout.write(self.style.SUCCESS('PRUNE COMPLETE'))
+            self.stdout.write(f'Updates deleted: {deleted}')
+        self.stdout.write('='*60)
@@ -0,0 +1,54 @@
+"""
+Management command to spread pending deliveries evenly across active riders.
+Optionally rebuilds the per-rider load counters from the deliveries first.
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.assignment import pending_deliveries, rebalance_deliveries, rebuild_rider_loads
+
+
+class Command(BaseCommand):
+    help = 'Rebalance pending deliveries across riders and optionally rebuild the rider load counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only move deliveries scheduled on or after this date (YYYY-MM-DD); default today',
+        )
+        parser.add_argument(
+            '--rebuild-loads',
+            action='store_true',
+            help='Recompute the rider load counters from open deliveries before rebalancing',
+        )
+        parser.add_argument(
+            '--skip-rebalance',
+            action='store_true',
+            help='Only rebuild the counters (with --rebuild-loads); do not move any deliveries',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError as exc:
+                raise CommandError('--since must be a date in YYYY-MM-DD format') from exc
+
+        load_rows = None
+        if options['rebuild_loads']:
+            load_rows = rebuild_rider_loads()
+
+        rebalanced = moved = 0
+        if not options['skip_rebalance']:
+            rebalanced, moved = rebalance_deliveries(pending_deliveries(since=since))
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('REBALANCE COMPLETE'))
+        if load_rows is not None:
+            self.stdout.write(f'Rider load rows rebuilt: {load_rows}')
+        self.stdout.write(f'Pending deliveries rebalanced: {rebalanced}')
+        self.stdout.write(f'Deliveries moved to another rider: {moved}')
+        self.stdout.write('='*60)
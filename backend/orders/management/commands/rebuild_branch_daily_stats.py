@@ -0,0 +1,80 @@
+"""
+Management command to backfill or rebuild the daily branch rollups behind OrderStatsView.
+The rollups are maintained incrementally; this command recomputes them from orders.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models.functions import TruncDate
+from orders.models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, BranchDailyStats, BranchDailyServiceStats,
+)
+from orders.stats_cache import invalidate_all
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the daily branch order/income/service rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only rebuild days on or after this date (YYYY-MM-DD); default rebuilds everything',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError as exc:
+                raise CommandError('--since must be a date in YYYY-MM-DD format') from exc
+
+        daily_rows = BranchDailyStats.objects.all()
+        service_rows = BranchDailyServiceStats.objects.all()
+        if since:
+            daily_rows = daily_rows.filter(day__gte=since)
+            service_rows = service_rows.filter(day__gte=since)
+
+        # Archived orders were counted while they were live, so they count here too
+        daily, services = defaultdict(lambda: [0, 0]), defaultdict(int)
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            orders = order_model.objects.annotate(day=TruncDate('order_date'))
+            items = item_model.objects.annotate(day=TruncDate('order__order_date'))
+            if since:
+                orders = orders.filter(day__gte=since)
+                items = items.filter(day__gte=since)
+            for row in orders.values('branch_id', 'day').annotate(
+                orders_count=models.Count('pk'),
+                paid_income=models.Sum('total_amount', filter=models.Q(payment_status='paid'), default=0),
+            ).order_by().iterator():
+                totals = daily[(row['branch_id'], row['day'])]
+                totals[0] += row['orders_count']
+                totals[1] += row['paid_income']
+            for row in items.values('order__branch_id', 'day', 'service_type').annotate(
+                items_count=models.Count('pk')
+            ).order_by().iterator():
+                services[(row['order__branch_id'], row['day'], row['service_type'])] += row['items_count']
+
+        with transaction.atomic():
+            daily_rows.delete()
+            service_rows.delete()
+            created_daily = BranchDailyStats.objects.bulk_create([
+                BranchDailyStats(branch_id=branch_id, day=day, orders_count=count, paid_income=income)
+                for (branch_id, day), (count, income) in daily.items()
+            ], batch_size=500)
+            created_services = BranchDailyServiceStats.objects.bulk_create([
+                BranchDailyServiceStats(branch_id=branch_id, day=day, service_type=service_type, items_count=count)
+                for (branch_id, day, service_type), count in services.items()
+            ], batch_size=500)
+        # Cached OrderStatsView responses were built from the old rows
+        invalidate_all()
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('REBUILD COMPLETE'))
+        self.stdout.write(f'Branch-day rows: {len(created_daily)}')
+        self.stdout.write(f'Branch-day-service rows: {len(created_services)}')
+        self.stdout.write('='*60)
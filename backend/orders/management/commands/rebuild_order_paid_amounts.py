@@ -0,0 +1,62 @@
+"""
+Management command to verify and rebuild Order.amount_paid from OrderPayment rows.
+amount_paid is maintained incrementally; this command detects and repairs any drift.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Verify Order.amount_paid against OrderPayment totals and rebuild mismatched rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report mismatched orders without updating them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of orders updated per bulk_update call',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        # One pass: compare the stored column with the sum of applied payments
+        mismatched = Order.objects.annotate(
+            applied=Coalesce(
+                models.Sum('order_payments__amount_applied'),
+                models.Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        ).exclude(amount_paid=models.F('applied')).values_list('order_id', 'amount_paid', 'applied')
+
+        checked_count = Order.objects.count()
+        fixes = []
+        for order_id, stored, applied in mismatched.iterator(chunk_size=batch_size):
+            self.stdout.write(
+                self.style.WARNING(f'Order {order_id}: stored Rs.{stored}, payments total Rs.{applied}')
+            )
+            fixes.append(Order(order_id=order_id, amount_paid=applied))
+
+        if fixes and not dry_run:
+            with transaction.atomic():
+                Order.objects.bulk_update(fixes, ['amount_paid'], batch_size=batch_size)
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('VERIFY COMPLETE'))
+            self.stdout.write(f'Would rebuild: {len(fixes)} orders')
+        else:
+            self.stdout.write(self.style.SUCCESS('REBUILD COMPLETE'))
+            self.stdout.write(f'Rebuilt: {len(fixes)} orders')
+        self.stdout.write(f'Checked: {checked_count} orders')
+        self.stdout.write('='*60)
@@ -0,0 +1,31 @@
+"""
+Management command to rebuild the full-text search index of orders, customers and payments.
+The index is kept in sync on writes; run this after bulk imports or raw SQL changes.
+"""
+
+from django.core.management.base import BaseCommand
+from orders.search import rebuild_index, fts_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search documents (and the SQLite FTS5 index) for orders, customers and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of records to index per batch',
+        )
+
+    def handle(self, *args, **options):
+        counts = rebuild_index(batch_size=options['batch_size'])
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.SUCCESS('REBUILD COMPLETE'))
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind.capitalize()} documents: {count}')
+        if not fts_available():
+            self.stdout.write('FTS5 is not available on this database; searches use icontains')
+        self.stdout.write('='*60)
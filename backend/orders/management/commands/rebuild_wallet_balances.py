@@ -0,0 +1,68 @@
+"""
+Management command to verify and rebuild CustomerWallet balances from payment history.
+Balances are maintained incrementally; this command recomputes them in one
+set-based pass and repairs any drift.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.allocation import wallet_balances
+from orders.models import CustomerWallet
+
+
+class Command(BaseCommand):
+    help = 'Verify CustomerWallet balances against payment history and rebuild mismatched rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report mismatched wallets without updating them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of wallets written per bulk call',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            expected = wallet_balances()
+            stored = {(wallet.user_id, wallet.branch_id): wallet
+                      for wallet in CustomerWallet.objects.select_for_update()}
+
+            fixes, missing = [], []
+            for key in expected.keys() | stored.keys():
+                balance = expected.get(key, 0)
+                wallet = stored.get(key)
+                if wallet is not None and wallet.balance == balance:
+                    continue
+                user_id, branch_id = key
+                self.stdout.write(self.style.WARNING(
+                    f'Wallet of user {user_id} at branch {branch_id}: '
+                    f'stored Rs.{wallet.balance if wallet else 0}, payments give Rs.{balance}'
+                ))
+                if wallet is None:
+                    missing.append(CustomerWallet(user_id=user_id, branch_id=branch_id, balance=balance))
+                else:
+                    wallet.balance = balance
+                    fixes.append(wallet)
+
+            if not dry_run:
+                CustomerWallet.objects.bulk_update(fixes, ['balance'], batch_size=batch_size)
+                CustomerWallet.objects.bulk_create(missing, batch_size=batch_size)
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('VERIFY COMPLETE'))
+            self.stdout.write(f'Would rebuild: {len(fixes) + len(missing)} wallets')
+        else:
+            self.stdout.write(self.style.SUCCESS('REBUILD COMPLETE'))
+            self.stdout.write(f'Rebuilt: {len(fixes) + len(missing)} wallets')
+        self.stdout.write(f'Checked: {len(expected.keys() | stored.keys())} wallets')
+        self.stdout.write('='*60)
@@ -0,0 +1,74 @@
+"""
+Management command to rebuild the reserved counts of the time slot capacity counters.
+Counts are recomputed from the non-cancelled deliveries; configured capacities are kept.
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from orders.models import Delivery, SlotCapacity, delivery_slot_key
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the reserved counts of the per-branch, per-day time slot capacity counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only reconcile days on or after this date (YYYY-MM-DD); default reconciles everything',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be changed without saving',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError as exc:
+                raise CommandError('--since must be a date in YYYY-MM-DD format') from exc
+
+        counts = {}
+        rows = Delivery.objects.exclude(status='cancelled').values_list(
+            'order__branch_id', 'status', 'delivery_start_time', 'delivery_date', 'delivery_time'
+        )
+        for row in rows.iterator():
+            key = delivery_slot_key(*row)
+            if key and (since is None or key[1] >= since):
+                counts[key] = counts.get(key, 0) + 1
+
+        counters = SlotCapacity.objects.all()
+        if since:
+            counters = counters.filter(day__gte=since)
+
+        changed = []
+        for counter in counters.iterator():
+            expected = counts.pop((counter.branch_id, counter.day, counter.slot), 0)
+            if counter.reserved != expected:
+                if options['dry_run']:
+                    self.stdout.write(f'  {counter}: reserved {counter.reserved} -> {expected}')
+                counter.reserved = expected
+                changed.append(counter)
+        missing = [
+            SlotCapacity(branch_id=branch_id, day=day, slot=slot, reserved=count)
+            for (branch_id, day, slot), count in counts.items()
+        ]
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                SlotCapacity.objects.bulk_update(changed, ['reserved'], batch_size=500)
+                SlotCapacity.objects.bulk_create(missing, batch_size=500)
+
+        # Summary
+        self.stdout.write('\n' + '='*60)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No changes were saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('RECONCILE COMPLETE'))
+        self.stdout.write(f'Counters corrected: {len(changed)}')
+        self.stdout.write(f'Counters created: {len(missing)}')
+        self.stdout.write('='*60)
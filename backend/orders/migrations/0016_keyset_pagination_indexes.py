@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0015_orderitem_wash_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_date', 'id'], name='orders_deli_deliver_6232cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_person', 'delivery_date', 'id'], name='orders_deli_deliver_b96339_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'order_id'], name='orders_orde_order_d_7e5820_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_name', 'order_date', 'order_id'], name='orders_orde_custome_cb966d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'order_date', 'order_id'], name='orders_orde_branch__a30373_idx'),
+        ),
+    ]
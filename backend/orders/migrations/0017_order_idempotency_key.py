@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0016_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client key that prevents the same order being created twice', max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('customer_name', 'idempotency_key'), name='unique_order_customer_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_paid(apps, schema_editor):
+    """Set amount_paid from the existing OrderPayment rows."""
+    Order = apps.get_model('orders', 'Order')
+    OrderPayment = apps.get_model('orders', 'OrderPayment')
+    paid = OrderPayment.objects.filter(order=models.OuterRef('pk')).order_by().values('order').annotate(
+        total=models.Sum('amount_applied')
+    ).values('total')
+    Order.objects.update(amount_paid=Coalesce(
+        models.Subquery(paid), models.Value(0), output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0017_order_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Total amount applied to this order by payments', max_digits=10),
+        ),
+        migrations.RunPython(backfill_amount_paid, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_name', 'payment_status', 'order_date'], name='orders_orde_custome_eaad5f_idx'),
+        ),
+    ]
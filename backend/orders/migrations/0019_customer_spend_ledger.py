@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+COUNTED_ORDER_STATUSES = ('delivered', 'completed', 'paid')
+
+
+def backfill_spend_ledger(apps, schema_editor):
+    """Build the monthly and lifetime spend ledger from existing counted orders."""
+    Order = apps.get_model('orders', 'Order')
+    CustomerSpend = apps.get_model('orders', 'CustomerSpend')
+    CustomerLifetimeSpend = apps.get_model('orders', 'CustomerLifetimeSpend')
+
+    monthly = Order.objects.filter(status__in=COUNTED_ORDER_STATUSES).annotate(
+        month=TruncMonth('order_date')
+    ).values('customer_name_id', 'month').annotate(
+        order_count=models.Count('pk'), total_spent=models.Sum('total_amount')
+    ).order_by()
+
+    rows, lifetime = [], {}
+    for entry in monthly:
+        rows.append(CustomerSpend(
+            user_id=entry['customer_name_id'], month=entry['month'].date(),
+            order_count=entry['order_count'], total_spent=entry['total_spent'],
+        ))
+        count, total = lifetime.get(entry['customer_name_id'], (0, 0))
+        lifetime[entry['customer_name_id']] = (count + entry['order_count'], total + entry['total_spent'])
+
+    CustomerSpend.objects.bulk_create(rows, batch_size=500)
+    CustomerLifetimeSpend.objects.bulk_create([
+        CustomerLifetimeSpend(user_id=user_id, order_count=count, total_spent=total)
+        for user_id, (count, total) in lifetime.items()
+    ], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0018_order_amount_paid'),
+        ('users', '0009_update_admin_staff_flags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerLifetimeSpend',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lifetime_spend', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'month'), name='unique_customer_spend_month')],
+            },
+        ),
+        migrations.RunPython(backfill_spend_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_branch_daily_stats(apps, schema_editor):
+    """Build the daily branch rollups from existing orders and order items."""
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    BranchDailyStats = apps.get_model('orders', 'BranchDailyStats')
+    BranchDailyServiceStats = apps.get_model('orders', 'BranchDailyServiceStats')
+
+    daily = Order.objects.annotate(day=TruncDate('order_date')).values('branch_id', 'day').annotate(
+        orders_count=models.Count('pk'),
+        paid_income=models.Sum('total_amount', filter=models.Q(payment_status='paid'), default=0),
+    ).order_by()
+    BranchDailyStats.objects.bulk_create([BranchDailyStats(**row) for row in daily], batch_size=500)
+
+    services = OrderItem.objects.annotate(day=TruncDate('order__order_date')).values(
+        'order__branch_id', 'day', 'service_type'
+    ).annotate(items_count=models.Count('pk')).order_by()
+    BranchDailyServiceStats.objects.bulk_create([
+        BranchDailyServiceStats(branch_id=row['order__branch_id'], day=row['day'],
+                                service_type=row['service_type'], items_count=row['items_count'])
+        for row in services
+    ], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0019_customer_spend_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchDailyServiceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('service_type', models.CharField(max_length=100)),
+                ('items_count', models.IntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_service_stats', to='branches.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='orders_bran_day_f1d496_idx')],
+                'constraints': [models.UniqueConstraint(fields=('branch', 'day', 'service_type'), name='unique_branch_daily_service_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BranchDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders_count', models.IntegerField(default=0)),
+                ('paid_income', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='branches.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='orders_bran_day_30ce8c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('branch', 'day'), name='unique_branch_daily_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_branch_daily_stats, migrations.RunPython.noop),
+    ]
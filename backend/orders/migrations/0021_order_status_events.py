@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_initial_status_events(apps, schema_editor):
+    """Open a timeline for every existing order at its current status."""
+    Order = apps.get_model('orders', 'Order')
+    OrderStatusEvent = apps.get_model('orders', 'OrderStatusEvent')
+
+    batch = []
+    for order in Order.objects.values('pk', 'customer_name_id', 'branch_id', 'status', 'order_date').iterator():
+        batch.append(OrderStatusEvent(
+            order_id=order['pk'], customer_id=order['customer_name_id'], branch_id=order['branch_id'],
+            from_status='', to_status=order['status'], created_at=order['order_date'],
+        ))
+        if len(batch) >= 500:
+            OrderStatusEvent.objects.bulk_create(batch)
+            batch = []
+    OrderStatusEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0020_branch_daily_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, default='', max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('note', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_in_previous_status', models.DurationField(blank=True, null=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_status_changes', to=settings.AUTH_USER_MODEL)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_status_events', to='branches.branch')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_status_events', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='orders.order')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['created_at', 'id'], name='orders_orde_created_1a352a_idx'), models.Index(fields=['branch', 'created_at', 'id'], name='orders_orde_branch__07966f_idx'), models.Index(fields=['customer', 'created_at', 'id'], name='orders_orde_custome_3709a9_idx'), models.Index(fields=['order', 'created_at'], name='orders_orde_order_i_1e3f4d_idx'), models.Index(fields=['from_status', 'created_at'], name='orders_orde_from_st_31e312_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_initial_status_events, migrations.RunPython.noop),
+    ]
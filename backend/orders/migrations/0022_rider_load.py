@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_rider_loads(apps, schema_editor):
+    """Count open assigned deliveries per rider, scheduled day and slot."""
+    Delivery = apps.get_model('orders', 'Delivery')
+    RiderLoad = apps.get_model('orders', 'RiderLoad')
+
+    counts = {}
+    rows = Delivery.objects.filter(
+        delivery_person__isnull=False, status__in=('pending', 'in_progress')
+    ).values_list('delivery_person_id', 'delivery_start_time', 'delivery_date', 'delivery_time')
+    for rider_id, start_time, created_at, slot in rows.iterator():
+        moment = start_time or created_at
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment)
+        key = (rider_id, moment.date(), slot or '')
+        counts[key] = counts.get(key, 0) + 1
+    RiderLoad.objects.bulk_create([
+        RiderLoad(rider_id=rider_id, day=day, slot=slot, open_deliveries=count)
+        for (rider_id, day, slot), count in counts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0021_order_status_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiderLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slot', models.CharField(choices=[('early_morning', 'Early Morning (6am - 9am)'), ('late_morning', 'Late Morning (9am - 12pm)'), ('early_afternoon', 'Early Afternoon (12pm - 3pm)'), ('late_afternoon', 'Late Afternoon (3pm - 6pm)')], max_length=20)),
+                ('open_deliveries', models.IntegerField(default=0)),
+                ('rider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_loads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'slot', 'open_deliveries', 'rider'], name='orders_ride_day_b71018_idx')],
+                'constraints': [models.UniqueConstraint(fields=('rider', 'day', 'slot'), name='unique_rider_load')],
+            },
+        ),
+        migrations.RunPython(backfill_rider_loads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:12
+
+import django.db.models.deletion
+import orders.models
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_slot_capacity(apps, schema_editor):
+    """Count the non-cancelled deliveries per branch, scheduled day and slot."""
+    Delivery = apps.get_model('orders', 'Delivery')
+    SlotCapacity = apps.get_model('orders', 'SlotCapacity')
+
+    counts = {}
+    rows = Delivery.objects.exclude(status='cancelled').values_list(
+        'order__branch_id', 'delivery_start_time', 'delivery_date', 'delivery_time'
+    )
+    for branch_id, start_time, created_at, slot in rows.iterator():
+        if not slot:
+            continue
+        moment = start_time or created_at
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment)
+        key = (branch_id, moment.date(), slot)
+        counts[key] = counts.get(key, 0) + 1
+    SlotCapacity.objects.bulk_create([
+        SlotCapacity(branch_id=branch_id, day=day, slot=slot, reserved=count)
+        for (branch_id, day, slot), count in counts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0005_alter_branchmanager_id_type_and_more'),
+        ('orders', '0022_rider_load'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slot', models.CharField(choices=[('early_morning', 'Early Morning (6am - 9am)'), ('late_morning', 'Late Morning (9am - 12pm)'), ('early_afternoon', 'Early Afternoon (12pm - 3pm)'), ('late_afternoon', 'Late Afternoon (3pm - 6pm)')], max_length=20)),
+                ('capacity', models.IntegerField(default=orders.models.default_slot_capacity)),
+                ('reserved', models.IntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_capacities', to='branches.branch')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('branch', 'day', 'slot'), name='unique_branch_slot_capacity')],
+            },
+        ),
+        migrations.RunPython(backfill_slot_capacity, migrations.RunPython.noop),
+    ]
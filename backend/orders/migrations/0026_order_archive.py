@@ -0,0 +1,107 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0006_branch_coordinates'),
+        ('orders', '0025_search_index'),
+        ('payments', '0010_payment_user_created_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('order_id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('pickup_requested', models.BooleanField(default=False)),
+                ('order_date', models.DateTimeField()),
+                ('pickup_enabled', models.BooleanField(default=False)),
+                ('delivery_enabled', models.BooleanField(default=False)),
+                ('pickup_date', models.DateTimeField(blank=True, null=True)),
+                ('pickup_time', models.CharField(blank=True, max_length=20, null=True)),
+                ('delivery_date', models.DateTimeField(blank=True, null=True)),
+                ('delivery_time', models.CharField(blank=True, max_length=20, null=True)),
+                ('status', models.CharField(max_length=20)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('is_urgent', models.BooleanField(default=False)),
+                ('payment_method', models.CharField(max_length=20)),
+                ('payment_status', models.CharField(max_length=20)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('idempotency_key', models.CharField(blank=True, max_length=100, null=True)),
+                ('status_history', models.JSONField(blank=True, default=list)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='branches.branch')),
+                ('customer_name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_address', models.CharField(max_length=255)),
+                ('map_link', models.URLField(blank=True, null=True)),
+                ('delivery_contact', models.CharField(max_length=15)),
+                ('delivery_type', models.CharField(default='pickup', max_length=7)),
+                ('delivery_date', models.DateTimeField()),
+                ('delivery_vehicle', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(max_length=20)),
+                ('delivery_start_time', models.DateTimeField(blank=True, null=True)),
+                ('delivery_end_time', models.DateTimeField(blank=True, null=True)),
+                ('delivery_time', models.CharField(default='late_afternoon', max_length=20)),
+                ('delivery_person', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_deliveries', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='orders.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(max_length=100)),
+                ('wash_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('material', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('pricing_type', models.CharField(default='individual', max_length=20)),
+                ('price_per_unit', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='orders.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_applied', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_payments', to='orders.archivedorder')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_order_payments', to='payments.payment')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['order_date', 'order_id'], name='orders_arch_order_d_73924b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['customer_name', 'order_date', 'order_id'], name='orders_arch_custome_f99e1a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['branch', 'order_date', 'order_id'], name='orders_arch_branch__a1ce33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorderpayment',
+            index=models.Index(fields=['payment'], name='orders_arch_payment_58772f_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0006_branch_coordinates'),
+        ('orders', '0026_order_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('delivery', 'Delivery'), ('payment', 'Payment')], max_length=10)),
+                ('object_id', models.CharField(max_length=64)),
+                ('order_id', models.UUIDField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='status_updates', to='branches.branch')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_updates', to=settings.AUTH_USER_MODEL)),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rider_status_updates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'id'], name='orders_stat_custome_0deb26_idx'), models.Index(fields=['branch', 'id'], name='orders_stat_branch__e5b2ec_idx'), models.Index(fields=['rider', 'id'], name='orders_stat_rider_i_4c0ca8_idx'), models.Index(fields=['created_at'], name='orders_stat_created_bcb3e8_idx')],
+            },
+        ),
+    ]
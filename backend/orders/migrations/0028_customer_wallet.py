@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_customer_wallets(apps, schema_editor):
+    """Credit each wallet with its completed payments less what they have paid for."""
+    Payment = apps.get_model('payments', 'Payment')
+    CustomerWallet = apps.get_model('orders', 'CustomerWallet')
+
+    balances = {}
+    credits = Payment.objects.filter(status='COMPLETE').values('user_id', 'branch_id').annotate(
+        total=models.Sum('total_amount')
+    ).order_by()
+    for row in credits:
+        balances[row['user_id'], row['branch_id']] = row['total']
+    for model_name in ('OrderPayment', 'ArchivedOrderPayment'):
+        applied = apps.get_model('orders', model_name).objects.filter(payment__status='COMPLETE').values(
+            'payment__user_id', 'payment__branch_id'
+        ).annotate(total=models.Sum('amount_applied')).order_by()
+        for row in applied:
+            key = (row['payment__user_id'], row['payment__branch_id'])
+            balances[key] = balances.get(key, 0) - row['total']
+    CustomerWallet.objects.bulk_create([
+        CustomerWallet(user_id=user_id, branch_id=branch_id, balance=balance)
+        for (user_id, branch_id), balance in balances.items() if balance
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0006_branch_coordinates'),
+        ('orders', '0027_status_updates'),
+        ('payments', '0012_payment_callback'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerWallet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='wallets', to='branches.branch')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'branch'), name='unique_customer_wallet'), models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('user',), name='unique_customer_wallet_without_branch')],
+            },
+        ),
+        migrations.RunPython(backfill_customer_wallets, migrations.RunPython.noop),
+    ]
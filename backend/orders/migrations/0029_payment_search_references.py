@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:12
+
+from django.db import migrations
+
+
+def reindex_payment_references(apps, schema_editor):
+    """Cut the payment documents down to their references (the FTS triggers follow the updates)."""
+    Payment = apps.get_model('payments', 'Payment')
+    SearchDocument = apps.get_model('orders', 'SearchDocument')
+
+    documents = SearchDocument.objects.filter(kind='payment').only('id', 'object_id', 'body')
+    for start in range(0, documents.count(), 1000):
+        batch = list(documents.order_by('id')[start:start + 1000])
+        references = {
+            str(pk): ' '.join(part for part in parts if part)
+            for pk, *parts in Payment.objects.filter(pk__in=[int(d.object_id) for d in batch]).values_list(
+                'pk', 'transaction_uuid', 'transaction_code', 'ref_id'
+            )
+        }
+        for document in batch:
+            document.body = references.get(document.object_id, '')
+        SearchDocument.objects.bulk_update(batch, ['body'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0028_customer_wallet'),
+        ('payments', '0012_payment_callback'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_payment_references, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,144 @@
 """Models for the orders app in a laundry management system."""
+import logging
 import uuid
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Order statuses whose amount counts as customer spend (ledger and VIP status)
+COUNTED_ORDER_STATUSES = ('delivered', 'completed', 'paid')
+VIP_MONTHLY_SPEND_THRESHOLD = 50000
+
+# Delivery statuses that still need a rider; these count towards RiderLoad
+OPEN_DELIVERY_STATUSES = ('pending', 'in_progress')
+
+# Allowed order status changes: current status -> statuses it may move to.
+# Statuses missing from the table (or mapped to an empty set) are final.
+ORDER_STATUS_TRANSITIONS = {
+    'dropped by user': {'sent to wash', 'in wash', 'cancelled'},
+    'pending pickup': {'picked up', 'cancelled'},
+    'picked up': {'sent to wash', 'in wash', 'cancelled'},
+    'sent to wash': {'in wash', 'cancelled'},
+    'in wash': {'washed'},
+    'washed': {'picked by client', 'pending delivery', 'delivered'},
+    'pending delivery': {'delivered'},
+    'picked by client': {'refunded'},
+    'delivered': {'refunded'},
+    'cancelled': {'refunded'},
+    'refunded': set(),
+    # Statuses from before migration 0013, still held by older orders. They may only
+    # move on to the current status that replaced them (or a later one).
+    'asked pickup': {'pending pickup', 'picked up', 'cancelled'},
+    'pending': {'dropped by user', 'pending pickup', 'picked up', 'sent to wash', 'in wash', 'cancelled'},
+    'in_progress': {'in wash', 'washed', 'cancelled'},
+    'in progress': {'in wash', 'washed', 'cancelled'},
+    'to be delivered': {'pending delivery', 'picked by client', 'delivered'},
+    'completed': {'picked by client', 'delivered', 'refunded'},
+}
+
+# Allowed delivery status changes, read the same way as ORDER_STATUS_TRANSITIONS
+DELIVERY_STATUS_TRANSITIONS = {
+    'pending': {'in_progress', 'delivered', 'cancelled'},
+    'in_progress': {'pending', 'delivered', 'cancelled'},
+    'delivered': set(),
+    'cancelled': {'pending'},
+}
+
+
+def spend_month(moment):
+    """Return the first day of the month ``moment`` falls in (current time zone)."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def counted_spend(user_id, status, order_date, total_amount):
+    """Return ``(user_id, month, amount)`` an order contributes to the ledger, or None."""
+    if status not in COUNTED_ORDER_STATUSES or order_date is None:
+        return None
+    return user_id, spend_month(order_date), total_amount
+
+def order_rollup(branch_id, order_date, payment_status, total_amount):
+    """Return ``(branch_id, day, paid_income)`` an order contributes to the daily rollups."""
+    if order_date is None:
+        return None
+    paid_income = total_amount if payment_status == 'paid' else 0
+    return branch_id, timezone.localtime(order_date).date(), paid_income
+
+
+def delivery_day(start_time, created_at):
+    """Return the day a delivery is scheduled for.
+
+    That is the day of delivery_start_time when known, otherwise the day the
+    delivery was created.
+    """
+    moment = start_time or created_at or timezone.now()
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.date()
+
+
+def delivery_load_key(rider_id, status, start_time, created_at, slot):
+    """Return ``(rider_id, day, slot)`` a delivery counts towards in RiderLoad, or None."""
+    if rider_id is None or status not in OPEN_DELIVERY_STATUSES:
+        return None
+    return rider_id, delivery_day(start_time, created_at), slot or ''
+
+
+def delivery_slot_key(branch_id, status, start_time, created_at, slot):
+    """Return ``(branch_id, day, slot)`` a delivery takes a place in (SlotCapacity), or None."""
+    if status == 'cancelled' or not slot:
+        return None
+    return branch_id, delivery_day(start_time, created_at), slot
+
+
+def default_slot_capacity():
+    """Places per branch, day and time slot unless a SlotCapacity row says otherwise."""
+    from django.conf import settings
+    return getattr(settings, 'ORDER_SLOT_CAPACITY', 20)
+
+
+class OrderQuerySet(models.QuerySet):
+    """QuerySet helpers for loading orders together with their related rows."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create() sends no signals, so add the new orders to the daily rollups here."""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        totals = {}
+        for order in objs:
+            branch_id, day, paid_income = order_rollup(
+                order.branch_id, order.order_date, order.payment_status, order.total_amount
+            )
+            count, income = totals.get((branch_id, day), (0, 0))
+            totals[(branch_id, day)] = (count + 1, income + paid_income)
+        for (branch_id, day), (count, income) in totals.items():
+            BranchDailyStats.record(branch_id, day, count, income)
+        # ...and open each order's status timeline
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(order=order, customer_id=order.customer_name_id, branch_id=order.branch_id,
+                             from_status='', to_status=order.status, created_at=order.order_date)
+            for order in objs
+        ])
+        from .search import index_orders
+        from .stats_cache import invalidate
+        index_orders([order.pk for order in objs])
+        invalidate({order.branch_id for order in objs}, {order.customer_name_id for order in objs})
+        return objs
+
+    def for_serialization(self):
+        """Load everything OrderSerializer reads in a fixed number of queries.
+
+        Items, deliveries and the customer's saved addresses are prefetched so the
+        serializer can resolve pickup/delivery details from memory instead of
+        issuing per-row queries.
+        """
+        return self.select_related('customer_name', 'branch').prefetch_related(
+            'order_items',
+            models.Prefetch('deliveries', queryset=Delivery.objects.order_by('id')),
+            models.Prefetch('customer_name__addresses', queryset=UserAddress.objects.order_by('id')),
+        )
+
 
 # Create your models here.
 class Order(models.Model):
@@ -56,10 +194,112 @@ class Order(models.Model):
         ('paid', 'Paid'),
         ('failed', 'Failed')
     ], default='pending')
+    # Sum of OrderPayment.amount_applied, maintained by the OrderPayment signals below
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                      help_text="Total amount applied to this order by payments")
+    # Idempotency key supplied by batch intake clients (e.g. offline counter terminals)
+    idempotency_key = models.CharField(max_length=100, blank=True, null=True,
+                                       help_text="Client key that prevents the same order being created twice")
+
+    objects = OrderQuerySet.as_manager()
+
+    # ArchivedOrder sets this to True; lets serializers tell the two apart
+    is_archived = False
+
+    class Meta:
+        # Ensure idempotency_key is unique per customer
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer_name', 'idempotency_key'],
+                name='unique_order_customer_idempotency_key',
+                condition=models.Q(idempotency_key__isnull=False)
+            )
+        ]
+        indexes = [
+            # Keyset pagination on (order_date, order_id) per listing scope
+            models.Index(fields=['order_date', 'order_id']),
+            models.Index(fields=['customer_name', 'order_date', 'order_id']),
+            models.Index(fields=['branch', 'order_date', 'order_id']),
+            # Oldest-first lookup of a customer's unpaid orders during payment allocation
+            models.Index(fields=['customer_name', 'payment_status', 'order_date']),
+        ]
 
     def __str__(self):
         return f"Order {self.order_id} by {self.customer_name} - Total: {self.total_amount}"
 
+    def save(self, *args, **kwargs):
+        """Save the order without overwriting amount_paid from a possibly stale instance.
+
+        amount_paid is only changed through F() updates issued when OrderPayment
+        rows are written, so a plain save() of an existing order leaves it alone
+        unless it is named explicitly in update_fields.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'amount_paid'
+            ]
+        super().save(*args, **kwargs)
+
+    def can_transition_to(self, status):
+        """Return True if the order may move from its current status to ``status``."""
+        return status == self.status or status in ORDER_STATUS_TRANSITIONS.get(self.status, ())
+
+    def transition_to(self, status, actor=None, note=''):
+        """Move the order to ``status`` and save it, recording who made the change.
+
+        Raises ValidationError when the transition table does not allow the change.
+        The status event itself is written by the post_save signal below.
+        """
+        from django.core.exceptions import ValidationError
+        if not self.can_transition_to(status):
+            raise ValidationError(f"Cannot change order status from '{self.status}' to '{status}'")
+        if status == self.status:
+            return False
+        self.status = status
+        self._status_actor = actor
+        self._status_note = note
+        self.save()
+        return True
+
+    @property
+    def outstanding_amount(self):
+        """Amount still to be paid on this order."""
+        return max(self.total_amount - self.amount_paid, 0)
+
+    @classmethod
+    def add_paid_amounts(cls, amounts):
+        """Add ``{order_id: amount}`` to amount_paid with a single UPDATE."""
+        amounts = {order_id: amount for order_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        cls.objects.filter(pk__in=amounts).update(
+            amount_paid=models.F('amount_paid') + models.Case(
+                *[models.When(pk=order_id, then=models.Value(amount)) for order_id, amount in amounts.items()],
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+
+
+class OrderItemQuerySet(models.QuerySet):
+    """QuerySet that keeps the daily service rollups in step with bulk inserts."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create() sends no signals, so count the new items in the rollups here."""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        counts = {}
+        for item in objs:
+            order = item.order
+            key = (order.branch_id, timezone.localtime(order.order_date).date(), item.service_type)
+            counts[key] = counts.get(key, 0) + 1
+        for (branch_id, day, service_type), count in counts.items():
+            BranchDailyServiceStats.record(branch_id, day, service_type, count)
+        from .search import index_orders
+        from .stats_cache import invalidate
+        index_orders({item.order_id for item in objs})
+        invalidate({item.order.branch_id for item in objs}, {item.order.customer_name_id for item in objs})
+        return objs
+
 
 class OrderItem(models.Model):
     """Model representing individual items within an order."""
@@ -75,11 +315,38 @@ class OrderItem(models.Model):
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = OrderItemQuerySet.as_manager()
+
     def __str__(self):
         wash_info = f" - {self.wash_type}" if self.wash_type else ""
         return f"{self.service_type}{wash_info} ({self.material}) x{self.quantity} - {self.total_price}"
 
 
+class DeliveryQuerySet(models.QuerySet):
+    """QuerySet that keeps the rider load counters in step with bulk inserts."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create() sends no signals, so count already-assigned deliveries here."""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        counts = {}
+        for delivery in objs:
+            key = delivery.load_key()
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+        for (rider_id, day, slot), count in counts.items():
+            RiderLoad.record(rider_id, day, slot, count)
+
+        # Deliveries whose slot place was not reserved up front still take one
+        places = {}
+        for delivery in objs:
+            key = None if getattr(delivery, '_slot_reserved', False) else delivery.slot_key()
+            if key:
+                places[key] = places.get(key, 0) + 1
+        for (branch_id, day, slot), count in places.items():
+            SlotCapacity.record(branch_id, day, slot, count)
+        return objs
+
+
 class Delivery(models.Model):
     """Model representing a delivery associated with an order."""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='deliveries')
@@ -112,9 +379,32 @@ class Delivery(models.Model):
 
     delivery_time = models.CharField(max_length=20, choices=TIME_SLOTS, default='late_afternoon')
 
+    objects = DeliveryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (delivery_date, id) for all deliveries and per rider
+            models.Index(fields=['delivery_date', 'id']),
+            models.Index(fields=['delivery_person', 'delivery_date', 'id']),
+        ]
+
     def __str__(self):
         return f"({self.delivery_type} - Status: {self.status})"
 
+    def can_transition_to(self, status):
+        """Return True if the delivery may move from its current status to ``status``."""
+        return status == self.status or status in DELIVERY_STATUS_TRANSITIONS.get(self.status, ())
+
+    def load_key(self):
+        """Return the RiderLoad counter this delivery counts towards, or None."""
+        return delivery_load_key(self.delivery_person_id, self.status, self.delivery_start_time,
+                                 self.delivery_date, self.delivery_time)
+
+    def slot_key(self, branch_id=None):
+        """Return the SlotCapacity counter this delivery takes a place in, or None."""
+        return delivery_slot_key(branch_id or self.order.branch_id, self.status, self.delivery_start_time,
+                                 self.delivery_date, self.delivery_time)
+
 
 class UserAddress(models.Model):
     """Model to store user addresses for pickup and delivery."""
@@ -127,12 +417,43 @@ class UserAddress(models.Model):
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='addresses')
     address = models.CharField(max_length=255)
     map_link = models.URLField(blank=True, null=True)
+    # Coordinates parsed from map_link on save
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     address_type = models.CharField(max_length=10, choices=ADDRESS_TYPES, default='both')
     is_default = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.email} - {self.address} ({self.address_type})"
 
+    def save(self, *args, **kwargs):
+        """Store the coordinates embedded in map_link along with the address."""
+        from .routing import parse_coordinates
+        self.latitude, self.longitude = parse_coordinates(self.map_link) or (None, None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'map_link' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude'}
+        super().save(*args, **kwargs)
+
+
+class OrderPaymentQuerySet(models.QuerySet):
+    """QuerySet that keeps Order.amount_paid in step with bulk inserts."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create() sends no signals, so apply the paid amounts here."""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        amounts = {}
+        for order_payment in objs:
+            amounts[order_payment.order_id] = amounts.get(order_payment.order_id, 0) + order_payment.amount_applied
+        Order.add_paid_amounts(amounts)
+        for order_payment in objs:
+            _sync_cached_order(order_payment, order_payment.amount_applied)
+        payments = defaultdict(Decimal)
+        for order_payment in objs:
+            payments[order_payment.payment_id] += order_payment.amount_applied
+        CustomerWallet.record_allocations(payments)
+        return objs
+
 
 class OrderPayment(models.Model):
     """Model to track which payments pay which orders (junction table)."""
@@ -141,6 +462,8 @@ class OrderPayment(models.Model):
     amount_applied = models.DecimalField(max_digits=10, decimal_places=2, 
                                          help_text="Portion of payment applied to this order")
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = OrderPaymentQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -152,38 +475,904 @@ class OrderPayment(models.Model):
     def __str__(self):
         return f"Payment {self.payment.transaction_uuid} -> Order {self.order.order_id}: Rs.{self.amount_applied}"
 
-from django.db.models.signals import post_save
+class OrderStatusEvent(models.Model):
+    """Append-only log of order status changes.
+
+    One row is written whenever an order is created or its status changes.
+    customer and branch are copied from the order so that activity feeds can be
+    read per scope straight from the (scope, created_at) indexes.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    customer = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='order_status_events')
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='order_status_events')
+    from_status = models.CharField(max_length=20, blank=True, default='')
+    to_status = models.CharField(max_length=20)
+    actor = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='order_status_changes')
+    note = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    # How long the order stayed in from_status, filled in when the event is written
+    time_in_previous_status = models.DurationField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['branch', 'created_at', 'id']),
+            models.Index(fields=['customer', 'created_at', 'id']),
+            models.Index(fields=['order', 'created_at']),
+            models.Index(fields=['from_status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+    @classmethod
+    def record(cls, order, from_status, to_status, actor=None, note=''):
+        """Append an event for ``order`` and time how long it spent in ``from_status``."""
+        now = timezone.now()
+        entered_at = cls.objects.filter(order=order).order_by('-created_at', '-id').values_list(
+            'created_at', flat=True
+        ).first()
+        return cls.objects.create(
+            order=order, customer_id=order.customer_name_id, branch_id=order.branch_id,
+            from_status=from_status, to_status=to_status,
+            actor=actor if getattr(actor, 'is_authenticated', False) else None,
+            note=note or '', created_at=now,
+            time_in_previous_status=now - entered_at if entered_at else None,
+        )
+
+
+class CustomerSpend(models.Model):
+    """Per-customer, per-month spend ledger of orders in a counted status."""
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='monthly_spend')
+    month = models.DateField(help_text="First day of the month")
+    order_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_customer_spend_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m}: {self.order_count} orders, Rs.{self.total_spent}"
+
+    @classmethod
+    def record(cls, user_id, month, count_delta, amount_delta):
+        """Apply a spend change to the month row and the customer's lifetime totals."""
+        _increment_or_create(cls, {'user_id': user_id, 'month': month},
+                             order_count=count_delta, total_spent=amount_delta)
+        _increment_or_create(CustomerLifetimeSpend, {'user_id': user_id},
+                             order_count=count_delta, total_spent=amount_delta)
+
+
+class CustomerLifetimeSpend(models.Model):
+    """Lifetime totals of a customer's spend ledger."""
+    user = models.OneToOneField('users.User', on_delete=models.CASCADE, primary_key=True,
+                                related_name='lifetime_spend')
+    order_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.order_count} orders, Rs.{self.total_spent}"
+
+
+class CustomerWallet(models.Model):
+    """Per-customer, per-branch credit: completed payments not yet applied to orders.
+
+    Kept in step with payment completion and allocation in the same
+    transaction; rebuild_wallet_balances recomputes it from history.
+    """
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='wallets')
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='wallets')
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'branch'], name='unique_customer_wallet'),
+            # Payments without a branch share one wallet per customer
+            models.UniqueConstraint(fields=['user'], condition=models.Q(branch__isnull=True),
+                                    name='unique_customer_wallet_without_branch'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} at {self.branch_id}: Rs.{self.balance}"
+
+    @classmethod
+    def record(cls, user_id, branch_id, delta):
+        """Add ``delta`` to the customer's balance at a branch."""
+        if delta:
+            _increment_or_create(cls, {'user_id': user_id, 'branch_id': branch_id}, balance=delta)
+
+    @classmethod
+    def record_allocations(cls, amounts):
+        """Take ``{payment_id: amount}`` allocated to orders off the wallets of the completed payments."""
+        from payments.models import Payment
+
+        deltas = defaultdict(Decimal)
+        payments = Payment.objects.filter(pk__in=[pk for pk, amount in amounts.items() if amount], status='COMPLETE')
+        for pk, user_id, branch_id in payments.values_list('pk', 'user_id', 'branch_id'):
+            deltas[user_id, branch_id] -= amounts[pk]
+        for (user_id, branch_id), delta in deltas.items():
+            cls.record(user_id, branch_id, delta)
+
+
+class BranchDailyStats(models.Model):
+    """Daily per-branch rollup of order counts and paid income (backs OrderStatsView)."""
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    orders_count = models.IntegerField(default=0)
+    paid_income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'day'], name='unique_branch_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id} {self.day}: {self.orders_count} orders, Rs.{self.paid_income}"
+
+    @classmethod
+    def record(cls, branch_id, day, orders_delta, income_delta):
+        """Add to the rollup row of a branch and day."""
+        _increment_or_create(cls, {'branch_id': branch_id, 'day': day},
+                             orders_count=orders_delta, paid_income=income_delta)
+
+
+class BranchDailyServiceStats(models.Model):
+    """Daily per-branch count of order items by service type."""
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='daily_service_stats')
+    day = models.DateField()
+    service_type = models.CharField(max_length=100)
+    items_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'day', 'service_type'],
+                                    name='unique_branch_daily_service_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id} {self.day} {self.service_type}: {self.items_count}"
+
+    @classmethod
+    def record(cls, branch_id, day, service_type, items_delta):
+        """Add to the item count of a branch, day and service type."""
+        _increment_or_create(cls, {'branch_id': branch_id, 'day': day, 'service_type': service_type},
+                             items_count=items_delta)
+
+
+class RiderLoad(models.Model):
+    """Open (pending or in progress) deliveries assigned to a rider per day and time slot.
+
+    Maintained by the Delivery signals and the assignment engine in
+    orders/assignment.py, which picks the least-loaded rider from these rows.
+    """
+    rider = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='delivery_loads')
+    day = models.DateField()
+    slot = models.CharField(max_length=20, choices=Delivery.TIME_SLOTS)
+    open_deliveries = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['rider', 'day', 'slot'], name='unique_rider_load'),
+        ]
+        indexes = [
+            # Least-loaded rider lookup for a day and slot
+            models.Index(fields=['day', 'slot', 'open_deliveries', 'rider']),
+        ]
+
+    def __str__(self):
+        return f"{self.rider_id} {self.day} {self.slot}: {self.open_deliveries}"
+
+    @classmethod
+    def record(cls, rider_id, day, slot, delta):
+        """Add to a rider's open delivery count for a day and slot."""
+        _increment_or_create(cls, {'rider_id': rider_id, 'day': day, 'slot': slot}, open_deliveries=delta)
+
+
+class SlotCapacity(models.Model):
+    """Places per branch, day and time slot for pickups and drops.
+
+    ``reserved`` counts the non-cancelled deliveries in the slot. Order creation
+    takes places with reserve(), which refuses to go past ``capacity``; the
+    Delivery signals keep the count in step with every other write.
+    """
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='slot_capacities')
+    day = models.DateField()
+    slot = models.CharField(max_length=20, choices=Delivery.TIME_SLOTS)
+    capacity = models.IntegerField(default=default_slot_capacity)
+    reserved = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'day', 'slot'], name='unique_branch_slot_capacity'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id} {self.day} {self.slot}: {self.reserved}/{self.capacity}"
+
+    @property
+    def available(self):
+        return max(self.capacity - self.reserved, 0)
+
+    @classmethod
+    def reserve(cls, branch_id, day, slot, count=1):
+        """Atomically take ``count`` places in a slot. Returns False if it has too few left."""
+        lookup = {'branch_id': branch_id, 'day': day, 'slot': slot}
+        increment = {'reserved': models.F('reserved') + count}
+        if cls.objects.filter(**lookup, reserved__lte=models.F('capacity') - count).update(**increment):
+            return True
+        if cls.objects.filter(**lookup).exists() or count > default_slot_capacity():
+            return False
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, reserved=count)
+            return True
+        except IntegrityError:
+            # Created concurrently by another writer; reserve against that row instead
+            return bool(cls.objects.filter(**lookup, reserved__lte=models.F('capacity') - count).update(**increment))
+
+    @classmethod
+    def record(cls, branch_id, day, slot, delta):
+        """Add to the reserved count of a slot without checking its capacity."""
+        _increment_or_create(cls, {'branch_id': branch_id, 'day': day, 'slot': slot}, reserved=delta)
+
+
+class SearchDocument(models.Model):
+    """Searchable text of an order, customer or payment (see orders/search.py).
+
+    On SQLite the FTS5 table orders_searchdocument_fts indexes title and body
+    and is kept in step with this table by triggers.
+    """
+    KIND_CHOICES = [
+        ('order', 'Order'),
+        ('customer', 'Customer'),
+        ('payment', 'Payment'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=64)
+    # Scope of the record, used to limit results to what the caller may see
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='search_documents')
+    customer = models.ForeignKey('users.User', on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='search_documents')
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'branch']),
+            models.Index(fields=['kind', 'customer']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+
+class ArchivedOrderQuerySet(models.QuerySet):
+    """QuerySet helpers for archived orders (see Order.objects.for_serialization)."""
+
+    def for_serialization(self):
+        """Load everything OrderSerializer reads in a fixed number of queries."""
+        return self.select_related('customer_name', 'branch').prefetch_related(
+            'order_items',
+            models.Prefetch('deliveries', queryset=ArchivedDelivery.objects.order_by('id')),
+            models.Prefetch('customer_name__addresses', queryset=UserAddress.objects.order_by('id')),
+        )
+
+
+class ArchivedOrder(models.Model):
+    """Closed order moved out of the orders table by the archive_orders command.
+
+    Rows keep the primary key and field values of the original Order, so the
+    order views and OrderSerializer read them the same way as live orders.
+    Archived orders are never written to again; their spend, daily rollups and
+    search documents were counted while they were live and are left in place.
+    """
+    order_id = models.UUIDField(primary_key=True, editable=False)
+    customer_name = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='archived_orders')
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='archived_orders')
+    pickup_requested = models.BooleanField(default=False)
+    order_date = models.DateTimeField()
+    pickup_enabled = models.BooleanField(default=False)
+    delivery_enabled = models.BooleanField(default=False)
+    pickup_date = models.DateTimeField(blank=True, null=True)
+    pickup_time = models.CharField(max_length=20, blank=True, null=True)
+    delivery_date = models.DateTimeField(blank=True, null=True)
+    delivery_time = models.CharField(max_length=20, blank=True, null=True)
+    status = models.CharField(max_length=20)
+    description = models.TextField(blank=True, null=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    is_urgent = models.BooleanField(default=False)
+    payment_method = models.CharField(max_length=20)
+    payment_status = models.CharField(max_length=20)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    idempotency_key = models.CharField(max_length=100, blank=True, null=True)
+    # The order's status events, oldest first, as OrderStatusEventSerializer renders them
+    status_history = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = ArchivedOrderQuerySet.as_manager()
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            # Same keyset indexes as the live table, for the merged order listing
+            models.Index(fields=['order_date', 'order_id']),
+            models.Index(fields=['customer_name', 'order_date', 'order_id']),
+            models.Index(fields=['branch', 'order_date', 'order_id']),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.order_id} by {self.customer_name} - Total: {self.total_amount}"
+
+    @property
+    def outstanding_amount(self):
+        """Amount still to be paid on this order."""
+        return max(self.total_amount - self.amount_paid, 0)
+
+
+class ArchivedOrderItem(models.Model):
+    """OrderItem of an archived order."""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='order_items')
+    service_type = models.CharField(max_length=100)
+    wash_type = models.CharField(max_length=100, blank=True, null=True)
+    material = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    pricing_type = models.CharField(max_length=20, default='individual')
+    price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.service_type} ({self.material}) x{self.quantity} - {self.total_price}"
+
+
+class ArchivedDelivery(models.Model):
+    """Delivery of an archived order."""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='deliveries')
+    delivery_address = models.CharField(max_length=255)
+    map_link = models.URLField(blank=True, null=True)
+    delivery_contact = models.CharField(max_length=15)
+    delivery_type = models.CharField(max_length=7, default='pickup')
+    delivery_person = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True,
+                                        related_name='archived_deliveries')
+    delivery_date = models.DateTimeField()
+    delivery_vehicle = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20)
+    delivery_start_time = models.DateTimeField(blank=True, null=True)
+    delivery_end_time = models.DateTimeField(blank=True, null=True)
+    delivery_time = models.CharField(max_length=20, default='late_afternoon')
+
+    def __str__(self):
+        return f"({self.delivery_type} - Status: {self.status})"
+
+
+class ArchivedOrderPayment(models.Model):
+    """OrderPayment allocation of an archived order.
+
+    Still counts towards how much of its payment has been used up, see
+    ``applied_amount_subquery``.
+    """
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='order_payments')
+    payment = models.ForeignKey('payments.Payment', on_delete=models.CASCADE,
+                                related_name='archived_order_payments')
+    amount_applied = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment']),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.payment_id} -> Archived order {self.order_id}: Rs.{self.amount_applied}"
+
+
+class StatusUpdate(models.Model):
+    """Compact status change pushed to clients by the status stream (see orders/realtime.py).
+
+    Rows are scoped like the order views (customer, branch and, for deliveries,
+    rider) and read by id, which doubles as the SSE event id. They only need
+    to live as long as a client may take to reconnect; prune_status_updates
+    removes old ones.
+    """
+    KIND_CHOICES = [
+        ('order', 'Order'),
+        ('delivery', 'Delivery'),
+        ('payment', 'Payment'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=64)
+    # Plain column rather than a foreign key: archived orders leave their updates behind
+    order_id = models.UUIDField(null=True, blank=True)
+    customer = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='status_updates')
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='status_updates')
+    rider = models.ForeignKey('users.User', on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='rider_status_updates')
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'id']),
+            models.Index(fields=['branch', 'id']),
+            models.Index(fields=['rider', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.data}"
+
+
+def _allocation_subquery(payment_ref, aggregate, output_field):
+    """Sum of ``aggregate`` over a payment's live and archived allocations."""
+    def total(model):
+        return models.functions.Coalesce(models.Subquery(
+            model.objects.filter(payment_id=models.OuterRef(payment_ref)).order_by().values('payment_id').annotate(
+                total=aggregate
+            ).values('total')[:1]
+        ), models.Value(0), output_field=output_field)
+    return total(OrderPayment) + total(ArchivedOrderPayment)
+
+
+def applied_amount_subquery(payment_ref='pk'):
+    """Subquery of the amount of a payment applied to live and archived orders.
+
+    For annotating payments: ``Payment.objects.annotate(total_applied=applied_amount_subquery())``.
+    """
+    return _allocation_subquery(payment_ref, models.Sum('amount_applied'),
+                                models.DecimalField(max_digits=12, decimal_places=2))
+
+
+def applied_orders_subquery(payment_ref='pk'):
+    """Subquery of the number of live and archived orders a payment was applied to."""
+    return _allocation_subquery(payment_ref, models.Count('id'), models.IntegerField())
+
+
+def _increment_or_create(model, lookup, **deltas):
+    """Atomically add ``deltas`` to a counter row, creating it on first use."""
+    increments = {field: models.F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Created concurrently by another writer; add to that row instead
+        model.objects.filter(**lookup).update(**increments)
+
+
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Sum
-from django.utils import timezone
+
+
+def _sync_cached_order(order_payment, amount):
+    """Mirror an amount_paid change onto the order instance cached on the OrderPayment."""
+    if OrderPayment.order.is_cached(order_payment):
+        order_payment.order.amount_paid += amount
+
+
+@receiver(pre_save, sender=OrderPayment)
+def remember_applied_amount(sender, instance, **kwargs):
+    """Remember the stored amount so an edited OrderPayment applies only the difference."""
+    instance._stored_amount_applied = None
+    if instance.pk and not instance._state.adding:
+        instance._stored_amount_applied = OrderPayment.objects.filter(
+            pk=instance.pk
+        ).values_list('amount_applied', flat=True).first()
+
+
+@receiver(post_save, sender=OrderPayment)
+def add_order_payment_to_order(sender, instance, created, **kwargs):
+    """Add a new or edited OrderPayment to its order's amount_paid in the same transaction."""
+    delta = instance.amount_applied - (getattr(instance, '_stored_amount_applied', None) or 0)
+    if delta:
+        Order.add_paid_amounts({instance.order_id: delta})
+        _sync_cached_order(instance, delta)
+        CustomerWallet.record_allocations({instance.payment_id: delta})
+
+
+@receiver(post_delete, sender=OrderPayment)
+def remove_order_payment_from_order(sender, instance, **kwargs):
+    """Reverse a deleted OrderPayment from its order's amount_paid."""
+    Order.add_paid_amounts({instance.order_id: -instance.amount_applied})
+    _sync_cached_order(instance, -instance.amount_applied)
+    # Deleting the payment itself takes its whole credit off in wallet_payment_deleted
+    from payments.models import Payment
+    origin = kwargs.get('origin')
+    if getattr(origin, 'model', type(origin)) is not Payment:
+        CustomerWallet.record_allocations({instance.payment_id: -instance.amount_applied})
+
+@receiver(pre_save, sender=Order)
+def remember_stored_order(sender, instance, **kwargs):
+    """Remember the stored values the ledgers and rollups depend on before the order changes."""
+    instance._stored_values = None
+    if not instance._state.adding:
+        instance._stored_values = Order.objects.filter(pk=instance.pk).values(
+            'customer_name_id', 'branch_id', 'status', 'payment_status', 'order_date', 'total_amount', 'description'
+        ).first()
+
+
+@receiver(post_save, sender=Order)
+def record_status_event(sender, instance, created, **kwargs):
+    """Append to the status log when an order is created or its status changes."""
+    stored = getattr(instance, '_stored_values', None)
+    from_status = stored['status'] if stored else ''
+    if not created and from_status == instance.status:
+        return
+    OrderStatusEvent.record(
+        instance, from_status, instance.status,
+        actor=getattr(instance, '_status_actor', None),
+        note=getattr(instance, '_status_note', ''),
+    )
+    instance._status_actor = None
+    instance._status_note = ''
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    """Push status and payment status changes to the status stream."""
+    stored = getattr(instance, '_stored_values', None)
+    changed = {'status', 'payment_status'} if created or not stored else {
+        field for field in ('status', 'payment_status') if stored[field] != getattr(instance, field)
+    }
+    if changed:
+        from .realtime import publish_order
+        publish_order(instance, changed)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_stats(sender, instance, **kwargs):
+    """Drop the cached OrderStatsView responses the order appears in."""
+    from .stats_cache import invalidate
+    stored = getattr(instance, '_stored_values', None) or {}
+    invalidate(branch_ids={instance.branch_id, stored.get('branch_id')},
+               customer_ids={instance.customer_name_id, stored.get('customer_name_id')})
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_item_order_stats(sender, instance, **kwargs):
+    """Drop the cached stats of the item's order (service distribution)."""
+    from .stats_cache import invalidate
+    scope = Order.objects.filter(pk=instance.order_id).values_list('branch_id', 'customer_name_id').first()
+    branch_id, customer_id = scope or (None, None)
+    invalidate([branch_id], [customer_id])
+
+
+@receiver(post_save, sender=Order)
+def index_order_for_search(sender, instance, **kwargs):
+    """Refresh the order's search document when its indexed text or scope changed."""
+    from .search import index_orders, indexed_fields_changed
+    if indexed_fields_changed('order', instance, getattr(instance, '_stored_values', None)):
+        index_orders([instance.pk])
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_search(sender, instance, **kwargs):
+    from .search import remove_documents
+    remove_documents('order', [instance.pk])
+
+
+@receiver(post_save, sender=OrderItem)
+def reindex_item_order_for_search(sender, instance, **kwargs):
+    """Items are part of their order's search document; reindex it when an item's text changed."""
+    from .search import index_orders, indexed_fields_changed
+    stored = getattr(instance, '_stored_item', None)
+    if indexed_fields_changed('item', instance, stored):
+        index_orders({instance.order_id, stored['order_id']} if stored else [instance.order_id])
+
+
+@receiver(post_delete, sender=OrderItem)
+def reindex_deleted_item_order_for_search(sender, instance, **kwargs):
+    from .search import index_orders
+    index_orders([instance.order_id])
+
+
+@receiver(post_save, sender='users.User')
+def index_customer_for_search(sender, instance, update_fields=None, **kwargs):
+    """Refresh the customer's search document (and their orders' if it changed).
+
+    Saves limited to other fields, like the last_login write on every login, are skipped.
+    """
+    from .search import INDEXED_FIELDS, reindex_customer
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS['customer']):
+        return
+    reindex_customer(instance.pk)
+
+
+@receiver(post_save, sender='payments.Payment')
+def index_payment_for_search(sender, instance, **kwargs):
+    """Refresh the payment's document when a reference, its amount or its scope changed."""
+    from .search import index_payments, indexed_fields_changed
+    if indexed_fields_changed('payment', instance, getattr(instance, '_stored_search', None)):
+        index_payments([instance.pk])
+
+
+@receiver(post_delete, sender='payments.Payment')
+def remove_payment_from_search(sender, instance, **kwargs):
+    from .search import remove_documents
+    remove_documents('payment', [instance.pk])
+
+
+def _applied_amount(payment_id):
+    """How much of a payment has been applied to live and archived orders."""
+    from payments.models import Payment
+    return Payment.objects.filter(pk=payment_id).annotate(applied=applied_amount_subquery()).values_list(
+        'applied', flat=True
+    ).first() or 0
+
+
+@receiver(pre_save, sender='payments.Payment')
+def remember_stored_payment(sender, instance, **kwargs):
+    """Remember what the payment's wallet and search document depend on before it changes."""
+    instance._stored_wallet = instance._stored_search = None
+    if not instance._state.adding:
+        instance._stored_wallet = instance._stored_search = type(instance).objects.filter(pk=instance.pk).values(
+            'status', 'user_id', 'branch_id', 'total_amount', 'transaction_uuid', 'transaction_code', 'ref_id'
+        ).first()
+
+
+@receiver(post_save, sender='payments.Payment')
+def update_wallet(sender, instance, created, **kwargs):
+    """Move the payment's unapplied amount into or out of its wallet when it completes or stops being complete."""
+    stored = getattr(instance, '_stored_wallet', None)
+    was_complete = bool(stored) and stored['status'] == 'COMPLETE'
+    is_complete = instance.status == 'COMPLETE'
+    if not was_complete and not is_complete:
+        return
+    key = (instance.user_id, instance.branch_id, instance.total_amount)
+    if was_complete and is_complete and key == (stored['user_id'], stored['branch_id'], stored['total_amount']):
+        return
+    applied = _applied_amount(instance.pk)
+    if was_complete:
+        CustomerWallet.record(stored['user_id'], stored['branch_id'], applied - stored['total_amount'])
+    if is_complete:
+        CustomerWallet.record(instance.user_id, instance.branch_id, instance.total_amount - applied)
+    instance._stored_wallet = {'status': instance.status, 'user_id': instance.user_id,
+                               'branch_id': instance.branch_id, 'total_amount': instance.total_amount}
+
+
+@receiver(pre_delete, sender='payments.Payment')
+def wallet_payment_deleted(sender, instance, **kwargs):
+    """Take a deleted completed payment's credit off its wallet before its allocations go."""
+    stored = type(instance).objects.filter(pk=instance.pk).values(
+        'status', 'user_id', 'branch_id', 'total_amount'
+    ).first()
+    if stored and stored['status'] == 'COMPLETE':
+        CustomerWallet.record(stored['user_id'], stored['branch_id'],
+                              _applied_amount(instance.pk) - stored['total_amount'])
+
+
+@receiver(pre_save, sender=Delivery)
+def remember_stored_delivery(sender, instance, **kwargs):
+    """Remember which rider load counter the stored delivery counts towards."""
+    instance._stored_load_key = None
+    instance._stored_slot_key = None
+    instance._stored_rider_id = None
+    instance._stored_status = None
+    if not instance._state.adding:
+        stored = Delivery.objects.filter(pk=instance.pk).values(
+            'delivery_person_id', 'status', 'delivery_start_time', 'delivery_date', 'delivery_time',
+            'order__branch_id'
+        ).first()
+        if stored:
+            instance._stored_rider_id = stored['delivery_person_id']
+            instance._stored_status = stored['status']
+            instance._stored_slot_key = delivery_slot_key(
+                stored['order__branch_id'], stored['status'], stored['delivery_start_time'],
+                stored['delivery_date'], stored['delivery_time']
+            )
+            instance._stored_load_key = delivery_load_key(
+                stored['delivery_person_id'], stored['status'], stored['delivery_start_time'],
+                stored['delivery_date'], stored['delivery_time']
+            )
+
+
+@receiver(post_save, sender=Delivery)
+def update_rider_load(sender, instance, created, **kwargs):
+    """Move the delivery between rider load counters when its rider, status or slot changes."""
+    before = getattr(instance, '_stored_load_key', None)
+    after = instance.load_key()
+    if before == after:
+        return
+    if before:
+        RiderLoad.record(*before, -1)
+    if after:
+        RiderLoad.record(*after, 1)
+
+
+@receiver(post_save, sender=Delivery)
+def update_slot_capacity(sender, instance, created, **kwargs):
+    """Move the delivery's slot place when it is cancelled, restored or rescheduled."""
+    before = getattr(instance, '_stored_slot_key', None)
+    after = instance.slot_key()
+    if created and getattr(instance, '_slot_reserved', False):
+        # The place was already taken by SlotCapacity.reserve()
+        before = after
+    if before == after:
+        return
+    if before:
+        SlotCapacity.record(*before, -1)
+    if after:
+        SlotCapacity.record(*after, 1)
+
+
+@receiver(post_delete, sender=Delivery)
+def release_slot_place(sender, instance, **kwargs):
+    """Give a deleted delivery's slot place back."""
+    key = delivery_slot_key(
+        Order.objects.filter(pk=instance.order_id).values_list('branch_id', flat=True).first(),
+        instance.status, instance.delivery_start_time, instance.delivery_date, instance.delivery_time
+    )
+    if key and key[0]:
+        SlotCapacity.record(*key, -1)
+
+
+@receiver(post_delete, sender=Delivery)
+def remove_delivery_from_rider_load(sender, instance, **kwargs):
+    """Take a deleted open delivery off its rider's load."""
+    key = instance.load_key()
+    if key:
+        RiderLoad.record(*key, -1)
+
+
+@receiver(post_save, sender=Delivery)
+def publish_delivery_status(sender, instance, created, **kwargs):
+    """Push status and rider changes to the status stream."""
+    changed = {'status', 'rider'} if created else {
+        field for field, stored, current in (
+            ('status', getattr(instance, '_stored_status', None), instance.status),
+            ('rider', getattr(instance, '_stored_rider_id', None), instance.delivery_person_id),
+        ) if stored != current
+    }
+    if changed:
+        from .realtime import publish_delivery
+        publish_delivery(instance, changed)
+
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def invalidate_delivery_manifests(sender, instance, **kwargs):
+    """Drop the cached route manifests of the riders the delivery belongs (or belonged) to."""
+    from .routing import invalidate_rider_manifests
+    invalidate_rider_manifests(instance.delivery_person_id, getattr(instance, '_stored_rider_id', None))
+
+
+def _stored_spend(instance):
+    stored = getattr(instance, '_stored_values', None)
+    if not stored:
+        return None
+    return counted_spend(stored['customer_name_id'], stored['status'], stored['order_date'], stored['total_amount'])
+
 
 @receiver(post_save, sender=Order)
 def check_vip_status(sender, instance, created, **kwargs):
     """
-    Check if user qualifies for VIP status after an order is updated.
+    Keep the customer spend ledger in step with the order and check VIP status.
     VIP Status Condition: Total spend > 50,000 in the current month.
+
+    Only orders in a counted status (see COUNTED_ORDER_STATUSES) contribute, so
+    the ledger changes only when an order enters or leaves one of those statuses
+    or a counted order's amount changes.
     """
-    # Only check if order is completed/delivered/paid to avoid counting cancelled/pending orders prematurely
-    # Adjust status check based on business logic. 'delivered' seems appropriate for realized revenue.
-    if instance.status in ['delivered', 'completed', 'paid']: 
-        user = instance.customer_name
-        
-        # Current month range
-        now = timezone.now()
-        
-        # Calculate total spend for the user in the current month
-        # We filter by Delivered/Paid orders to ensure valid spend
-        monthly_spend = Order.objects.filter(
-            customer_name=user,
-            status__in=['delivered', 'completed', 'paid'], # Ensure we match the status check above
-            order_date__month=now.month,
-            order_date__year=now.year
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        # Check threshold
-        if monthly_spend > 50000:
-            if not user.is_vip:
-                user.is_vip = True
-                user.save()
-                print(f"User {user.email} promoted to VIP status! Monthly spend: {monthly_spend}")
+    before = _stored_spend(instance)
+    after = counted_spend(instance.customer_name_id, instance.status, instance.order_date, instance.total_amount)
+    if before == after:
+        return
+    if before:
+        CustomerSpend.record(before[0], before[1], -1, -before[2])
+    if after:
+        CustomerSpend.record(after[0], after[1], 1, after[2])
+        promote_to_vip_if_eligible(instance)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_spend(sender, instance, **kwargs):
+    """Take a deleted counted order out of the spend ledger."""
+    spend = counted_spend(instance.customer_name_id, instance.status, instance.order_date, instance.total_amount)
+    if spend:
+        CustomerSpend.record(spend[0], spend[1], -1, -spend[2])
+
+
+@receiver(post_save, sender=Order)
+def update_branch_daily_stats(sender, instance, created, **kwargs):
+    """Keep the daily branch rollups in step with the order's branch, day, amount and payment status."""
+    stored = getattr(instance, '_stored_values', None)
+    before = order_rollup(
+        stored['branch_id'], stored['order_date'], stored['payment_status'], stored['total_amount']
+    ) if stored else None
+    after = order_rollup(instance.branch_id, instance.order_date, instance.payment_status, instance.total_amount)
+    if before == after:
+        return
+    if before and before[:2] == after[:2]:
+        BranchDailyStats.record(after[0], after[1], 0, after[2] - before[2])
+        return
+    if before:
+        BranchDailyStats.record(before[0], before[1], -1, -before[2])
+        # The order moved to another branch or day: move its item counts along
+        for service_type, count in _service_counts(instance):
+            BranchDailyServiceStats.record(before[0], before[1], service_type, -count)
+            BranchDailyServiceStats.record(after[0], after[1], service_type, count)
+    BranchDailyStats.record(after[0], after[1], 1, after[2])
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_daily_stats(sender, instance, **kwargs):
+    """Take a deleted order out of the daily branch rollups."""
+    rollup = order_rollup(instance.branch_id, instance.order_date, instance.payment_status, instance.total_amount)
+    if rollup:
+        BranchDailyStats.record(rollup[0], rollup[1], -1, -rollup[2])
+
+
+def _service_counts(order):
+    return OrderItem.objects.filter(order=order).order_by().values('service_type').annotate(
+        count=models.Count('id')
+    ).values_list('service_type', 'count')
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_stored_service_type(sender, instance, **kwargs):
+    """Remember the stored item so an edited item moves between rollup rows and is reindexed."""
+    instance._stored_service_type = instance._stored_item = None
+    if instance.pk and not instance._state.adding:
+        instance._stored_item = OrderItem.objects.filter(pk=instance.pk).values(
+            'order_id', 'service_type', 'material', 'wash_type'
+        ).first()
+        instance._stored_service_type = instance._stored_item and instance._stored_item['service_type']
+
+
+@receiver(post_save, sender=OrderItem)
+def count_order_item(sender, instance, created, **kwargs):
+    """Count a new item (or a changed service type) in the daily service rollups."""
+    stored_service_type = getattr(instance, '_stored_service_type', None)
+    if not created and stored_service_type == instance.service_type:
+        return
+    order = instance.order
+    day = timezone.localtime(order.order_date).date()
+    if stored_service_type is not None:
+        BranchDailyServiceStats.record(order.branch_id, day, stored_service_type, -1)
+    BranchDailyServiceStats.record(order.branch_id, day, instance.service_type, 1)
+
+
+@receiver(post_delete, sender=OrderItem)
+def uncount_order_item(sender, instance, **kwargs):
+    """Take a deleted item out of the daily service rollups."""
+    order = Order.objects.filter(pk=instance.order_id).values('branch_id', 'order_date').first()
+    if order:
+        day = timezone.localtime(order['order_date']).date()
+        BranchDailyServiceStats.record(order['branch_id'], day, instance.service_type, -1)
+
+
+def promote_to_vip_if_eligible(order):
+    """Promote the order's customer to VIP when this month's ledger row crosses the threshold."""
+    month = spend_month(timezone.now())
+    monthly_spend = CustomerSpend.objects.filter(
+        user_id=order.customer_name_id, month=month
+    ).values_list('total_spent', flat=True).first() or 0
 
+    # Check threshold
+    if monthly_spend > VIP_MONTHLY_SPEND_THRESHOLD:
+        from users.models import User
+        if User.objects.filter(pk=order.customer_name_id, is_vip=False).update(is_vip=True):
+            if Order.customer_name.is_cached(order):
+                order.customer_name.is_vip = True
+            logger.info(f"User {order.customer_name_id} promoted to VIP status! Monthly spend: {monthly_spend}")
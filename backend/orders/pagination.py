@@ -0,0 +1,160 @@
+"""Pagination classes for order, delivery and payment listings.
+
+Listings page with a keyset (cursor) on ``(timestamp, pk)`` so that deep pages
+cost the same as the first one: there is no OFFSET scan and no ``COUNT(*)``.
+Clients that still send ``?page=N`` get the classic page-number response.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first keyset pagination over ``(ordering_field, pk)``.
+
+    The cursor is an opaque token encoding the timestamp and primary key of the
+    last row on the previous page; the next page is everything strictly older.
+    Subclasses set ``ordering_field`` to the timestamp column to page on, and
+    the model should carry a composite index covering ``(ordering_field, pk)``.
+    """
+    ordering_field = None
+    cursor_query_param = 'cursor'
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    @staticmethod
+    def uses_page_numbers(request):
+        """Return True when the client asked for the legacy page-number API."""
+        return 'page' in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if self.uses_page_numbers(request):
+            self.page_number_pagination = PageNumberPagination()
+            self.page_number_pagination.page_size_query_param = self.page_size_query_param
+            self.page_number_pagination.max_page_size = self.max_page_size
+            return self.page_number_pagination.paginate_queryset(queryset, request, view)
+        self.page_number_pagination = None
+
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+        rows = self.keyset_rows(queryset, cursor, page_size)
+
+        # Views may page over an archive table too (see OrderListView); both
+        # sides are read up to the cursor and the newest rows of either win.
+        get_archive_queryset = getattr(view, 'get_archive_queryset', None)
+        if get_archive_queryset is not None:
+            field = self.ordering_field
+            rows += self.keyset_rows(get_archive_queryset(), cursor, page_size)
+            rows.sort(key=lambda row: (getattr(row, field), row.pk), reverse=True)
+            rows = rows[:page_size + 1]
+
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(self.page[-1]) if self.has_next else None
+        return self.page
+
+    def keyset_rows(self, queryset, cursor, page_size):
+        """Return up to ``page_size + 1`` rows older than ``cursor``, newest first."""
+        field = self.ordering_field
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        if cursor is not None:
+            timestamp, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk})
+            )
+        # Fetch one extra row to learn whether another page exists.
+        return list(queryset[:page_size + 1])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        """Encode the keyset position of ``instance`` as an opaque token."""
+        timestamp = getattr(instance, self.ordering_field)
+        raw = f'{timestamp.isoformat()}|{instance.pk}'
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        """Return ``(timestamp, pk)`` from the request cursor, or None for the first page.
+
+        The pk is converted with ``model``'s primary key field, so a tampered
+        cursor is a 404 here rather than a failure when the filter is built.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            timestamp, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), model._meta.pk.to_python(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination is not None:
+            return self.page_number_pagination.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """Keyset pagination for orders, newest ``order_date`` first."""
+    ordering_field = 'order_date'
+
+
+class DeliveryKeysetPagination(KeysetPagination):
+    """Keyset pagination for deliveries, newest ``delivery_date`` first."""
+    ordering_field = 'delivery_date'
+
+
+class PaymentKeysetPagination(KeysetPagination):
+    """Keyset pagination for payments, newest ``created_at`` first."""
+    ordering_field = 'created_at'
+
+
+class StatusEventKeysetPagination(KeysetPagination):
+    """Keyset pagination for order status events, newest ``created_at`` first."""
+    ordering_field = 'created_at'
@@ -0,0 +1,221 @@
+"""Server-sent events stream of order, delivery and payment status changes.
+
+Status changes are written to the StatusUpdate table when the surrounding
+transaction commits: order and delivery changes from their model signals,
+completed payments from ProcessPaymentView. Each SSE connection tails that
+table by id, scoped to what the user may see, and sends one compact JSON
+delta per row; the row id is the event id, so a reconnecting EventSource
+resumes from Last-Event-ID without missing anything.
+
+A connection sleeps between reads. Updates published in the same process
+wake its connections at once; updates from other processes are picked up by
+the next poll, POLL_INTERVAL seconds at most. Serve the project through
+backend/asgi.py (e.g. ``uvicorn backend.asgi:application``) so an open stream
+costs a coroutine rather than a worker thread.
+
+EventSource cannot send an Authorization header, and an access token in the
+query string ends up in access and proxy logs. Browsers therefore first
+fetch a stream ticket (``issue_stream_ticket``): a signed user id that is
+only accepted by the stream and only for STREAM_TICKET_TTL seconds.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import StatusUpdate
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2.0  # seconds between reads when nothing wakes the stream
+HEARTBEAT_INTERVAL = 15.0  # seconds of silence before a keep-alive comment
+STREAM_LIFETIME = 300.0  # seconds before the server closes a stream; EventSource reconnects
+RETRY_MS = 3000
+MAX_EVENTS_PER_READ = 200
+STREAM_TICKET_TTL = 60  # seconds a stream ticket may be used to open a stream
+STREAM_TICKET_SALT = 'orders.realtime.stream-ticket'
+
+_waiters = set()
+_waiters_lock = threading.Lock()
+
+
+def _wake_streams():
+    """Wake every stream waiting in this process."""
+    with _waiters_lock:
+        waiters = list(_waiters)
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The stream's event loop has already closed
+            pass
+
+
+def _queue(updates):
+    """Write ``updates`` in one INSERT when the current transaction commits."""
+    if not updates:
+        return
+
+    def write():
+        now = timezone.now()
+        for update in updates:
+            update.created_at = now
+            update.data['at'] = now.isoformat()
+        try:
+            StatusUpdate.objects.bulk_create(updates, batch_size=500)
+        except Exception as e:
+            logger.exception(f"[STATUS STREAM] Could not publish {len(updates)} updates: %s", e)
+            return
+        _wake_streams()
+
+    transaction.on_commit(write)
+
+
+def publish(kind, object_id, customer_id, branch_id=None, order_id=None, rider_id=None, **data):
+    """Queue a status update for the stream, written when the current transaction commits."""
+    _queue([StatusUpdate(
+        kind=kind, object_id=str(object_id), order_id=order_id, customer_id=customer_id,
+        branch_id=branch_id, rider_id=rider_id, data=data,
+    )])
+
+
+def _order_update(order, fields):
+    return StatusUpdate(
+        kind='order', object_id=str(order.order_id), order_id=order.order_id, customer_id=order.customer_name_id,
+        branch_id=order.branch_id,
+        data={'status': order.status, 'payment_status': order.payment_status, 'changed': sorted(fields)},
+    )
+
+
+def _delivery_update(delivery, fields):
+    order = delivery.order
+    return StatusUpdate(
+        kind='delivery', object_id=str(delivery.pk), order_id=order.order_id, customer_id=order.customer_name_id,
+        branch_id=order.branch_id, rider_id=delivery.delivery_person_id,
+        data={'delivery_type': delivery.delivery_type, 'status': delivery.status,
+              'rider': delivery.delivery_person_id, 'changed': sorted(fields)},
+    )
+
+
+def publish_order(order, fields):
+    """Publish an order's current status and payment status."""
+    _queue([_order_update(order, fields)])
+
+
+def publish_orders(orders, fields):
+    """Publish many orders at once (for bulk writes, which send no signals)."""
+    _queue([_order_update(order, fields) for order in orders])
+
+
+def publish_delivery(delivery, fields):
+    """Publish a delivery's status and rider."""
+    _queue([_delivery_update(delivery, fields)])
+
+
+def publish_deliveries(deliveries, fields):
+    """Publish many deliveries at once (for bulk writes, which send no signals)."""
+    _queue([_delivery_update(delivery, fields) for delivery in deliveries])
+
+
+def publish_payment(payment):
+    """Publish a payment's status."""
+    publish('payment', payment.pk, payment.user_id, branch_id=payment.branch_id,
+            transaction_uuid=payment.transaction_uuid, status=payment.status,
+            total_amount=str(payment.total_amount))
+
+
+def issue_stream_ticket(user):
+    """Return a short-lived ticket that opens ``user``'s status stream."""
+    return signing.dumps(user.pk, salt=STREAM_TICKET_SALT)
+
+
+def stream_ticket_user(ticket):
+    """Return the active user a stream ticket was issued to, or None if it is forged or expired."""
+    try:
+        user_id = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=STREAM_TICKET_TTL)
+    except signing.BadSignature:
+        return None
+    return get_user_model().objects.filter(pk=user_id, is_active=True).first()
+
+
+def updates_for(user):
+    """Return the status updates ``user`` may see, scoped like the order views."""
+    updates = StatusUpdate.objects.all()
+
+    # Admin sees everything
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return updates
+
+    # Branch manager sees their branch's updates
+    if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+        return updates.filter(branch=user.branchmanager.branch)
+
+    # Riders see the deliveries assigned to them
+    if getattr(user, 'role', None) == 'rider':
+        return updates.filter(rider=user)
+
+    # Customers see their own orders and payments
+    return updates.filter(customer=user)
+
+
+def latest_update_id():
+    """Id of the newest status update, where a fresh stream starts reading."""
+    return StatusUpdate.objects.aggregate(latest=models.Max('id'))['latest'] or 0
+
+
+def prune_updates(before):
+    """Delete the updates created before ``before``. Returns the number deleted."""
+    deleted, _ = StatusUpdate.objects.filter(created_at__lt=before).delete()
+    return deleted
+
+
+def _read(updates, last_id):
+    return list(updates.filter(id__gt=last_id).order_by('id').values(
+        'id', 'kind', 'object_id', 'order_id', 'data'
+    )[:MAX_EVENTS_PER_READ])
+
+
+def format_event(row):
+    """Render a status update row as an SSE message."""
+    payload = dict(row['data'], id=row['object_id'])
+    if row['order_id']:
+        payload['order_id'] = str(row['order_id'])
+    return f"id: {row['id']}\nevent: {row['kind']}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def event_stream(updates, last_id, lifetime=STREAM_LIFETIME):
+    """Yield SSE messages for ``updates`` newer than ``last_id`` until ``lifetime`` runs out."""
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    waiter = (loop, wake)
+    with _waiters_lock:
+        _waiters.add(waiter)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        deadline = loop.time() + lifetime
+        quiet_since = loop.time()
+        while loop.time() < deadline:
+            wake.clear()
+            rows = await sync_to_async(_read)(updates, last_id)
+            if rows:
+                last_id = rows[-1]['id']
+                yield ''.join(format_event(row) for row in rows)
+                quiet_since = loop.time()
+                if len(rows) == MAX_EVENTS_PER_READ:
+                    continue
+            elif loop.time() - quiet_since >= HEARTBEAT_INTERVAL:
+                yield ": keep-alive\n\n"
+                quiet_since = loop.time()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=min(POLL_INTERVAL, max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _waiters_lock:
+            _waiters.discard(waiter)
@@ -0,0 +1,195 @@
+"""Stop ordering for rider manifests.
+
+Stops are located from the coordinates embedded in their ``map_link``
+(OpenStreetMap ``mlat``/``mlon`` links, ``#map=zoom/lat/lon`` fragments and
+Google Maps ``@lat,lng`` / ``q=lat,lng`` / ``query=lat,lng`` links). Each time
+slot is ordered with a nearest-neighbour tour improved by 2-opt over a
+precomputed distance matrix, which keeps a few hundred stops well under a
+second. Planned manifests are cached per rider and day; any write to one of
+the rider's deliveries bumps the rider's manifest version, which reaches the
+other workers through the shared cache configured by CACHE_URL.
+"""
+import math
+import re
+import time
+import uuid
+from urllib.parse import urlparse, parse_qs, unquote
+
+from django.core.cache import cache
+
+EARTH_RADIUS_KM = 6371.0
+MANIFEST_CACHE_TIMEOUT = 60 * 60 * 24
+# Upper bound on time spent improving a single slot's route with 2-opt
+TWO_OPT_TIME_BUDGET = 0.5
+
+_PAIR_RE = re.compile(r'(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)')
+_AT_RE = re.compile(r'@(-?\d{1,2}(?:\.\d+)?),(-?\d{1,3}(?:\.\d+)?)')
+_FRAGMENT_RE = re.compile(r'map=\d+(?:\.\d+)?/(-?\d{1,2}(?:\.\d+)?)/(-?\d{1,3}(?:\.\d+)?)')
+
+
+def _valid(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None
+
+
+def parse_coordinates(map_link):
+    """Return ``(lat, lng)`` from a map link, or None if it carries no coordinates."""
+    if not map_link:
+        return None
+    try:
+        parsed = urlparse(map_link)
+    except ValueError:
+        return None
+    params = parse_qs(parsed.query)
+    try:
+        if 'mlat' in params and 'mlon' in params:
+            return _valid(params['mlat'][0], params['mlon'][0])
+        if 'lat' in params and ('lng' in params or 'lon' in params):
+            return _valid(params['lat'][0], (params.get('lng') or params['lon'])[0])
+        match = _FRAGMENT_RE.search(parsed.fragment)
+        if match:
+            return _valid(*match.groups())
+        match = _AT_RE.search(unquote(parsed.path))
+        if match:
+            return _valid(*match.groups())
+        for key in ('q', 'query', 'll', 'destination'):
+            if key in params:
+                match = _PAIR_RE.fullmatch(params[key][0].strip())
+                if match:
+                    return _valid(*match.groups())
+    except ValueError:
+        return None
+    return None
+
+
+def haversine_km(a, b):
+    """Great-circle distance between two ``(lat, lng)`` points in kilometres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def plan_route(points, start=None, time_budget=TWO_OPT_TIME_BUDGET):
+    """Return the visiting order (indexes into ``points``) of an open route.
+
+    The route starts at ``start`` (e.g. the branch) when given, otherwise at
+    the first point. A nearest-neighbour tour is built first and then improved
+    with 2-opt segment reversals until no reversal helps or the time budget is
+    spent.
+    """
+    n = len(points)
+    if n <= 2:
+        return list(range(n))
+
+    # Node n is the optional start; the matrix is built once and reused by 2-opt
+    nodes = list(points) + ([start] if start else [])
+    dist = [[haversine_km(a, b) for b in nodes] for a in nodes]
+
+    # Nearest neighbour
+    unvisited = set(range(n))
+    current = n if start else 0
+    route = [] if start else [0]
+    unvisited.discard(current)
+    while unvisited:
+        row = dist[current]
+        current = min(unvisited, key=row.__getitem__)
+        unvisited.discard(current)
+        route.append(current)
+
+    # 2-opt on the open path; with a fixed start the first stop may move too
+    path = ([n] if start else []) + route
+    first = 1
+    deadline = time.perf_counter() + time_budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        last = len(path) - 1
+        for i in range(first, last):
+            a, b = path[i - 1], path[i]
+            dist_a = dist[a]
+            base = dist_a[b]
+            for j in range(i + 1, last + 1):
+                c = path[j]
+                d = path[j + 1] if j < last else None
+                delta = dist_a[c] - base
+                if d is not None:
+                    delta += dist[b][d] - dist[c][d]
+                if delta < -1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    b = path[i]
+                    base = dist_a[b]
+                    improved = True
+    return path[1:] if start else path
+
+
+def route_length_km(points, order, start=None):
+    """Total length of visiting ``points`` in ``order``, from ``start`` when given."""
+    legs = ([start] if start else []) + [points[i] for i in order]
+    return sum(haversine_km(legs[k], legs[k + 1]) for k in range(len(legs) - 1))
+
+
+def manifest_cache_key(rider_id, day):
+    """Cache key of a rider's planned manifest for a day at the current version."""
+    version = cache.get_or_set(f'rider-manifest-version:{rider_id}', uuid.uuid4().hex, None)
+    return f'rider-manifest:{rider_id}:{day.isoformat()}:{version}'
+
+
+def invalidate_rider_manifests(*rider_ids):
+    """Drop every cached manifest of the given riders."""
+    for rider_id in {rider_id for rider_id in rider_ids if rider_id}:
+        cache.set(f'rider-manifest-version:{rider_id}', uuid.uuid4().hex, None)
+
+
+def build_manifest(deliveries, slots, start=None):
+    """Group deliveries by time slot and order each slot's stops.
+
+    ``slots`` is the ordered list of ``(value, label)`` time slots. Stops whose
+    map link carries no coordinates are kept at the end of their slot.
+    """
+    by_slot = {}
+    for delivery in deliveries:
+        by_slot.setdefault(delivery.delivery_time, []).append(delivery)
+
+    manifest = []
+    for slot, label in list(slots) + [(key, key) for key in by_slot if key not in dict(slots)]:
+        stops = by_slot.get(slot)
+        if not stops:
+            continue
+        located, unlocated = [], []
+        for delivery in stops:
+            point = parse_coordinates(delivery.map_link)
+            (located if point else unlocated).append((delivery, point))
+
+        points = [point for _, point in located]
+        order = plan_route(points, start=start)
+        sequence = [located[i] for i in order] + unlocated
+
+        entries, previous, total = [], start, 0.0
+        for position, (delivery, point) in enumerate(sequence, start=1):
+            leg = haversine_km(previous, point) if previous and point else None
+            if leg is not None:
+                total += leg
+            if point:
+                previous = point
+            entries.append({
+                'sequence': position,
+                'delivery_id': delivery.id,
+                'order_id': str(delivery.order_id),
+                'delivery_type': delivery.delivery_type,
+                'status': delivery.status,
+                'address': delivery.delivery_address,
+                'contact': delivery.delivery_contact,
+                'map_link': delivery.map_link,
+                'latitude': point[0] if point else None,
+                'longitude': point[1] if point else None,
+                'leg_km': round(leg, 3) if leg is not None else None,
+            })
+        manifest.append({
+            'slot': slot,
+            'label': label,
+            'stops': entries,
+            'distance_km': round(total, 3),
+        })
+    return manifest
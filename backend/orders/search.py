@@ -0,0 +1,258 @@
+"""Full-text search over orders, customers and payments.
+
+Each searchable record has one SearchDocument row (kind, object id, scope and
+text). On SQLite the FTS5 table ``orders_searchdocument_fts`` mirrors the
+documents' title/body through triggers (see migration 0025) using the trigram
+tokenizer, so a query matches substrings the way the old ``icontains`` filters
+did, but through the index and ranked with bm25. Other databases fall back to
+``icontains`` over the document bodies.
+
+Documents are refreshed from the model signals in orders/models.py and the
+bulk_create overrides; ``rebuild_search_index`` recreates them all.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+
+from .models import Order, OrderItem, SearchDocument
+
+FTS_TABLE = 'orders_searchdocument_fts'
+MIN_TERM_LENGTH = 3  # the trigram tokenizer cannot match shorter terms
+MAX_RESULTS = 50
+
+
+def fts_available():
+    """Return True if the FTS5 table exists (SQLite only)."""
+    return connection.vendor == 'sqlite'
+
+
+def _upsert(documents):
+    SearchDocument.objects.bulk_create(
+        documents, batch_size=500, update_conflicts=True, unique_fields=['kind', 'object_id'],
+        update_fields=['branch', 'customer', 'title', 'body', 'updated_at'],
+    )
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part)
+
+
+# Fields each kind's document is built from (text and scope); saves that change none are not reindexed
+INDEXED_FIELDS = {
+    'order': ('description', 'status', 'branch_id', 'customer_name_id'),
+    'item': ('order_id', 'service_type', 'material', 'wash_type'),
+    'payment': ('transaction_uuid', 'transaction_code', 'ref_id', 'total_amount', 'branch_id', 'user_id'),
+    'customer': ('first_name', 'last_name', 'email', 'phone', 'role'),
+}
+
+
+def indexed_fields_changed(kind, instance, stored):
+    """Return True if saving ``instance`` changed what its document is built from.
+
+    ``stored`` holds the row's values from before the save (None for a new row).
+    """
+    return stored is None or any(getattr(instance, field) != stored[field] for field in INDEXED_FIELDS[kind])
+
+
+def remove_documents(kind, object_ids):
+    """Drop the documents of deleted records."""
+    SearchDocument.objects.filter(kind=kind, object_id__in=[str(pk) for pk in object_ids]).delete()
+
+
+def index_orders(order_ids):
+    """(Re)index orders with their items and customer details."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    items = {}
+    for order_id, service_type, material, wash_type in OrderItem.objects.filter(
+        order_id__in=order_ids
+    ).values_list('order_id', 'service_type', 'material', 'wash_type'):
+        items.setdefault(order_id, []).extend([service_type, material, wash_type])
+
+    documents = []
+    for order in Order.objects.filter(pk__in=order_ids).select_related('customer_name'):
+        customer = order.customer_name
+        documents.append(SearchDocument(
+            kind='order', object_id=str(order.order_id),
+            branch_id=order.branch_id, customer_id=order.customer_name_id,
+            title=f"Order #{str(order.order_id)[:8]} - {customer.get_full_name()}",
+            body=_join(order.order_id, order.description, order.status,
+                       *items.get(order.order_id, ()),
+                       customer.get_full_name(), customer.email, customer.phone),
+        ))
+    _upsert(documents)
+
+
+def index_customers(user_ids):
+    """(Re)index customers. Returns the ids whose indexed text changed."""
+    User = get_user_model()
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    stored = dict(SearchDocument.objects.filter(
+        kind='customer', object_id__in=[str(pk) for pk in user_ids]
+    ).values_list('object_id', 'body'))
+
+    documents, changed, others = [], [], []
+    for user in User.objects.filter(pk__in=user_ids):
+        if user.role != 'customer':
+            others.append(user.pk)
+            continue
+        body = _join(user.get_full_name(), user.email, user.phone)
+        if stored.get(str(user.pk)) == body:
+            continue
+        changed.append(user.pk)
+        documents.append(SearchDocument(
+            kind='customer', object_id=str(user.pk), customer_id=user.pk,
+            title=user.get_full_name() or user.email, body=body,
+        ))
+    _upsert(documents)
+    remove_documents('customer', others)
+    return changed
+
+
+def index_payments(payment_ids):
+    """(Re)index payments by their references.
+
+    Only the references go in the body: a listing filtered with
+    ``matching_ids`` must not match every payment on the customer's name or on
+    words like "esewa" or "complete". Customers are found through their own
+    documents.
+    """
+    from payments.models import Payment
+
+    payment_ids = list(payment_ids)
+    if not payment_ids:
+        return
+    documents = []
+    for payment in Payment.objects.filter(pk__in=payment_ids):
+        documents.append(SearchDocument(
+            kind='payment', object_id=str(payment.pk),
+            branch_id=payment.branch_id, customer_id=payment.user_id,
+            title=f"Payment {payment.transaction_uuid} - Rs.{payment.total_amount}",
+            body=_join(payment.transaction_uuid, payment.transaction_code, payment.ref_id),
+        ))
+    _upsert(documents)
+
+
+def reindex_customer(user_id):
+    """Refresh a customer's document, and their orders if their details changed."""
+    if index_customers([user_id]):
+        index_orders(Order.objects.filter(customer_name_id=user_id).values_list('pk', flat=True))
+
+
+def rebuild_index(batch_size=1000):
+    """Recreate every document from scratch. Returns ``{kind: count}``."""
+    from payments.models import Payment
+    User = get_user_model()
+
+    sources = [
+        ('order', Order.objects.all(), index_orders),
+        ('customer', User.objects.filter(role='customer'), index_customers),
+        ('payment', Payment.objects.all(), index_payments),
+    ]
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for _, queryset, index in sources:
+            ids = list(queryset.values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                index(ids[start:start + batch_size])
+        if fts_available():
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return {kind: SearchDocument.objects.filter(kind=kind).count() for kind, _, _ in sources}
+
+
+def search_terms(text):
+    """Split a query into the terms the index can match."""
+    return [term for term in re.findall(r'\S+', text or '') if len(term) >= MIN_TERM_LENGTH]
+
+
+def documents_for(user):
+    """Return the documents ``user`` may see, scoped like the order views."""
+    documents = SearchDocument.objects.all()
+
+    # Admin sees everything
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return documents
+
+    # Branch manager sees their branch's orders and payments, and the customers who ordered there
+    if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+        branch = user.branchmanager.branch
+        ordered_here = Order.objects.filter(branch=branch, customer_name_id=models.OuterRef('customer_id'))
+        return documents.filter(
+            models.Q(branch=branch) | models.Q(kind='customer', customer__isnull=False) & models.Exists(ordered_here)
+        )
+
+    # Customers see only their own records
+    return documents.filter(customer=user)
+
+
+def search(user, text, kinds=None, limit=20):
+    """Return the best matching documents visible to ``user``, best first.
+
+    Every term must match (as a substring). Each result is a dict with kind,
+    object_id, title, snippet and rank (lower is better).
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+    scoped = documents_for(user)
+    if kinds:
+        scoped = scoped.filter(kind__in=kinds)
+
+    if not fts_available():
+        for term in terms:
+            scoped = scoped.filter(body__icontains=term)
+        return [
+            {'kind': kind, 'object_id': object_id, 'title': title, 'snippet': body[:120], 'rank': 0.0}
+            for kind, object_id, title, body in scoped.order_by('-updated_at').values_list(
+                'kind', 'object_id', 'title', 'body'
+            )[:limit]
+        ]
+
+    match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    scope_sql, scope_params = scoped.values('id').query.sql_with_params()
+    sql = (
+        f"SELECT d.kind, d.object_id, d.title, snippet({FTS_TABLE}, 1, '[', ']', '...', 16), "
+        f"bm25({FTS_TABLE}, 5.0, 1.0) AS rank "
+        f"FROM {FTS_TABLE} JOIN {SearchDocument._meta.db_table} d ON d.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND d.id IN ({scope_sql}) "
+        f"ORDER BY rank LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *scope_params, limit])
+        rows = cursor.fetchall()
+    return [
+        {'kind': kind, 'object_id': object_id, 'title': title, 'snippet': snippet, 'rank': rank}
+        for kind, object_id, title, snippet, rank in rows
+    ]
+
+
+def matching_ids(user, kind, text, phrase=False):
+    """Return a queryset of the object ids of ``kind`` matching ``text`` (for filtering listings).
+
+    Only the body is matched, as in the ``icontains`` fallback; titles are for
+    display. With ``phrase`` the whole text must occur as one substring, like
+    the ``icontains`` filters such listings used, instead of every term
+    matching somewhere.
+    """
+    if phrase:
+        text = (text or '').strip()
+        terms = [text] if len(text) >= MIN_TERM_LENGTH else []
+    else:
+        terms = search_terms(text)
+    scoped = documents_for(user).filter(kind=kind)
+    if not terms:
+        return scoped.none().values_list('object_id', flat=True)
+    if not fts_available():
+        for term in terms:
+            scoped = scoped.filter(body__icontains=term)
+        return scoped.values_list('object_id', flat=True)
+    match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    return scoped.filter(id__in=models.expressions.RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (f'body : ({match})',)
+    )).values_list('object_id', flat=True)
@@ -1,9 +1,10 @@
 """Serializers for the orders application, defining how Order and Delivery
 models are serialized for API responses."""
 from rest_framework import serializers
-from .models import Order, Delivery, OrderItem, UserAddress
+from .models import Order, Delivery, OrderItem, UserAddress, OrderStatusEvent, SlotCapacity
 from django.contrib.auth import get_user_model
-from datetime import datetime
+from datetime import datetime, time
+from branches.models import Branch
 
 User = get_user_model()
 
@@ -21,6 +22,9 @@ class OrderSerializer(serializers.ModelSerializer):
     branch_name = serializers.CharField(source='branch.name', read_only=True)
     id = serializers.UUIDField(source='order_id', read_only=True)
     created = serializers.DateTimeField(source='order_date', read_only=True)
+    amount_paid = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    outstanding_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    is_archived = serializers.BooleanField(read_only=True)
 
     # pickup_date and delivery_date are serialized directly from Order model (DateField)
     # pickup_time and delivery_time are computed from Delivery model's time slot strings
@@ -38,13 +42,43 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'order_id', 'customer_name', 'branch', 'branch_name', 'pickup_requested', 
             'order_date', 'created', 'pickup_enabled', 'delivery_enabled', 'delivery_date', 
             'status', 'description', 'total_amount', 'discount', 'is_urgent', 'payment_method', 
-            'payment_status', 'services', 'pickup_date',
+            'payment_status', 'amount_paid', 'outstanding_amount', 'services', 'pickup_date',
             'pickup_time', 'pickup_address', 'pickup_map_link',
-            'delivery_time', 'delivery_address', 'delivery_map_link', 'delivery_contact'
+            'delivery_time', 'delivery_address', 'delivery_map_link', 'delivery_contact', 'is_archived'
         ]
 
+    def validate_status(self, value):
+        """Only allow status changes listed in ORDER_STATUS_TRANSITIONS."""
+        if self.instance is not None and not self.instance.can_transition_to(value):
+            raise serializers.ValidationError(
+                f"Cannot change order status from '{self.instance.status}' to '{value}'"
+            )
+        return value
+
     def get_pickup_delivery(self, obj, delivery_type):
-        return obj.deliveries.filter(delivery_type=delivery_type).first()
+        """Return the first delivery of the given type, resolved from memory.
+
+        The deliveries are read once per order through ``obj.deliveries.all()``,
+        which hits the prefetch cache when the queryset was built with
+        ``Order.objects.for_serialization()``.
+        """
+        deliveries = getattr(obj, '_deliveries_by_type', None)
+        if deliveries is None:
+            deliveries = {}
+            for delivery in obj.deliveries.all():
+                deliveries.setdefault(delivery.delivery_type, delivery)
+            obj._deliveries_by_type = deliveries
+        return deliveries.get(delivery_type)
+
+    def get_address_map_link(self, obj, address):
+        """Look up the map link saved on the customer's matching UserAddress."""
+        map_links = getattr(obj, '_address_map_links', None)
+        if map_links is None:
+            map_links = {}
+            for user_address in obj.customer_name.addresses.all():
+                map_links.setdefault(user_address.address, user_address.map_link)
+            obj._address_map_links = map_links
+        return map_links.get(address) or None
 
     def get_pickup_time(self, obj):
         """Get the pickup time slot string from the Delivery model."""
@@ -61,14 +95,7 @@ class OrderSerializer(serializers.ModelSerializer):
         """Get the map link for pickup address."""
         delivery = self.get_pickup_delivery(obj, 'pickup')
         if delivery:
-            # Try to find map link from UserAddress if address matches
-            from orders.models import UserAddress
-            user_address = UserAddress.objects.filter(
-                user=obj.customer_name,
-                address=delivery.delivery_address
-            ).first()
-            if user_address and user_address.map_link:
-                return user_address.map_link
+            return self.get_address_map_link(obj, delivery.delivery_address)
         return None
 
     def get_delivery_time(self, obj):
@@ -86,14 +113,7 @@ class OrderSerializer(serializers.ModelSerializer):
         """Get the map link for delivery address."""
         delivery = self.get_pickup_delivery(obj, 'drop')
         if delivery:
-            # Try to find map link from UserAddress if address matches
-            from orders.models import UserAddress
-            user_address = UserAddress.objects.filter(
-                user=obj.customer_name,
-                address=delivery.delivery_address
-            ).first()
-            if user_address and user_address.map_link:
-                return user_address.map_link
+            return self.get_address_map_link(obj, delivery.delivery_address)
         return None
 
     def get_delivery_contact(self, obj):
@@ -144,9 +164,88 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'is_urgent', 'total_amount', 'discount', 'payment_method', 'payment_status', 'description'
         ]
 
-    def create(self, validated_data):
+    SLOT_START_TIMES = {
+        'early_morning': time(6, 0),
+        'late_morning': time(9, 0),
+        'early_afternoon': time(12, 0),
+        'late_afternoon': time(15, 0),
+    }
+
+    @staticmethod
+    def load_user_addresses(user):
+        """Load the user's saved addresses once, default addresses first."""
+        return list(UserAddress.objects.filter(user=user).order_by('-is_default', 'id'))
+
+    @staticmethod
+    def resolve_default_address(addresses, address_types):
+        """Pick the first preloaded address matching one of ``address_types``."""
+        for user_address in addresses:
+            if user_address.address_type in address_types:
+                return user_address
+        return None
+
+    @classmethod
+    def get_start_time(cls, date_val, time_slot):
+        """Helper to calculate start time from date + slot."""
+        if date_val and time_slot and time_slot in cls.SLOT_START_TIMES:
+            # date_val might be datetime now, so use .date() if it is
+            d = date_val.date() if isinstance(date_val, datetime) else date_val
+            return datetime.combine(d, cls.SLOT_START_TIMES[time_slot])
+        return None
+
+    def validate(self, attrs):
+        """Check the client's prices and total against the pricing matrix.
+
+        Every item needs a wash type and an active pricing rule, and must carry
+        the rule's unit price; its total_price must be quantity × price_per_unit,
+        and total_amount must be the matrix subtotal plus the pickup, delivery
+        and urgent costs less the discount. The client's prices are only ever
+        compared, never added up.
+        """
+        from services.pricing import get_matrix
+
+        services = attrs.get('services') or []
+        quote = get_matrix().quote(
+            services, pickup=attrs.get('pickup_enabled', False), delivery=attrs.get('delivery_enabled', False),
+            urgent=attrs.get('is_urgent', False), discount=attrs.get('discount') or 0,
+        )
+
+        item_errors = [{} for _ in services]
+        for item, line, errors in zip(services, quote['items'], item_errors):
+            if not item.get('wash_type'):
+                errors['wash_type'] = ['This field is required.']
+                continue
+            if line['unit_price'] is None:
+                errors['non_field_errors'] = [
+                    f"No active price for {item['wash_type']} / {item['service_type']} / {item['material']}."
+                ]
+                continue
+            if item['price_per_unit'] != line['unit_price']:
+                errors['price_per_unit'] = [f"Price per unit must be {line['unit_price']}."]
+                continue
+            if item['total_price'] != item['price_per_unit'] * item['quantity']:
+                errors['total_price'] = [f"Total price must be {item['price_per_unit'] * item['quantity']}."]
+
+        errors = {}
+        if any(item_errors):
+            errors['services'] = item_errors
+        else:
+            if attrs.get('total_amount') != quote['total']:
+                errors['total_amount'] = [f"Total amount must be {quote['total']}."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def build_instances(self, validated_data, user, branch, addresses):
+        """Build the unsaved Order, OrderItem and Delivery rows for one order.
+
+        ``addresses`` is the user's preloaded address list (see
+        ``load_user_addresses``), so building many orders for the same user
+        costs no extra queries. Returns ``(order, items, deliveries)``.
+        """
+        validated_data = dict(validated_data)
         services_data = validated_data.pop('services')
-        branch_id = validated_data.pop('branch')
+        validated_data.pop('branch', None)
 
         # Extract pickup/delivery details from request
         pickup_date = validated_data.pop('pickup_date', None)
@@ -158,69 +257,28 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         delivery_time = validated_data.pop('delivery_time', None)
         delivery_address = validated_data.pop('delivery_address', None)
         delivery_map_link = validated_data.pop('delivery_map_link', None)
-        
-        # Get user from request context (authenticated user)
-        request = self.context.get('request')
-        if not request or not request.user.is_authenticated:
-            raise serializers.ValidationError("Authentication required to create an order")
-        
-        user = request.user
 
-        # Resolve Pickup Address
+        # Resolve Pickup Address from the user's default pickup address
         if not pickup_address:
-            # Try to get default pickup address from user profile
-            # Try to get default pickup address from user profile
-            from orders.models import UserAddress
-            user_address = UserAddress.objects.filter(
-                user=user, 
-                address_type__in=['pickup', 'both']
-            ).order_by('-is_default').first()
-            
+            user_address = self.resolve_default_address(addresses, ('pickup', 'both'))
             if user_address:
                 pickup_address = user_address.address
                 if not pickup_map_link:
                     pickup_map_link = user_address.map_link
 
-        # Resolve Delivery Address
+        # Resolve Delivery Address from the user's default delivery address
         if not delivery_address:
-            # Try to get default delivery address from user profile
-            # Try to get default delivery address from user profile
-            from orders.models import UserAddress
-            user_address = UserAddress.objects.filter(
-                user=user, 
-                address_type__in=['delivery', 'both']
-            ).order_by('-is_default').first()
-            
+            user_address = self.resolve_default_address(addresses, ('delivery', 'both'))
             if user_address:
                 delivery_address = user_address.address
                 if not delivery_map_link:
                     delivery_map_link = user_address.map_link
 
-        # Get branch instance
-        try:
-            from branches.models import Branch
-            branch = Branch.objects.get(id=branch_id)
-        except Branch.DoesNotExist:
-            raise serializers.ValidationError(f"Branch with id {branch_id} does not exist")
-
-        # Map slots to times for starting time calculation
-        from datetime import time
-        SLOT_START_TIMES = {
-            'early_morning': time(6, 0),
-            'late_morning': time(9, 0),
-            'early_afternoon': time(12, 0),
-            'late_afternoon': time(15, 0),
-        }
-
-        # Calculate delivery datetime for Delivery model (not Order model)
-        # Order.delivery_date is a DateField, so we pass the date directly
-        # The datetime calculation is used for Delivery.delivery_start_time later
-        
         # Create the order
         status = 'pending pickup' if validated_data.get('pickup_enabled') else 'dropped by user'
 
         # Must include the popped time strings in the create call for the Order model
-        order = Order.objects.create(
+        order = Order(
             customer_name=user,
             branch=branch,
             delivery_date=delivery_date,  # Pass datetime object
@@ -231,43 +289,92 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-        # Helper to calculate start time from date + slot
-        def get_start_time(date_val, time_slot):
-            if date_val and time_slot and time_slot in SLOT_START_TIMES:
-                # date_val might be datetime now, so use .date() if it is
-                d = date_val.date() if isinstance(date_val, datetime) else date_val
-                return datetime.combine(d, SLOT_START_TIMES[time_slot])
-            return None
-
-        # Create order items
-        for service_data in services_data:
-            OrderItem.objects.create(order=order, **service_data)
+        items = [OrderItem(order=order, **service_data) for service_data in services_data]
 
         # Create Delivery objects (Snapshot of address)
+        deliveries = []
         if order.pickup_enabled:
-            Delivery.objects.create(
+            deliveries.append(Delivery(
                 order=order,
                 delivery_address=pickup_address or "No address provided",
                 delivery_contact=user.phone or "",  # Handle None phone
                 delivery_type='pickup',
                 status='pending',
-                delivery_start_time=get_start_time(pickup_date, pickup_time),
+                delivery_start_time=self.get_start_time(pickup_date, pickup_time),
                 delivery_time=pickup_time, # Store the slot string
                 map_link=pickup_map_link
-            )
+            ))
             
         if order.delivery_enabled:
-            Delivery.objects.create(
+            deliveries.append(Delivery(
                 order=order,
                 delivery_address=delivery_address or "No address provided",
                 delivery_contact=user.phone or "",  # Handle None phone
                 delivery_type='drop',
                 status='pending',
-                delivery_start_time=get_start_time(delivery_date, delivery_time),
+                delivery_start_time=self.get_start_time(delivery_date, delivery_time),
                 delivery_time=delivery_time, # Store the slot string
                 map_link=delivery_map_link
-            )
+            ))
+
+        return order, items, deliveries
+
+    @staticmethod
+    def reserve_slots(branch_id, deliveries):
+        """Take a place in each delivery's time slot.
+
+        Either every slot is reserved (and the deliveries are marked so their
+        signals do not count them again) or none is, and a ``{field: [error]}``
+        dict naming the full slots is returned. Call inside a transaction.
+        """
+        needed = {}
+        for delivery in deliveries:
+            key = delivery.slot_key(branch_id)
+            if key:
+                needed.setdefault(key, []).append(delivery)
+
+        taken, errors = [], {}
+        for key, slot_deliveries in needed.items():
+            if SlotCapacity.reserve(*key, count=len(slot_deliveries)):
+                taken.append((key, len(slot_deliveries)))
+                continue
+            for delivery in slot_deliveries:
+                field = 'pickup_time' if delivery.delivery_type == 'pickup' else 'delivery_time'
+                errors[field] = [f"The {key[2].replace('_', ' ')} slot on {key[1].isoformat()} is fully booked."]
+        if errors:
+            for key, count in taken:
+                SlotCapacity.record(*key, -count)
+            return errors
+
+        for slot_deliveries in needed.values():
+            for delivery in slot_deliveries:
+                delivery._slot_reserved = True
+        return None
+
+    def create(self, validated_data):
+        # Get user from request context (authenticated user)
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            raise serializers.ValidationError("Authentication required to create an order")
+        
+        user = request.user
+        branch_id = validated_data['branch']
+
+        # Get branch instance
+        try:
+            branch = Branch.objects.get(id=branch_id)
+        except Branch.DoesNotExist:
+            raise serializers.ValidationError(f"Branch with id {branch_id} does not exist")
 
+        order, items, deliveries = self.build_instances(
+            validated_data, user, branch, self.load_user_addresses(user)
+        )
+        errors = self.reserve_slots(branch.id, deliveries)
+        if errors:
+            raise serializers.ValidationError(errors)
+        order.save()
+        OrderItem.objects.bulk_create(items)
+        Delivery.objects.bulk_create(deliveries)
         return order
 
 
@@ -295,23 +402,39 @@ class DeliverySerializer(serializers.ModelSerializer):
         if obj.map_link:
             return obj.map_link
             
-        # Try to find map link from UserAddress if address matches
-        from orders.models import UserAddress
-        user_address = UserAddress.objects.filter(
-            user=obj.order.customer_name, # Map to order creator (user)
-            address=obj.delivery_address
-        ).first()
-        if user_address and user_address.map_link:
-            return user_address.map_link
+        # Try to find map link from UserAddress if address matches.
+        # Iterating .all() reuses the prefetched addresses of the order creator.
+        for user_address in obj.order.customer_name.addresses.all():
+            if user_address.address == obj.delivery_address:
+                return user_address.map_link or None
         return None
 
 
+class OrderStatusEventSerializer(serializers.ModelSerializer):
+    """Serializer for entries of an order's status timeline."""
+    actor_email = serializers.CharField(source='actor.email', read_only=True, default=None)
+    time_in_previous_status = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderStatusEvent
+        fields = [
+            'id', 'order', 'from_status', 'to_status', 'actor', 'actor_email', 'note',
+            'created_at', 'time_in_previous_status'
+        ]
+
+    def get_time_in_previous_status(self, obj):
+        """Return the time spent in from_status in seconds."""
+        if obj.time_in_previous_status is None:
+            return None
+        return obj.time_in_previous_status.total_seconds()
+
+
 class UserAddressSerializer(serializers.ModelSerializer):
     """Serializer for UserAddress model."""
     class Meta:
         model = UserAddress
-        fields = ['id', 'address', 'map_link', 'address_type', 'is_default']
-        read_only_fields = ['id']
+        fields = ['id', 'address', 'map_link', 'latitude', 'longitude', 'address_type', 'is_default']
+        read_only_fields = ['id', 'latitude', 'longitude']
 
     def create(self, validated_data):
         """Create a new user address."""
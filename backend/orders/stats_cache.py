@@ -0,0 +1,112 @@
+"""Response cache for OrderStatsView.
+
+Responses are cached per scope (everything, one branch or one customer) and
+time range under the scope's current version. Order and OrderItem writes bump
+the versions of the branch and customer they touch and the global version
+(see the signals in orders/models.py and the bulk write paths), so a cached
+response is never served after a write it does not reflect. That holds across
+worker processes only when the default cache is shared between them
+(CACHE_URL, see settings.py); with the per-process LocMemCache another
+worker may serve its own copy for up to STATS_CACHE_TIMEOUT. The timeout
+otherwise only bounds how long "today" and the range windows may lag behind
+the clock.
+
+A miss is computed once: the first request takes a short lock with
+``cache.add`` and computes, concurrent requests for the same key wait for its
+result instead of recomputing, and fall back to computing themselves if the
+lock holder takes too long. Hits, misses and coalesced waits are counted;
+the counts are approximate on backends without an atomic ``incr``.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+STATS_CACHE_TIMEOUT = 60
+LOCK_TIMEOUT = 30  # seconds a computing request holds the lock at most
+LOCK_WAIT = 5.0  # seconds a request waits for another one's result
+LOCK_POLL = 0.05
+COUNTERS = ('hits', 'misses', 'coalesced')
+GLOBAL_SCOPE = 'all'
+
+
+def _version_key(scope):
+    return f'order-stats-version:{scope}'
+
+
+def scope_version(scope):
+    """Current version of a scope's cached stats."""
+    return cache.get_or_set(_version_key(scope), uuid.uuid4().hex, None)
+
+
+def _bump(scopes):
+    cache.set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def invalidate(branch_ids=(), customer_ids=()):
+    """Invalidate the cached stats of the given branches and customers (and the global stats).
+
+    The versions are bumped now and again when the current transaction
+    commits, so a request that recomputes before the commit cannot leave stale
+    numbers under the new version.
+    """
+    scopes = {GLOBAL_SCOPE}
+    scopes.update(f'branch:{branch_id}' for branch_id in branch_ids if branch_id)
+    scopes.update(f'customer:{customer_id}' for customer_id in customer_ids if customer_id)
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _count(counter):
+    key = f'order-stats-cache:{counter}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def counters():
+    """Return the hit, miss and coalesced-wait counts."""
+    values = cache.get_many([f'order-stats-cache:{counter}' for counter in COUNTERS])
+    return {counter: values.get(f'order-stats-cache:{counter}', 0) for counter in COUNTERS}
+
+
+def invalidate_all():
+    """Invalidate every cached stats response (after rebuilding the rollups)."""
+    _bump(['epoch'])
+
+
+def get_or_compute(scope, time_range, compute):
+    """Return ``(data, outcome)`` for a scope and range, computing on a miss.
+
+    outcome is 'hit', 'miss' or 'coalesced' (served from a concurrent miss).
+    """
+    key = f'order-stats:{scope}:{time_range}:{scope_version("epoch")}:{scope_version(scope)}'
+    data = cache.get(key)
+    if data is not None:
+        _count('hits')
+        return data, 'hit'
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Someone else is computing this key: wait for their result
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            data = cache.get(key)
+            if data is not None:
+                _count('coalesced')
+                return data, 'coalesced'
+        _count('misses')
+        return compute(), 'miss'
+
+    try:
+        _count('misses')
+        data = compute()
+        cache.set(key, data, STATS_CACHE_TIMEOUT)
+        return data, 'miss'
+    finally:
+        cache.delete(lock_key)
@@ -1,14 +1,39 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from rest_framework.test import APIClientfrom rest_framework import status
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
 from django.contrib.auth import get_user_model
 from branches.models import Branch
-from .models import Order
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from payments.models import Payment
+from .models import (
+    Order, OrderItem, BranchDailyStats, Delivery, UserAddress, OrderPayment, CustomerSpend, CustomerLifetimeSpend,
+    BranchDailyServiceStats, OrderStatusEvent, RiderLoad, SlotCapacity, ArchivedOrder, ArchivedOrderPayment,
+    applied_amount_subquery, StatusUpdate,
+)
 
 User = get_user_model()
 
 class OrderCreateTest(TestCase):
     def setUp(self):
+        from services.models import ClothName, ClothType, PricingRule, WashType
+        from services.pricing import invalidate_matrix
+
+        self.addCleanup(invalidate_matrix)
+        PricingRule.objects.create(wash_type=WashType.objects.create(name='Normal Wash'),
+                                   cloth_name=ClothName.objects.create(name='Shirt'),
+                                   cloth_type=ClothType.objects.create(name='Cotton'), price=100)
         self.client = APIClient()
         self.user = User.objects.create_user(
             email='test@example.com',
@@ -33,6 +58,7 @@ class OrderCreateTest(TestCase):
             'services': [
                 {
                     'service_type': 'Shirt',
+                    'wash_type': 'Normal Wash',
                     'material': 'Cotton',
                     'quantity': 2,
                     'pricing_type': 'individual',
@@ -67,13 +93,864 @@ class OrderCreateTest(TestCase):
             customer_name=self.user,
             branch=self.branch,
             total_amount=100.00,
-            status='pending'
+            status='dropped by user'
         )
         
         url = reverse('order-update', kwargs={'pk': order.order_id})
-        payload = {'status': 'completed'}
+        payload = {'status': 'in wash'}
         response = self.client.patch(url, payload, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         order.refresh_from_db()
-        self.assertEqual(order.status, 'completed')
+        self.assertEqual(order.status, 'in wash')
+
+        # Skipping ahead is not a legal transition
+        response = self.client.patch(url, {'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'in wash')
+
+        # Orders still on a status from before the current workflow can move onto it
+        Order.objects.filter(pk=order.pk).update(status='pending')
+        response = self.client.patch(url, {'status': 'in wash'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class OrderPricingValidationTest(TestCase):
+    def setUp(self):
+        from services.models import ClothName, ClothType, PricingRule, WashType
+
+        OrderCreateTest.setUp(self)
+        PricingRule.objects.create(wash_type=WashType.objects.create(name='Dry Wash'),
+                                   cloth_name=ClothName.objects.get(name='Shirt'),
+                                   cloth_type=ClothType.objects.get(name='Cotton'), price=150)
+        self.valid_payload['services'][0].update(wash_type='Dry Wash', price_per_unit=150.00, total_price=300.00)
+        self.valid_payload.update(is_urgent=True, discount=50.00, total_amount=750.00)
+
+    def test_order_priced_by_the_matrix_is_created(self):
+        response = self.client.post(reverse('order-create'), self.valid_payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get().total_amount, 750)
+
+    def test_tampered_prices_and_totals_are_rejected(self):
+        url = reverse('order-create')
+        item = dict(self.valid_payload['services'][0], price_per_unit=1.00, total_price=2.00)
+        response = self.client.post(url, dict(self.valid_payload, services=[item], total_amount=452.00),
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('price_per_unit', response.data['services'][0])
+
+        response = self.client.post(url, dict(self.valid_payload, total_amount=250.00), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['total_amount'], ['Total amount must be 750.00.'])
+
+        # Items the matrix cannot price are refused rather than taken at the client's price
+        for tampered in ({'wash_type': None}, {'wash_type': 'Gold Wash'}, {'material': 'Unobtainium'}):
+            item = dict(self.valid_payload['services'][0], **tampered)
+            response = self.client.post(url, dict(self.valid_payload, services=[item]), format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, tampered)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderListQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='list@example.com',
+            password='testpassword',
+            first_name='List',
+            last_name='User',
+            phone='9841234568'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.branch = Branch.objects.create(
+            name='List Branch',
+            branch_id='LIST001',
+            city='Kathmandu',
+            address='Test Address',
+            phone='012345678',
+            opening_date='2023-01-01'
+        )
+        UserAddress.objects.create(
+            user=self.user, address='Home', map_link='https://maps.example.com/home'
+        )
+
+    def _create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                customer_name=self.user,
+                branch=self.branch,
+                total_amount=100.00,
+                pickup_enabled=True,
+                delivery_enabled=True,
+            )
+            OrderItem.objects.create(
+                order=order, service_type='Shirt', material='Cotton',
+                quantity=1, price_per_unit=100.00, total_price=100.00
+            )
+            for delivery_type in ('pickup', 'drop'):
+                Delivery.objects.create(
+                    order=order, delivery_address='Home', delivery_contact='9841234568',
+                    delivery_type=delivery_type
+                )
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('order-list'), {'page': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self._create_orders(1)
+        self._count_list_queries()  # warm per-user lookups such as the branchmanager check
+        single_row_queries, _ = self._count_list_queries()
+
+        self._create_orders(5)
+        many_rows_queries, response = self._count_list_queries()
+
+        self.assertEqual(single_row_queries, many_rows_queries)
+        first = response.data['results'][0]
+        self.assertEqual(first['pickup_address'], 'Home')
+        self.assertEqual(first['delivery_map_link'], 'https://maps.example.com/home')
+
+    def test_cursor_pagination_walks_every_order_once(self):
+        self._create_orders(25)
+        seen = []
+        url = reverse('order-list')
+        params = {'page_size': 10}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            url, params = response.data['next'], None
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+        # Tampered cursors are a 404, not a server error
+        for raw in ('2025-01-01T00:00:00|garbage', 'garbage', '2025-01-01T00:00:00'):
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            response = self.client.get(reverse('order-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, raw)
+        response = self.client.get(reverse('payment_history'), {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_pagination_still_available(self):
+        self._create_orders(3)
+        response = self.client.get(reverse('order-list'), {'page': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+
+
+class BulkOrderCreateTest(TestCase):
+    setUp = OrderCreateTest.setUp
+
+    def test_bulk_create_reports_per_order_results_and_is_idempotent(self):
+        url = reverse('order-bulk-create')
+        invalid = dict(self.valid_payload, branch=999999, idempotency_key='hotel-3')
+        payload = {'orders': [
+            dict(self.valid_payload, idempotency_key='hotel-1'),
+            dict(self.valid_payload, idempotency_key='hotel-2', pickup_enabled=True,
+                 pickup_time='early_morning', total_amount=400.00),
+            invalid,
+        ]}
+
+        response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'created', 'invalid'])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(Delivery.objects.filter(delivery_type='pickup').count(), 1)
+
+        replay = self.client.post(url, payload, format='json')
+
+        self.assertEqual([r['status'] for r in replay.data['results']], ['duplicate', 'duplicate', 'invalid'])
+        self.assertEqual(replay.data['results'][0]['order_id'], response.data['results'][0]['order_id'])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class OrderAmountPaidTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=500)
+        self.payment = Payment.objects.create(user=self.user, total_amount=500, amount=500, status='COMPLETE')
+
+    def test_amount_paid_follows_order_payment_writes(self):
+        first = OrderPayment.objects.create(order=self.order, payment=self.payment, amount_applied=200)
+        OrderPayment.objects.bulk_create([
+            OrderPayment(order=self.order, payment=self.payment, amount_applied=100),
+        ])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.amount_paid, 300)
+        self.assertEqual(self.order.outstanding_amount, 200)
+
+        first.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.amount_paid, 100)
+
+    def test_stale_order_save_does_not_overwrite_amount_paid(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        OrderPayment.objects.create(order=self.order, payment=self.payment, amount_applied=250)
+        stale.status = 'in wash'
+        stale.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.amount_paid, 250)
+
+    def test_rebuild_command_repairs_drift(self):
+        OrderPayment.objects.create(order=self.order, payment=self.payment, amount_applied=150)
+        Order.objects.filter(pk=self.order.pk).update(amount_paid=0)
+
+        call_command('rebuild_order_paid_amounts', stdout=StringIO())
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.amount_paid, 150)
+
+
+class PaymentAllocationTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+
+    def _payment(self, amount, **fields):
+        return Payment.objects.create(user=self.user, branch=self.branch, total_amount=amount, amount=amount,
+                                      **fields)
+
+    def _allocate_queries(self, order_count):
+        from .allocation import allocate_payment
+
+        Order.objects.bulk_create([
+            Order(customer_name=self.user, branch=self.branch, total_amount=100) for _ in range(order_count)
+        ])
+        payment = self._payment(100 * order_count - 50, status='COMPLETE')
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            allocations = allocate_payment(payment)
+        self.assertEqual(len(allocations), order_count)
+        Order.objects.all().delete()
+        return len(queries)
+
+    def test_payment_settles_orders_oldest_first(self):
+        orders = [Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=amount)
+                  for amount in (100, 200, 300)]
+        Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=999, payment_status='paid')
+        payment = self._payment(250, payment_type='esewa')
+
+        response = self.client.post(reverse('process_payment', args=[payment.transaction_uuid]))
+
+        self.assertEqual(response.status_code, 200)
+        for order in orders:
+            order.refresh_from_db()
+        self.assertEqual([(o.amount_paid, o.payment_status) for o in orders],
+                         [(100, 'paid'), (150, 'partially_paid'), (0, 'pending')])
+        self.assertEqual([o.payment_method for o in orders], ['esewa', 'esewa', 'cash'])
+        stats = BranchDailyStats.objects.get(branch=self.branch)
+        self.assertEqual(stats.paid_income, 999 + 100)
+
+        # The rest of an advance payment pays the next new order
+        self._payment(500, status='COMPLETE')
+        response = self.client.post(reverse('order-create'), self.valid_payload, format='json')
+        self.assertEqual(response.data['payment_status'], 'paid')
+        self.assertEqual(OrderPayment.objects.filter(order_id=response.data['id']).count(), 1)
+
+    def test_queries_do_not_grow_with_unpaid_orders(self):
+        self.assertEqual(self._allocate_queries(3), self._allocate_queries(40))
+
+
+class CustomerSpendLedgerTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+
+    def test_ledger_tracks_counted_status_changes_and_promotes_vip(self):
+        order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=30000)
+        self.assertFalse(CustomerLifetimeSpend.objects.filter(user=self.user).exists())
+
+        order.status = 'delivered'
+        order.save()
+        second = Order.objects.create(customer_name=self.user, branch=self.branch,
+                                      total_amount=25000, status='delivered')
+
+        month = CustomerSpend.objects.get(user=self.user)
+        self.assertEqual((month.order_count, month.total_spent), (2, 55000))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_vip)
+
+        second.status = 'refunded'
+        second.save()
+        order.delete()
+        lifetime = CustomerLifetimeSpend.objects.get(user=self.user)
+        self.assertEqual((lifetime.order_count, lifetime.total_spent), (0, 0))
+
+
+class BranchDailyStatsTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='testpassword', first_name='Admin',
+            last_name='User', phone='9841234599', role='admin'
+        )
+
+    def _stats(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('order-stats'), {'range': '1m'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_rollups_follow_order_writes_and_match_rebuild(self):
+        self.client.post(reverse('order-create'), self.valid_payload, format='json')
+        paid = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        OrderItem.objects.create(order=paid, service_type='Saree', material='Silk',
+                                 quantity=1, price_per_unit=300, total_price=300)
+        paid.payment_status = 'paid'
+        paid.save()
+        doomed = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=50)
+        doomed.delete()
+
+        live = self._stats()
+        self.assertEqual(live['stats']['total_orders'], 2)
+        self.assertEqual(live['stats']['total_income'], 300.0)
+        self.assertEqual(
+            sorted((s['name'], s['value']) for s in live['service_distribution']),
+            [('Saree', 1), ('Shirt', 1)]
+        )
+
+        call_command('rebuild_branch_daily_stats', stdout=StringIO())
+        self.assertEqual(self._stats()['stats'], live['stats'])
+        self.assertEqual(BranchDailyServiceStats.objects.filter(items_count__gt=0).count(), 2)
+
+
+class OrderStatusEventTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+
+    def test_transitions_are_validated_and_logged(self):
+        url = reverse('order-update', kwargs={'pk': self.order.order_id})
+        response = self.client.patch(url, {'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for next_status in ('in wash', 'washed'):
+            response = self.client.patch(url, {'status': next_status}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        timeline = self.client.get(reverse('order-timeline', kwargs={'pk': self.order.order_id})).data
+        self.assertEqual([(e['from_status'], e['to_status']) for e in timeline],
+                         [('', 'dropped by user'), ('dropped by user', 'in wash'), ('in wash', 'washed')])
+        self.assertEqual(timeline[-1]['actor'], self.user.id)
+        self.assertIsNotNone(timeline[-1]['time_in_previous_status'])
+
+        activity = self.client.get(reverse('order-activity')).data['results']
+        self.assertEqual(activity[0]['to_status'], 'washed')
+
+        metrics = self.client.get(reverse('order-time-in-state')).data['time_in_state']
+        self.assertEqual([m['status'] for m in metrics], ['dropped by user', 'in wash'])
+
+    def test_payment_status_saves_do_not_log_events(self):
+        self.order.payment_status = 'paid'
+        self.order.save()
+        self.assertEqual(OrderStatusEvent.objects.filter(order=self.order).count(), 1)
+
+
+class RiderAssignmentTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+        self.riders = [
+            User.objects.create_user(email=f'rider{i}@example.com', password='testpassword', first_name='Rider',
+                                     last_name=str(i), phone=f'98400000{i}', role='rider')
+            for i in range(2)
+        ]
+        self.valid_payload.update({
+            'pickup_enabled': True, 'pickup_date': '2030-01-10T00:00:00Z', 'pickup_time': 'early_morning',
+            'total_amount': 400.00,
+        })
+
+    def _loads(self):
+        return sorted(RiderLoad.objects.filter(open_deliveries__gt=0).values_list('rider_id', 'open_deliveries'))
+
+    def test_deliveries_are_spread_by_load_and_counted(self):
+        for _ in range(4):
+            response = self.client.post(reverse('order-create'), self.valid_payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._loads(), [(self.riders[0].id, 2), (self.riders[1].id, 2)])
+
+        delivery = Delivery.objects.filter(delivery_person=self.riders[0]).first()
+        delivery.status = 'delivered'
+        delivery.save()
+        self.assertEqual(self._loads(), [(self.riders[0].id, 1), (self.riders[1].id, 2)])
+
+        # Pile everything onto one rider, then rebalance from the admin endpoint
+        Delivery.objects.filter(status='pending').update(delivery_person=self.riders[1])
+        call_command('rebalance_deliveries', '--rebuild-loads', '--skip-rebalance', stdout=StringIO())
+        self.assertEqual(self._loads(), [(self.riders[1].id, 3)])
+
+        admin = User.objects.create_user(email='admin@example.com', password='testpassword', first_name='Admin',
+                                         last_name='User', phone='9841234599', role='admin')
+        self.client.force_authenticate(user=admin)
+        response = self.client.post(reverse('delivery-rebalance'), {'since': '2030-01-01'}, format='json')
+        self.assertEqual((response.data['rebalanced'], response.data['moved']), (3, 2))
+        self.assertEqual(self._loads(), [(self.riders[0].id, 2), (self.riders[1].id, 1)])
+
+
+class DeliveryManifestTest(TestCase):
+    def setUp(self):
+        RiderAssignmentTest.setUp(self)
+        self.rider = self.riders[0]
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+
+    def test_parse_coordinates(self):
+        from .routing import parse_coordinates
+        self.assertEqual(parse_coordinates('https://www.openstreetmap.org/?mlat=27.6713&mlon=85.3387&zoom=16'),
+                         (27.6713, 85.3387))
+        self.assertEqual(parse_coordinates('https://www.google.com/maps/@27.7,85.32,15z'), (27.7, 85.32))
+        self.assertEqual(parse_coordinates('https://maps.google.com/?q=27.7,85.3'), (27.7, 85.3))
+        self.assertIsNone(parse_coordinates('https://www.google.com/maps/search/?api=1&query=Thamel'))
+
+    def test_plans_hundreds_of_stops_quickly(self):
+        from .routing import plan_route, route_length_km
+        rng = random.Random(7)
+        points = [(27.6 + rng.random() * 0.2, 85.2 + rng.random() * 0.2) for _ in range(300)]
+        started = time.perf_counter()
+        order = plan_route(points, start=(27.7, 85.3))
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(sorted(order), list(range(300)))
+        self.assertLess(route_length_km(points, order, (27.7, 85.3)),
+                        route_length_km(points, list(range(300)), (27.7, 85.3)))
+
+    def test_manifest_orders_stops_and_is_cached_until_deliveries_change(self):
+        start = datetime(2030, 1, 10, 6, tzinfo=dt_timezone.utc)
+        for lng in (85.30, 85.34, 85.31, 85.33):
+            Delivery.objects.create(
+                order=self.order, delivery_address=f'Stop {lng}', delivery_contact='9800000000',
+                delivery_person=self.rider, delivery_time='early_morning', delivery_start_time=start,
+                map_link=f'https://www.openstreetmap.org/?mlat=27.7&mlon={lng}&zoom=16',
+            )
+        self.client.force_authenticate(user=self.rider)
+        url = reverse('delivery-manifest')
+        first = self.client.get(url, {'date': '2030-01-10'}).data
+        stops = first['slots'][0]['stops']
+        self.assertFalse(first['cached'])
+        self.assertEqual([stop['longitude'] for stop in stops], [85.30, 85.31, 85.33, 85.34])
+        self.assertTrue(self.client.get(url, {'date': '2030-01-10'}).data['cached'])
+
+        delivery = Delivery.objects.get(id=stops[0]['delivery_id'])
+        delivery.status = 'delivered'
+        delivery.save()
+        refreshed = self.client.get(url, {'date': '2030-01-10'}).data
+        self.assertFalse(refreshed['cached'])
+        self.assertEqual(len(refreshed['slots'][0]['stops']), 3)
+
+
+@override_settings(ORDER_SLOT_CAPACITY=2)
+class SlotCapacityTest(TestCase):
+    def setUp(self):
+        RiderAssignmentTest.setUp(self)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.valid_payload['pickup_date'] = f'{tomorrow.isoformat()}T00:00:00Z'
+        self.tomorrow = tomorrow.isoformat()
+
+    def _early_morning(self):
+        response = self.client.get(reverse('slot-availability'), {'branch': self.branch.id, 'days': 2})
+        day = next(d for d in response.data['days'] if d['date'] == self.tomorrow)
+        return next(s for s in day['slots'] if s['slot'] == 'early_morning')
+
+    def test_slots_are_reserved_up_to_capacity(self):
+        for _ in range(2):
+            response = self.client.post(reverse('order-create'), self.valid_payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('order-create'), self.valid_payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pickup_time', response.data)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual((self._early_morning()['available'], self._early_morning()['open']), (0, False))
+
+        bulk = self.client.post(reverse('order-bulk-create'), {'orders': [
+            dict(self.valid_payload, idempotency_key='slot-1'),
+            dict(self.valid_payload, idempotency_key='slot-2', pickup_time='late_morning'),
+        ]}, format='json')
+        self.assertEqual([r['status'] for r in bulk.data['results']], ['invalid', 'created'])
+
+        delivery = Delivery.objects.filter(delivery_time='early_morning').first()
+        delivery.status = 'cancelled'
+        delivery.save()
+        self.assertEqual(self._early_morning()['available'], 1)
+
+        SlotCapacity.objects.update(reserved=0)
+        call_command('reconcile_slot_capacity', stdout=StringIO())
+        self.assertEqual(sorted(SlotCapacity.objects.values_list('slot', 'reserved')),
+                         [('early_morning', 1), ('late_morning', 1)])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        OrderCreateTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100,
+                                          description='Wedding outfit, handle with care')
+        OrderItem.objects.create(order=self.order, service_type='Saree', material='Banarasi Silk',
+                                 quantity=1, price_per_unit=100, total_price=100)
+        self.payment = Payment.objects.create(user=self.user, total_amount=100, amount=100,
+                                              payment_type='bank', ref_id='BANKREF-778899', branch=self.branch)
+
+    def _search(self, q, **params):
+        response = self.client.get(reverse('search'), dict(params, q=q))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(r['kind'], r['object_id']) for r in response.data['results']]
+
+    def test_search_is_ranked_synced_and_scoped(self):
+        order_hit = ('order', str(self.order.order_id))
+        self.assertEqual(self._search('banarasi wedding'), [order_hit])
+        self.assertEqual(self._search('778899'), [('payment', str(self.payment.pk))])
+        self.assertIn(('customer', str(self.user.pk)), self._search('test@example', kind='customer'))
+
+        # Writes keep the index in step
+        self.user.first_name = 'Sushila'
+        self.user.save()
+        self.assertIn(order_hit, self._search('sushila', kind='order'))
+        self.order.delete()
+        self.assertEqual(self._search('banarasi'), [])
+
+        response = self.client.get(reverse('payment_history'), {'search': 'bankref', 'page': 1})
+        self.assertEqual(len(response.data['payments']), 1)
+        # The listing matches references only, not the customer or the payment's type and status
+        for term in ('sushila', 'pending', '9841234567', 'example.com'):
+            response = self.client.get(reverse('payment_history'), {'search': term, 'page': 1})
+            self.assertEqual(response.data['payments'], [], term)
+        # ... and as one substring, like the column filters it replaced
+        for term, count in (('REF-7788', 1), ('778899 bankref', 0)):
+            response = self.client.get(reverse('payment_history'), {'search': term, 'page': 1})
+            self.assertEqual(len(response.data['payments']), count, term)
+
+        # Another customer sees none of it
+        other = User.objects.create_user(email='other@example.com', password='testpassword', first_name='O',
+                                         last_name='U', phone='9841000000')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self._search('778899'), [])
+
+    def test_saves_that_change_no_indexed_field_skip_reindexing(self):
+        for obj, field, value in ((self.order, 'payment_status', 'paid'), (self.payment, 'status', 'FAILED'),
+                                  (self.order.order_items.get(), 'price_per_unit', 50)):
+            setattr(obj, field, value)
+            with CaptureQueriesContext(connection) as queries:
+                obj.save()
+            self.assertFalse([q for q in queries if 'orders_searchdocument' in q['sql']], field)
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save(update_fields=['last_login'])
+        self.assertFalse([q for q in queries if 'orders_searchdocument' in q['sql']])
+
+        self.order.description = 'Silk kurta'
+        self.order.save()
+        self.assertEqual(self._search('kurta'), [('order', str(self.order.order_id))])
+        self.payment.ref_id = 'BANKREF-112233'
+        self.payment.save()
+        self.assertEqual(self._search('112233'), [('payment', str(self.payment.pk))])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._search('silk'), [('order', str(self.order.order_id))])
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        BranchDailyStatsTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        OrderItem.objects.create(order=self.order, service_type='Saree', material='Silk',
+                                 quantity=1, price_per_unit=300, total_price=300)
+        payment = Payment.objects.create(user=self.user, total_amount=100, amount=100, status='COMPLETE')
+        OrderPayment.objects.create(order=self.order, payment=payment, amount_applied=100)
+        Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=50)
+
+    def _export(self, **params):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('order-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_and_ndjson_exports(self):
+        rows = list(csv.DictReader(self._export().splitlines()))
+        self.assertEqual(len(rows), 2)
+        first = next(row for row in rows if row['order_id'] == str(self.order.order_id))
+        self.assertEqual(first['items'], 'Saree (Silk) x1 = 300.00')
+        self.assertEqual(first['amount_paid'], '100.00')
+
+        records = [json.loads(line) for line in self._export(output='ndjson').splitlines()]
+        record = next(r for r in records if r['order_id'] == str(self.order.order_id))
+        self.assertEqual(record['items'][0]['service_type'], 'Saree')
+        self.assertEqual(record['payments'][0]['amount_applied'], '100.00')
+
+    def test_customers_cannot_export(self):
+        response = self.client.get(reverse('order-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderArchiveTest(TestCase):
+    def setUp(self):
+        BranchDailyStatsTest.setUp(self)
+        self.old = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        OrderItem.objects.create(order=self.old, service_type='Saree', material='Silk',
+                                 quantity=1, price_per_unit=300, total_price=300)
+        Delivery.objects.create(order=self.old, delivery_address='Old Road', delivery_contact='9841234567',
+                                delivery_type='drop', status='delivered')
+        self.payment = Payment.objects.create(user=self.user, total_amount=500, amount=500, status='COMPLETE')
+        OrderPayment.objects.create(order=self.old, payment=self.payment, amount_applied=300)
+        for next_status in ('sent to wash', 'in wash', 'washed', 'delivered'):
+            self.old.refresh_from_db()
+            self.old.payment_status = 'paid'
+            self.old.transition_to(next_status)
+        Order.objects.filter(pk=self.old.pk).update(order_date=timezone.now() - timedelta(days=400))
+        self.recent = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=80,
+                                           status='cancelled')
+        self.open = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=90)
+        Order.objects.filter(pk=self.open.pk).update(order_date=timezone.now() - timedelta(days=500))
+
+    def test_archive_command_moves_closed_orders(self):
+        spend = list(CustomerSpend.objects.values_list('month', 'total_spent'))
+        call_command('rebuild_branch_daily_stats', stdout=StringIO())
+        rollups = sorted(BranchDailyStats.objects.values_list('day', 'orders_count', 'paid_income'))
+        out = StringIO()
+        call_command('archive_orders', '--dry-run', stdout=out)
+        self.assertIn('Orders to archive', out.getvalue())
+        self.assertTrue(Order.objects.filter(pk=self.old.pk).exists())
+
+        out = StringIO()
+        call_command('archive_orders', '--batch-size', '1', stdout=out)
+        self.assertIn('Orders archived (placed before', out.getvalue())
+        self.assertIn('orders_order: 3 -> 2 rows', out.getvalue())
+        self.assertFalse(Order.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.recent.pk, self.open.pk})
+        self.assertFalse(OrderStatusEvent.objects.filter(order_id=self.old.pk).exists())
+
+        archived = ArchivedOrder.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.status, archived.amount_paid), ('delivered', 300))
+        self.assertEqual(archived.order_items.get().service_type, 'Saree')
+        self.assertEqual(archived.deliveries.get().delivery_address, 'Old Road')
+        self.assertEqual([event['to_status'] for event in archived.status_history][-1], 'delivered')
+        # Ledgers are left alone and the allocation still uses up the payment
+        self.assertEqual(list(CustomerSpend.objects.values_list('month', 'total_spent')), spend)
+        self.assertEqual(ArchivedOrderPayment.objects.get().amount_applied, 300)
+        payment = Payment.objects.annotate(total_applied=applied_amount_subquery()).get(pk=self.payment.pk)
+        self.assertEqual(payment.total_applied, 300)
+        # Rebuilding the rollups keeps counting archived orders
+        call_command('rebuild_branch_daily_stats', stdout=StringIO())
+        self.assertEqual(sorted(BranchDailyStats.objects.values_list('day', 'orders_count', 'paid_income')), rollups)
+
+    def test_archived_orders_are_read_transparently(self):
+        call_command('archive_orders', stdout=StringIO())
+
+        response = self.client.get(reverse('order-detail', kwargs={'pk': self.old.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_archived'])
+        self.assertEqual(response.data['services'][0]['service_type'], 'Saree')
+        self.assertEqual(response.data['delivery_address'], 'Old Road')
+
+        response = self.client.get(reverse('order-timeline', kwargs={'pk': self.old.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[-1]['to_status'], 'delivered')
+
+        # Cursor pages merge live and archived orders, newest first
+        seen, params = [], {'page_size': 1}
+        while True:
+            response = self.client.get(reverse('order-list'), params)
+            seen += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            params['cursor'] = response.data['next'].split('cursor=')[1].split('&')[0]
+        self.assertEqual(seen, [str(self.recent.pk), str(self.old.pk), str(self.open.pk)])
+
+        other = User.objects.create_user(email='other@example.com', password='testpassword', first_name='O',
+                                         last_name='U', phone='9841234500', role='customer')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('order-detail', kwargs={'pk': self.old.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StatusStreamTest(TestCase):
+    def setUp(self):
+        RiderAssignmentTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+        self.delivery = Delivery.objects.create(order=self.order, delivery_address='Road 1',
+                                                delivery_contact='9841234567', delivery_type='drop')
+
+    def test_status_changes_are_published_and_scoped(self):
+        from .realtime import updates_for
+        start = StatusUpdate.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.transition_to('sent to wash')
+            self.order.description = 'no status change'
+            self.order.save()
+            self.delivery.delivery_person = self.riders[0]
+            self.delivery.status = 'in_progress'
+            self.delivery.save()
+        updates = list(StatusUpdate.objects.order_by('id')[start:])
+        self.assertEqual([(u.kind, u.data['status']) for u in updates],
+                         [('order', 'sent to wash'), ('delivery', 'in_progress')])
+        self.assertEqual(updates[1].data['changed'], ['rider', 'status'])
+
+        self.assertEqual(updates_for(self.riders[0]).get(), updates[1])
+        self.assertFalse(updates_for(self.riders[1]).exists())
+        self.assertEqual(updates_for(self.user).filter(id__in=[u.id for u in updates]).count(), 2)
+
+    async def test_stream_sends_deltas_after_last_event_id(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        update = await sync_to_async(StatusUpdate.objects.create)(
+            kind='order', object_id=str(self.order.order_id), order_id=self.order.order_id,
+            customer=self.user, branch=self.branch, data={'status': 'washed'},
+        )
+        token = str(RefreshToken.for_user(self.user).access_token)
+        client = AsyncClient()
+        response = await client.post(reverse('order-stream-ticket'), headers={'Authorization': f'Bearer {token}'})
+        ticket = response.json()['ticket']
+        response = await client.get(reverse('order-status-stream'), {'ticket': ticket, 'last_event_id': update.id - 1})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        message = (await anext(stream)).decode()
+        await stream.aclose()
+        self.assertIn(f'id: {update.id}\nevent: order\n', message)
+        data = json.loads(message.split('data: ')[1])
+        self.assertEqual((data['status'], data['order_id']), ('washed', str(self.order.order_id)))
+
+        response = await AsyncClient().get(reverse('order-status-stream'))
+        self.assertEqual(response.status_code, 401)
+        # Access tokens are not accepted in the URL, and tickets expire
+        response = await AsyncClient().get(reverse('order-status-stream'), {'ticket': token})
+        self.assertEqual(response.status_code, 401)
+        with mock.patch('orders.realtime.STREAM_TICKET_TTL', -1):
+            response = await AsyncClient().get(reverse('order-status-stream'), {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+
+class BulkStatusTransitionTest(TestCase):
+    def setUp(self):
+        BranchDailyStatsTest.setUp(self)
+        self.rider = User.objects.create_user(email='rider@example.com', password='testpassword',
+                                              first_name='Rider', last_name='One', phone='9840000009', role='rider')
+        self.washing = [
+            Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100, status='in wash')
+            for _ in range(3)
+        ]
+        self.dropped = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+        self.client.force_authenticate(user=self.admin)
+
+    def _post(self, payload):
+        return self.client.post(reverse('bulk-status-transition'), payload, format='json')
+
+    def test_orders_are_moved_in_one_batch_with_per_item_results(self):
+        ids = [str(order.pk) for order in self.washing] + [str(self.dropped.pk), 'not-a-uuid']
+        response = self._post({'kind': 'order', 'ids': ids, 'status': 'washed', 'all_or_nothing': True})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['skipped', 'skipped', 'skipped', 'invalid', 'invalid'])
+        self.assertEqual(Order.objects.filter(status='washed').count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post({'kind': 'order', 'ids': ids, 'status': 'washed', 'note': 'Batch 7'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(response.data['results'][0]['from_status'], 'in wash')
+        self.assertLess(len(queries), 25)
+        self.assertEqual(Order.objects.filter(status='washed').count(), 3)
+        events = OrderStatusEvent.objects.filter(to_status='washed')
+        self.assertEqual(events.count(), 3)
+        self.assertEqual({(e.from_status, e.note, e.actor_id) for e in events}, {('in wash', 'Batch 7', self.admin.id)})
+        self.assertIsNotNone(events.first().time_in_previous_status)
+
+        response = self._post({'kind': 'order', 'items': [{'id': str(self.washing[0].pk), 'status': 'washed'}]})
+        self.assertEqual(response.data['results'][0]['status'], 'unchanged')
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self._post({'kind': 'order', 'ids': ids, 'status': 'washed'}).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_deliveries_cascade_to_their_orders(self):
+        pickup_order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=200,
+                                            status='pending pickup')
+        drop_order = self.washing[0]
+        drop_order.transition_to('washed')
+        pickup = Delivery.objects.create(order=pickup_order, delivery_address='A', delivery_contact='1',
+                                         delivery_type='pickup', delivery_person=self.rider)
+        drop = Delivery.objects.create(order=drop_order, delivery_address='B', delivery_contact='2',
+                                       delivery_type='drop', delivery_person=self.rider)
+        other = Delivery.objects.create(order=self.dropped, delivery_address='C', delivery_contact='3')
+        self.assertEqual(sum(RiderLoad.objects.values_list('open_deliveries', flat=True)), 2)
+
+        self.client.force_authenticate(user=self.rider)
+        response = self._post({'kind': 'delivery', 'ids': [pickup.id, drop.id, other.id], 'status': 'delivered'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['results']], ['updated', 'updated', 'not_found'])
+        self.assertEqual([r.get('order_status') for r in response.data['results'][:2]], ['picked up', 'delivered'])
+
+        pickup_order.refresh_from_db()
+        drop_order.refresh_from_db()
+        self.assertEqual((pickup_order.status, drop_order.status), ('picked up', 'delivered'))
+        self.assertEqual(OrderStatusEvent.objects.get(order=drop_order, to_status='delivered').note, 'Drop delivered')
+        self.assertEqual(sum(RiderLoad.objects.values_list('open_deliveries', flat=True)), 0)
+        self.assertEqual(CustomerSpend.objects.get(user=self.user).total_spent, 100)
+
+
+class OrderStatsCacheTest(TestCase):
+    def setUp(self):
+        BranchDailyStatsTest.setUp(self)
+        Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+        self.client.force_authenticate(user=self.admin)
+
+    def _get(self):
+        response = self.client.get(reverse('order-stats'), {'range': '1m'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_responses_are_cached_until_an_order_write(self):
+        from .stats_cache import counters
+        before = counters()
+        first = self._get()
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            second = self._get()
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertLessEqual(len(queries), 2)  # authentication only
+
+        order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=50)
+        third = self._get()
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(third.data['stats']['total_orders'], first.data['stats']['total_orders'] + 1)
+        OrderItem.objects.create(order=order, service_type='Shirt', material='Cotton',
+                                 quantity=1, price_per_unit=50, total_price=50)
+        self.assertEqual(self._get()['X-Cache'], 'MISS')
+
+        response = self.client.get(reverse('order-stats-cache'))
+        self.assertEqual(response.data['hits'] - before['hits'], 1)
+        self.assertEqual(response.data['misses'] - before['misses'], 3)
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        from .checks import check_shared_cache
+
+        self.assertEqual([w.id for w in check_shared_cache(None)], ['orders.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                   'LOCATION': 'redis://127.0.0.1:6379/1'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_concurrent_misses_compute_once(self):
+        import threading
+        from .stats_cache import get_or_compute
+        calls, outcomes = [], []
+        time_range = f'single-flight-{time.monotonic()}'
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return {'value': 42}
+
+        def fetch():
+            outcomes.append(get_or_compute('test-scope', time_range, compute))
+
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcome for _, outcome in outcomes), ['coalesced'] * 3 + ['miss'])
+        self.assertTrue(all(data == {'value': 42} for data, _ in outcomes))
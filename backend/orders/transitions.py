@@ -0,0 +1,223 @@
+"""Bulk status transitions for orders and deliveries.
+
+Every requested change is validated against ORDER_STATUS_TRANSITIONS or
+DELIVERY_STATUS_TRANSITIONS, then all valid changes are written with one
+``bulk_update``. bulk_update() sends no signals, so everything the save
+signals in orders/models.py maintain is applied here in bulk instead: status
+events, the spend ledger and VIP check, rider loads, slot places, manifests,
+the search index and the status stream.
+
+Delivering a pickup moves its order from 'pending pickup' to 'picked up' and
+delivering a drop moves its order to 'delivered', the same cascades as
+DeliveryUpdateView, applied to all affected orders at once.
+"""
+import logging
+import uuid
+from collections import defaultdict
+
+from django.db import models
+from django.utils import timezone
+
+from .models import (
+    CustomerSpend, Delivery, Order, OrderStatusEvent, RiderLoad, SlotCapacity, counted_spend,
+    promote_to_vip_if_eligible,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 500
+
+
+def _result(index, object_id, outcome, **extra):
+    return {'index': index, 'id': str(object_id) if object_id is not None else None, 'status': outcome, **extra}
+
+
+def apply_order_transitions(changes, actor=None, note=''):
+    """Write validated ``(order, new_status)`` changes set-based. Returns the changed orders."""
+    if not changes:
+        return []
+    from .realtime import publish_orders
+    from .search import index_orders
+    from .stats_cache import invalidate
+
+    now = timezone.now()
+    previous = {}
+    spend = defaultdict(lambda: [0, 0])
+    for order, status in changes:
+        previous[order.pk] = order.status
+        before = counted_spend(order.customer_name_id, order.status, order.order_date, order.total_amount)
+        order.status = status
+        after = counted_spend(order.customer_name_id, order.status, order.order_date, order.total_amount)
+        if before != after:
+            if before:
+                spend[before[:2]][0] -= 1
+                spend[before[:2]][1] -= before[2]
+            if after:
+                spend[after[:2]][0] += 1
+                spend[after[:2]][1] += after[2]
+    orders = [order for order, _ in changes]
+    Order.objects.bulk_update(orders, ['status'], batch_size=500)
+
+    # Status events, timed from each order's latest event
+    entered = dict(OrderStatusEvent.objects.filter(order_id__in=previous).values('order_id').annotate(
+        latest=models.Max('created_at')
+    ).values_list('order_id', 'latest'))
+    actor = actor if getattr(actor, 'is_authenticated', False) else None
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(
+            order=order, customer_id=order.customer_name_id, branch_id=order.branch_id,
+            from_status=previous[order.pk], to_status=order.status, actor=actor, note=note or '', created_at=now,
+            time_in_previous_status=now - entered[order.pk] if order.pk in entered else None,
+        )
+        for order in orders
+    ], batch_size=500)
+
+    # Spend ledger, then the VIP check for customers whose spend went up
+    for (user_id, month), (count, amount) in spend.items():
+        if count or amount:
+            CustomerSpend.record(user_id, month, count, amount)
+    grown = {user_id for (user_id, _), (_, amount) in spend.items() if amount > 0}
+    for order in {order.customer_name_id: order for order in orders if order.customer_name_id in grown}.values():
+        promote_to_vip_if_eligible(order)
+
+    index_orders(previous)
+    invalidate({order.branch_id for order in orders}, {order.customer_name_id for order in orders})
+    publish_orders(orders, {'status'})
+    return orders
+
+
+def _parse_items(items, parse_id):
+    """Split raw ``{"id", "status"}`` items into results for bad entries and ``(index, id, status)``."""
+    results, parsed, seen = {}, [], set()
+    for index, item in enumerate(items):
+        raw_id = item.get('id') if isinstance(item, dict) else None
+        target = item.get('status') if isinstance(item, dict) else None
+        try:
+            object_id = parse_id(raw_id)
+        except (TypeError, ValueError, AttributeError):
+            results[index] = _result(index, raw_id, 'invalid', errors={'id': ['A valid id is required.']})
+            continue
+        if not isinstance(target, str) or not target:
+            results[index] = _result(index, object_id, 'invalid', errors={'status': ['A status is required.']})
+            continue
+        if object_id in seen:
+            results[index] = _result(index, object_id, 'invalid',
+                                     errors={'id': ['Id is repeated within this batch.']})
+            continue
+        seen.add(object_id)
+        parsed.append((index, object_id, target))
+    return results, parsed
+
+
+def _validate(parsed, objects, choices, results):
+    """Check each change against its object; returns the valid ``(index, object, status)`` changes."""
+    valid = []
+    for index, object_id, target in parsed:
+        obj = objects.get(object_id)
+        if obj is None:
+            results[index] = _result(index, object_id, 'not_found')
+        elif target not in choices:
+            results[index] = _result(index, object_id, 'invalid',
+                                     errors={'status': [f"'{target}' is not a valid status."]})
+        elif not obj.can_transition_to(target):
+            results[index] = _result(index, object_id, 'invalid', errors={
+                'status': [f"Cannot change status from '{obj.status}' to '{target}'"]
+            })
+        elif target == obj.status:
+            results[index] = _result(index, object_id, 'unchanged', from_status=obj.status, to_status=target)
+        else:
+            valid.append((index, obj, target))
+    return valid
+
+
+def transition_orders(orders, items, actor=None, note=''):
+    """Validate and apply order status changes.
+
+    ``orders`` is the queryset the caller may change; ``items`` is a list of
+    ``{"id": <order id>, "status": <new status>}``. Returns ``(results, valid,
+    apply)``: the results so far keyed by item index, the valid changes, and a
+    callable that writes them and fills in their results (so the caller can
+    decide to write nothing).
+    """
+    results, parsed = _parse_items(items, lambda value: uuid.UUID(str(value)))
+    objects = orders.select_for_update().in_bulk([object_id for _, object_id, _ in parsed])
+    choices = dict(Order._meta.get_field('status').choices)
+    valid = _validate(parsed, objects, choices, results)
+
+    def apply():
+        for index, order, target in valid:
+            results[index] = _result(index, order.pk, 'updated', from_status=order.status, to_status=target)
+        apply_order_transitions([(order, target) for _, order, target in valid], actor=actor, note=note)
+
+    return results, valid, apply
+
+
+def transition_deliveries(deliveries, items, actor=None, note=''):
+    """Validate and apply delivery status changes, cascading to their orders.
+
+    Works like transition_orders; results of changed deliveries also carry
+    ``order_status`` when the order was moved by the cascade.
+    """
+    from .realtime import publish_deliveries
+    from .routing import invalidate_rider_manifests
+
+    results, parsed = _parse_items(items, int)
+    objects = deliveries.select_related('order').select_for_update().in_bulk(
+        [object_id for _, object_id, _ in parsed]
+    )
+    choices = dict(Delivery._meta.get_field('status').choices)
+    valid = _validate(parsed, objects, choices, results)
+
+    def apply():
+        loads, slots = defaultdict(int), defaultdict(int)
+        changed = []
+        for index, delivery, target in valid:
+            results[index] = _result(index, delivery.pk, 'updated', from_status=delivery.status, to_status=target)
+            before_load, before_slot = delivery.load_key(), delivery.slot_key()
+            delivery.status = target
+            for counts, before, after in ((loads, before_load, delivery.load_key()),
+                                          (slots, before_slot, delivery.slot_key())):
+                if before != after:
+                    if before:
+                        counts[before] -= 1
+                    if after:
+                        counts[after] += 1
+            changed.append(delivery)
+        if not changed:
+            return
+
+        Delivery.objects.bulk_update(changed, ['status'], batch_size=500)
+        for (rider_id, day, slot), delta in loads.items():
+            if delta:
+                RiderLoad.record(rider_id, day, slot, delta)
+        for (branch_id, day, slot), delta in slots.items():
+            if delta:
+                SlotCapacity.record(branch_id, day, slot, delta)
+        invalidate_rider_manifests(*{delivery.delivery_person_id for delivery in changed})
+        publish_deliveries(changed, {'status'})
+
+        # Cascade to the orders: pickups picked up, drops delivered
+        cascades = {'Pickup delivered': {}, 'Drop delivered': {}}
+        for delivery in changed:
+            if delivery.status != 'delivered':
+                continue
+            order = delivery.order
+            if delivery.delivery_type == 'pickup' and order.status == 'pending pickup':
+                cascades['Pickup delivered'][order.pk] = (order, 'picked up')
+            elif delivery.delivery_type == 'drop' and order.status != 'delivered':
+                if order.can_transition_to('delivered'):
+                    cascades['Drop delivered'][order.pk] = (order, 'delivered')
+                else:
+                    logger.warning(
+                        f"[ORDER STATUS] Drop {delivery.id} delivered but order {order.order_id} "
+                        f"is '{order.status}'; order status left unchanged"
+                    )
+        moved = {}
+        for cascade_note, order_changes in cascades.items():
+            for order in apply_order_transitions(list(order_changes.values()), actor=actor, note=cascade_note):
+                moved[order.pk] = order.status
+        for index, delivery, _ in valid:
+            if delivery.order_id in moved:
+                results[index]['order_status'] = moved[delivery.order_id]
+
+    return results, valid, apply
@@ -1,8 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    OrderListView, OrderCreateView, OrderDetailView, OrderUpdateView, OrderDeleteView, OrderStatsView,
+    OrderListView, OrderCreateView, BulkOrderCreateView, OrderDetailView, OrderUpdateView, OrderDeleteView, OrderStatsView,
+    OrderTimelineView, OrderActivityView, OrderStatusMetricsView, SearchView,
+    OrderExportView, OrderStatusStreamView, StreamTicketView, BulkStatusTransitionView, OrderStatsCacheView,
     DeliveryListView, DeliveryCreateView, DeliveryDetailView, DeliveryUpdateView, DeliveryDeleteView,
+    DeliveryRebalanceView, DeliveryManifestView, SlotAvailabilityView,
     UserAddressViewSet
 )
 
@@ -13,13 +16,28 @@ urlpatterns = [
     # Order endpoints
     path('', OrderListView.as_view(), name='order-list'),
     path('create/', OrderCreateView.as_view(), name='order-create'),
+    path('bulk/', BulkOrderCreateView.as_view(), name='order-bulk-create'),
     path('stats/', OrderStatsView.as_view(), name='order-stats'),
+    path('stats/cache/', OrderStatsCacheView.as_view(), name='order-stats-cache'),
+    path('stats/time-in-state/', OrderStatusMetricsView.as_view(), name='order-time-in-state'),
+    path('export/', OrderExportView.as_view(), name='order-export'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('activity/', OrderActivityView.as_view(), name='order-activity'),
+    path('stream/', OrderStatusStreamView.as_view(), name='order-status-stream'),
+    path('stream/ticket/', StreamTicketView.as_view(), name='order-stream-ticket'),
+    path('transitions/', BulkStatusTransitionView.as_view(), name='bulk-status-transition'),
     path('<uuid:pk>/', OrderDetailView.as_view(), name='order-detail'),
+    path('<uuid:pk>/timeline/', OrderTimelineView.as_view(), name='order-timeline'),
     path('<uuid:pk>/update/', OrderUpdateView.as_view(), name='order-update'),
     path('<uuid:pk>/delete/', OrderDeleteView.as_view(), name='order-delete'),
 
+    # Time slot availability
+    path('slots/availability/', SlotAvailabilityView.as_view(), name='slot-availability'),
+
     # Delivery endpoints
     path('deliveries/', DeliveryListView.as_view(), name='delivery-list'),
+    path('deliveries/manifest/', DeliveryManifestView.as_view(), name='delivery-manifest'),
+    path('deliveries/rebalance/', DeliveryRebalanceView.as_view(), name='delivery-rebalance'),
     path('deliveries/create/', DeliveryCreateView.as_view(), name='delivery-create'),
     path('deliveries/<int:pk>/', DeliveryDetailView.as_view(), name='delivery-detail'),
     path('deliveries/<int:pk>/update/', DeliveryUpdateView.as_view(), name='delivery-update'),
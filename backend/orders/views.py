@@ -2,8 +2,12 @@
 from rest_framework import generics, viewsets
 from rest_framework.permissions import IsAuthenticated
 from django.db import models
-from .models import Order, Delivery, UserAddress
-from .serializers import OrderSerializer, DeliverySerializer, OrderCreateSerializer, UserAddressSerializer
+from django.views import View
+from .models import Order, ArchivedOrder, Delivery, UserAddress, OrderStatusEvent
+from .pagination import OrderKeysetPagination, DeliveryKeysetPagination, StatusEventKeysetPagination
+from .serializers import (
+    OrderSerializer, DeliverySerializer, OrderCreateSerializer, UserAddressSerializer, OrderStatusEventSerializer
+)
 
 # ---- ORDER VIEWS ----
 class OrderCreateView(generics.CreateAPIView):
@@ -18,6 +22,7 @@ class OrderCreateView(generics.CreateAPIView):
         from rest_framework.response import Response
         from rest_framework import status
         from django.db import transaction
+        from rest_framework.exceptions import ValidationError
         from payments.models import Payment
         from .models import OrderPayment        
         logger = logging.getLogger(__name__)
@@ -37,7 +42,7 @@ class OrderCreateView(generics.CreateAPIView):
                 logger.info(f"Order created successfully: {order.order_id}")
                 
                 # Check for advance payments and apply them to this order
-                self._apply_advance_payments(order, request.user)
+                self._apply_advance_payments([order], request.user)
                 
                 # Assign to rider
                 self._assign_to_rider(order)
@@ -45,6 +50,10 @@ class OrderCreateView(generics.CreateAPIView):
                 # Use OrderSerializer for response (i has proper SerializerMethodField for dates)
                 response_serializer = OrderSerializer(order, context={'request': request})
                 return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        except ValidationError as e:
+            # e.g. the requested pickup/delivery slot is fully booked
+            logger.warning(f"Order rejected: {e.detail}")
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Order creation failed: {str(e)}")
             import traceback
@@ -53,107 +62,210 @@ class OrderCreateView(generics.CreateAPIView):
 
     def _assign_to_rider(self, order):
         """
-        Assigns the order's deliveries to the first available rider.
+        Assigns the order's deliveries to the least-loaded active rider for their day and slot.
         """
         import logging
-        from django.contrib.auth import get_user_model
-        
+        from .assignment import assign_deliveries
+
         logger = logging.getLogger(__name__)
-        User = get_user_model()
-        
-        # Find a rider (simplest logic: first one found)
-        # In a real app, this would be more complex (location based, load balancing, etc.)
-        rider = User.objects.filter(role='rider').first()
-        
-        if rider:
-            # Assign to all deliveries associated with this order
-            deliveries = Delivery.objects.filter(order=order)
-            updated_count = deliveries.update(delivery_person=rider)
-            logger.info(f"Assigned {updated_count} deliveries for Order {order.order_id} to Rider {rider.email}")
-            
+
+        assigned = assign_deliveries(Delivery.objects.filter(order=order))
+        for delivery in assigned:
+            logger.info(f"Assigned {delivery.delivery_type} {delivery.id} for Order {order.order_id} "
+                        f"to Rider {delivery.delivery_person_id}")
             # Notify rider (TODO: Implement notification system)
-        else:
-            logger.warning(f"No riders found to assign Order {order.order_id}")
+
+    def _assign_batch_to_rider(self, orders):
+        """
+        Assigns the deliveries of many orders, spreading them across riders by load.
+        """
+        from .assignment import assign_deliveries
+
+        assign_deliveries(Delivery.objects.filter(order__in=orders))
     
-    def _apply_advance_payments(self, order, user):
+    def _apply_advance_payments(self, orders, user):
         """
-        Apply any available advance payments to the newly created order.
-        This method finds advance payments for the same branch and applies them to the order.
+        Apply the user's advance payments (at each order's branch) to newly created orders.
+        The allocation is planned in memory and written set-based; see orders/allocation.py.
         """
+        from .allocation import apply_advance_payments
+
+        return apply_advance_payments(orders, user)
+
+class BulkOrderCreateView(OrderCreateView):
+    """View to create many orders in one request (hotels, corporate clients, offline terminals).
+
+    Expects ``{"orders": [{...order payload..., "idempotency_key": "..."}, ...],
+    "all_or_nothing": false}``. Every order is validated up front, then all valid
+    orders are written with ``bulk_create`` inside one transaction. The response
+    carries one result per submitted order, in submission order. Re-sending an
+    order with an idempotency key that was already used returns the existing
+    order instead of creating a new one, so a terminal can safely replay its
+    offline queue.
+    """
+    MAX_BATCH_SIZE = 500
+
+    def create(self, request, *args, **kwargs):
         import logging
-        from django.db.models import Sum
-        from payments.models import Payment
-        from .models import OrderPayment
-        
-        logger = logging.getLogger(__name__)        
-        # Get advance payments for this user and branch (payments with remaining balance)
-        advance_payments = Payment.objects.filter(
-            user=user,
-            branch=order.branch,
-            status='COMPLETE'
-        ).annotate(
-            total_applied=Sum('order_payments__amount_applied')
-        ).filter(
-            models.Q(total_applied__lt=models.F('total_amount')) | models.Q(total_applied__isnull=True)
-        ).order_by('created_at')  # Oldest first
-        
-        logger.info(f"[ADVANCE_PAYMENT] Found {advance_payments.count()} advance payments for user {user.id} and branch {order.branch.id}")
-        
-        # Use Decimal for consistent arithmetic operations
-        from decimal import Decimal
-        remaining_order_amount = Decimal(str(order.total_amount))
-        
-        for payment in advance_payments:
-            if remaining_order_amount <= 0:
-                break
-                
-            # Calculate remaining balance on this payment
-            total_applied = payment.total_applied or Decimal('0')
-            payment_remaining = payment.total_amount - total_applied
-            
-            if payment_remaining <= 0:
-                continue  # Skip fully consumed payments
-                
-            # Apply advance payment to order
-            amount_to_apply = min(payment_remaining, remaining_order_amount)
-            
-            logger.info(f"[ADVANCE_PAYMENT] Applying Rs.{amount_to_apply} from advance payment {payment.transaction_uuid} to order {order.order_id}")
-            
-            # Create OrderPayment record
-            OrderPayment.objects.create(
-                order=order,
-                payment=payment,
-                amount_applied=amount_to_apply
-            )
-            
-            # Update order payment status
-            remaining_order_amount -= amount_to_apply
-            
-            # Log consumption status
-            if amount_to_apply >= payment_remaining:
-                logger.info(f"[ADVANCE_PAYMENT] Advance payment {payment.transaction_uuid} fully consumed")
+        from rest_framework.response import Response
+        from rest_framework import status
+        from django.db import transaction, IntegrityError
+        from branches.models import Branch
+        from .models import OrderItem
+
+        logger = logging.getLogger(__name__)
+        user = request.user
+
+        entries = request.data.get('orders') if isinstance(request.data, dict) else None
+        if not isinstance(entries, list) or not entries:
+            return Response({'error': 'orders must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > self.MAX_BATCH_SIZE:
+            return Response({'error': f'A batch may contain at most {self.MAX_BATCH_SIZE} orders'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        all_or_nothing = bool(request.data.get('all_or_nothing', False))
+
+        results = [None] * len(entries)
+        keys = [entry.get('idempotency_key') if isinstance(entry, dict) else None for entry in entries]
+
+        # Orders already created with these keys (one query for the whole batch)
+        existing = dict(
+            Order.objects.filter(customer_name=user, idempotency_key__in=[k for k in keys if k])
+            .values_list('idempotency_key', 'order_id')
+        )
+
+        # 1. Validate every order on its own
+        pending = []  # (index, key, validated_data)
+        seen_keys = set()
+        for index, (entry, key) in enumerate(zip(entries, keys)):
+            if not key or not isinstance(key, str) or len(key) > 100:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'invalid',
+                                  'errors': {'idempotency_key': ['A key of at most 100 characters is required.']}}
+                continue
+            if key in existing:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'duplicate',
+                                  'order_id': str(existing[key])}
+                continue
+            if key in seen_keys:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'invalid',
+                                  'errors': {'idempotency_key': ['Key is repeated within this batch.']}}
+                continue
+            seen_keys.add(key)
+
+            payload = {name: value for name, value in entry.items() if name != 'idempotency_key'}
+            serializer = self.get_serializer(data=payload)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'invalid',
+                                  'errors': serializer.errors}
+                continue
+            pending.append((index, key, serializer.validated_data))
+
+        # 2. Resolve all referenced branches with a single query
+        branches = Branch.objects.in_bulk({data['branch'] for _, _, data in pending})
+        valid = []
+        for index, key, data in pending:
+            if data['branch'] not in branches:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'invalid',
+                                  'errors': {'branch': [f"Branch with id {data['branch']} does not exist"]}}
             else:
-                remaining_after_application = payment_remaining - amount_to_apply
-                logger.info(f"[ADVANCE_PAYMENT] Advance payment {payment.transaction_uuid} partially consumed, remaining: Rs.{remaining_after_application}")
-        
-        # Update order payment status based on how much was applied
-        if remaining_order_amount <= 0:
-            order.payment_status = 'paid'
-            logger.info(f"[ADVANCE_PAYMENT] Order {order.order_id} fully paid with advance payments")
-        elif remaining_order_amount < Decimal(str(order.total_amount)):
-            order.payment_status = 'partially_paid'
-            logger.info(f"[ADVANCE_PAYMENT] Order {order.order_id} partially paid with advance payments, remaining: Rs.{remaining_order_amount}")
-        else:
-            order.payment_status = 'pending'
-            logger.info(f"[ADVANCE_PAYMENT] Order {order.order_id} not paid with advance payments, pending: Rs.{remaining_order_amount}")
-        
-        order.save()
+                valid.append((index, key, data))
+
+        has_errors = any(result and result['status'] == 'invalid' for result in results)
+        if all_or_nothing and has_errors:
+            for index, key, _ in valid:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'skipped'}
+            return Response({'success': False, 'created': 0, 'results': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # 3. Build every row in memory, then write each table with one bulk_create
+        serializer = self.get_serializer()
+        addresses = serializer.load_user_addresses(user)
+        built = []
+        for index, key, data in valid:
+            order, order_items, order_deliveries = serializer.build_instances(
+                data, user, branches[data['branch']], addresses
+            )
+            order.idempotency_key = key
+            built.append((index, key, order, order_items, order_deliveries))
+
+        try:
+            with transaction.atomic():
+                # Reserve time slot places order by order; orders whose slot is full are rejected
+                created, orders, items, deliveries = [], [], [], []
+                for index, key, order, order_items, order_deliveries in built:
+                    slot_errors = serializer.reserve_slots(order.branch_id, order_deliveries)
+                    if slot_errors:
+                        results[index] = {'index': index, 'idempotency_key': key, 'status': 'invalid',
+                                          'errors': slot_errors}
+                        continue
+                    created.append((index, key))
+                    orders.append(order)
+                    items.extend(order_items)
+                    deliveries.extend(order_deliveries)
+
+                has_errors = has_errors or len(orders) < len(built)
+                if all_or_nothing and has_errors:
+                    transaction.set_rollback(True)
+                else:
+                    Order.objects.bulk_create(orders)
+                    OrderItem.objects.bulk_create(items)
+                    Delivery.objects.bulk_create(deliveries)
+
+                    if orders:
+                        self._apply_advance_payments(orders, user)
+                        self._assign_batch_to_rider(orders)
+        except IntegrityError:
+            # A concurrent request may have used one of these idempotency keys; replaying is safe
+            if not Order.objects.filter(customer_name=user, idempotency_key__in=seen_keys).exists():
+                raise
+            logger.warning(f"Bulk order intake for user {user.id} hit an idempotency key conflict")
+            return Response({'error': 'Some orders were created concurrently; retry the batch'},
+                            status=status.HTTP_409_CONFLICT)
+
+        if all_or_nothing and has_errors:
+            for index, key in created:
+                results[index] = {'index': index, 'idempotency_key': key, 'status': 'skipped'}
+            return Response({'success': False, 'created': 0, 'results': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        for (index, key), order in zip(created, orders):
+            results[index] = {'index': index, 'idempotency_key': key, 'status': 'created',
+                              'order_id': str(order.order_id), 'payment_status': order.payment_status}
+
+        logger.info(f"Bulk order intake for user {user.id}: {len(orders)} created out of {len(entries)} submitted")
+        return Response({
+            'success': not has_errors,
+            'created': len(orders),
+            'results': results,
+        }, status=status.HTTP_201_CREATED if orders else status.HTTP_200_OK)
+
+
+def archived_orders_for(user):
+    """Return the archived orders ``user`` may see, scoped like the order views."""
+    orders = ArchivedOrder.objects.for_serialization()
+
+    # Admin sees all orders
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return orders
+
+    # Branch manager sees only their branch's orders
+    if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+        return orders.filter(branch=user.branchmanager.branch)
+
+    # Customers see only their own orders
+    return orders.filter(customer_name=user)
+
 
 class OrderListView(generics.ListAPIView):
-    """View to list all orders."""
+    """View to list all orders.
+
+    Pages with a ``cursor`` over (order_date, order_id), merging in the
+    archived orders so that history reads as one list; ``?page=N`` keeps the
+    page-number response for older clients and lists live orders only.
+    """
     # pylint: disable=no-member
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderKeysetPagination
 
     def get_queryset(self):
         """Return orders based on user role.
@@ -164,19 +276,25 @@ class OrderListView(generics.ListAPIView):
         """
         user = self.request.user
         
+        orders = Order.objects.for_serialization()
+
         # Admin sees all orders
         if user.is_superuser or getattr(user, 'role', None) == 'admin':
-            return Order.objects.all().order_by('-order_date')
+            return orders.order_by('-order_date')
         
         # Branch manager sees only their branch's orders
         if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
-            return Order.objects.filter(branch=user.branchmanager.branch).order_by('-order_date')
+            return orders.filter(branch=user.branchmanager.branch).order_by('-order_date')
         
         # Customers see only their own orders
-        return Order.objects.filter(customer_name=user).order_by('-order_date')
+        return orders.filter(customer_name=user).order_by('-order_date')
+
+    def get_archive_queryset(self):
+        """Archived orders merged into the cursor pages by OrderKeysetPagination."""
+        return archived_orders_for(self.request.user)
 
 class OrderDetailView(generics.RetrieveAPIView):
-    """View to retrieve details of a specific order."""
+    """View to retrieve details of a specific order, live or archived."""
     # pylint: disable=no-member
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -184,17 +302,29 @@ class OrderDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         """Return orders based on user role."""
         user = self.request.user
+        orders = Order.objects.for_serialization()
         
         # Admin sees all orders
         if user.is_superuser or getattr(user, 'role', None) == 'admin':
-            return Order.objects.all()
+            return orders
         
         # Branch manager sees only their branch's orders
         if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
-            return Order.objects.filter(branch=user.branchmanager.branch)
+            return orders.filter(branch=user.branchmanager.branch)
         
         # Customers see only their own orders
-        return Order.objects.filter(customer_name=user)
+        return orders.filter(customer_name=user)
+
+    def get_object(self):
+        """Fall back to the archive for orders moved out by archive_orders."""
+        from django.http import Http404
+        try:
+            return super().get_object()
+        except Http404:
+            order = archived_orders_for(self.request.user).filter(pk=self.kwargs['pk']).first()
+            if order is None:
+                raise
+            return order
 
 class OrderUpdateView(generics.UpdateAPIView):
     """View to update an existing order."""
@@ -217,6 +347,11 @@ class OrderUpdateView(generics.UpdateAPIView):
         # Customers see only their own orders
         return Order.objects.filter(customer_name=user)
 
+    def perform_update(self, serializer):
+        """Save the order, recording the requesting user on any status event."""
+        serializer.instance._status_actor = self.request.user
+        serializer.save()
+
 class OrderDeleteView(generics.DestroyAPIView):
     """View to delete an existing order."""
     # pylint: disable=no-member
@@ -239,64 +374,446 @@ class OrderDeleteView(generics.DestroyAPIView):
         return Order.objects.filter(customer_name=user)
 
 
+# ---- ORDER STATUS EVENT VIEWS ----
+
+def status_events_for(user):
+    """Return the status events ``user`` may see, scoped like the order views."""
+    events = OrderStatusEvent.objects.all()
+
+    # Admin sees all events
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return events
+
+    # Branch manager sees only their branch's events
+    if hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+        return events.filter(branch=user.branchmanager.branch)
+
+    # Customers see only their own orders' events
+    return events.filter(customer=user)
+
+
+class OrderTimelineView(generics.ListAPIView):
+    """View to list the status history of a single order, oldest first."""
+    # pylint: disable=no-member
+    serializer_class = OrderStatusEventSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        from django.http import Http404
+        events = status_events_for(self.request.user).filter(order_id=self.kwargs['pk'])
+        events = events.select_related('actor').order_by('created_at', 'id')
+        if not events.exists():
+            raise Http404('Order not found')
+        return events
+
+    def list(self, request, *args, **kwargs):
+        """Serve archived orders from the history stored with them."""
+        from rest_framework.response import Response
+        archived = archived_orders_for(request.user).filter(pk=self.kwargs['pk']).values_list(
+            'status_history', flat=True
+        ).first()
+        if archived is not None:
+            return Response(archived)
+        return super().list(request, *args, **kwargs)
+
+
+class OrderActivityView(generics.ListAPIView):
+    """View to list recent order status changes, newest first.
+
+    Reads the status event log through its (scope, created_at, id) indexes and
+    pages with a cursor, so the feed never scans the orders table.
+    """
+    # pylint: disable=no-member
+    serializer_class = OrderStatusEventSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StatusEventKeysetPagination
+
+    def get_queryset(self):
+        return status_events_for(self.request.user).select_related('actor')
+
+
+class OrderStatusMetricsView(generics.GenericAPIView):
+    """View to report how long orders spend in each status.
+
+    Uses the durations stored on the status events whose transition happened
+    within the requested range (``7d``, ``1m`` or ``1y``).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+        from django.db.models import Avg, Max, Count
+        from django.utils import timezone
+        import datetime
+
+        time_range = request.query_params.get('range', '7d')
+        days = {'1m': 30, '1y': 365}.get(time_range, 7)
+        start_date = timezone.now() - datetime.timedelta(days=days)
+
+        rows = status_events_for(request.user).filter(
+            created_at__gte=start_date, time_in_previous_status__isnull=False
+        ).exclude(from_status='').values('from_status').annotate(
+            transitions=Count('id'),
+            average=Avg('time_in_previous_status'),
+            longest=Max('time_in_previous_status'),
+        ).order_by('from_status')
+
+        return Response({
+            'success': True,
+            'time_range': time_range,
+            'time_in_state': [
+                {
+                    'status': row['from_status'],
+                    'transitions': row['transitions'],
+                    'average_seconds': row['average'].total_seconds(),
+                    'max_seconds': row['longest'].total_seconds(),
+                }
+                for row in rows
+            ],
+        })
+
+
+# ---- ORDER EXPORT VIEW ----
+
+class OrderExportView(generics.GenericAPIView):
+    """View to stream an export of orders with their items and payment allocations.
+
+    Admins export every branch (or ``branch``); branch managers their own.
+    ``output`` is ``csv`` (default) or ``ndjson``; ``from`` / ``to``
+    (YYYY-MM-DD, inclusive) and ``status`` narrow the orders. Rows are streamed
+    as they are read, so the response starts immediately and memory stays flat.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from datetime import date, datetime, time, timedelta
+        from django.http import StreamingHttpResponse
+        from django.utils import timezone
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .export import stream_csv, stream_ndjson
+
+        user = request.user
+        if user.is_superuser or getattr(user, 'role', None) == 'admin':
+            orders = Order.objects.all()
+            if request.query_params.get('branch'):
+                orders = orders.filter(branch_id=request.query_params['branch'])
+        elif hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+            orders = Order.objects.filter(branch=user.branchmanager.branch)
+        else:
+            return Response({'error': 'Only admins and branch managers can export orders'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        output = request.query_params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            return Response({'error': 'output must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if request.query_params.get('from'):
+                start = date.fromisoformat(request.query_params['from'])
+                orders = orders.filter(order_date__gte=timezone.make_aware(datetime.combine(start, time.min)))
+            if request.query_params.get('to'):
+                end = date.fromisoformat(request.query_params['to']) + timedelta(days=1)
+                orders = orders.filter(order_date__lt=timezone.make_aware(datetime.combine(end, time.min)))
+        except ValueError:
+            return Response({'error': 'from/to must be dates in YYYY-MM-DD format'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('status'):
+            orders = orders.filter(status=request.query_params['status'])
+
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+        if output == 'csv':
+            response = StreamingHttpResponse(stream_csv(orders), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(stream_ndjson(orders), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="orders-{stamp}.{output}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+# ---- BULK STATUS TRANSITION VIEW ----
+
+class BulkStatusTransitionView(generics.GenericAPIView):
+    """View to change the status of many orders or deliveries in one transaction.
+
+    Expects ``{"kind": "order" | "delivery", "items": [{"id": ..., "status": ...}, ...],
+    "note": "", "all_or_nothing": false}``; ``{"ids": [...], "status": "washed"}``
+    is shorthand for moving every listed id to the same status. Changes are
+    validated against the transition tables and written with bulk_update (see
+    orders/transitions.py). The response carries one result per item, in
+    submission order: updated, unchanged, invalid, not_found or skipped.
+
+    Admins may change anything, branch managers their branch's orders and
+    deliveries, riders the deliveries assigned to them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        from django.db import transaction
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .transitions import MAX_BATCH_SIZE, transition_deliveries, transition_orders
+
+        user = request.user
+        data = request.data if isinstance(request.data, dict) else {}
+        kind = data.get('kind', 'order')
+        if kind not in ('order', 'delivery'):
+            return Response({'error': "kind must be 'order' or 'delivery'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = data.get('items')
+        if items is None and isinstance(data.get('ids'), list):
+            items = [{'id': object_id, 'status': data.get('status')} for object_id in data['ids']]
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items (or ids and status) must be a non-empty list'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_SIZE:
+            return Response({'error': f'A batch may contain at most {MAX_BATCH_SIZE} items'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        all_or_nothing = bool(data.get('all_or_nothing', False))
+        note = str(data.get('note') or '')[:255]
+
+        is_admin = user.is_superuser or getattr(user, 'role', None) == 'admin'
+        is_manager = hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager'
+        if kind == 'order':
+            if is_admin:
+                scope = Order.objects.all()
+            elif is_manager:
+                scope = Order.objects.filter(branch=user.branchmanager.branch)
+            else:
+                return Response({'error': 'Only admins and branch managers can change orders in bulk'},
+                                status=status.HTTP_403_FORBIDDEN)
+            transition = transition_orders
+        else:
+            if is_admin:
+                scope = Delivery.objects.all()
+            elif is_manager:
+                scope = Delivery.objects.filter(order__branch=user.branchmanager.branch)
+            elif getattr(user, 'role', None) == 'rider':
+                scope = Delivery.objects.filter(delivery_person=user)
+            else:
+                return Response({'error': 'Only staff and riders can change deliveries in bulk'},
+                                status=status.HTTP_403_FORBIDDEN)
+            transition = transition_deliveries
+
+        with transaction.atomic():
+            results, valid, apply = transition(scope, items, actor=user, note=note)
+            failed = any(result['status'] in ('invalid', 'not_found') for result in results.values())
+            if all_or_nothing and failed:
+                for index, obj, target in valid:
+                    results[index] = {'index': index, 'id': str(obj.pk), 'status': 'skipped',
+                                      'from_status': obj.status, 'to_status': target}
+            else:
+                apply()
+
+        ordered = [results[index] for index in range(len(items))]
+        updated = sum(1 for result in ordered if result['status'] == 'updated')
+        return Response({
+            'success': not failed,
+            'updated': updated,
+            'results': ordered,
+        }, status=status.HTTP_400_BAD_REQUEST if all_or_nothing and failed else status.HTTP_200_OK)
+
+
+# ---- STATUS STREAM VIEW ----
+
+class StreamTicketView(generics.GenericAPIView):
+    """Issue a ticket for opening the status stream from a browser.
+
+    EventSource cannot set an Authorization header, so the browser posts here
+    with its JWT and opens ``stream/?ticket=<ticket>`` within
+    STREAM_TICKET_TTL seconds. The ticket is only accepted by the stream, so
+    the access token itself never appears in a URL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+        from .realtime import STREAM_TICKET_TTL, issue_stream_ticket
+
+        return Response({'ticket': issue_stream_ticket(request.user), 'expires_in': STREAM_TICKET_TTL})
+
+
+def _stream_user(request):
+    """Authenticate a stream request by ``?ticket=`` (see StreamTicketView), JWT header or session."""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+    from rest_framework.exceptions import AuthenticationFailed
+    from .realtime import stream_ticket_user
+
+    if 'ticket' in request.GET:
+        return stream_ticket_user(request.GET['ticket'])
+    authentication = JWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+        if result is not None:
+            return result[0]
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return request.user if request.user.is_authenticated else None
+
+
+class OrderStatusStreamView(View):
+    """Server-sent events stream of order, delivery and payment status changes.
+
+    Replaces polling of the order and delivery views: each event carries a
+    compact delta (kind, id, status, ...) scoped to what the user may see, so
+    customers get their own orders, riders their deliveries, branch managers
+    their branch. Browsers authenticate with ``?ticket=`` from
+    StreamTicketView; other clients may send their JWT header. ``?order=<uuid>``
+    narrows the stream to one order. Resumes after Last-Event-ID (header or
+    ``?last_event_id=``); otherwise starts with the next change. See
+    orders/realtime.py.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        import uuid
+        from asgiref.sync import sync_to_async
+        from django.http import JsonResponse, StreamingHttpResponse
+        from .realtime import event_stream, latest_update_id, updates_for
+
+        user = await sync_to_async(_stream_user)(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        updates = await sync_to_async(updates_for)(user)
+        if request.GET.get('order'):
+            try:
+                updates = updates.filter(order_id=uuid.UUID(request.GET['order']))
+            except ValueError:
+                return JsonResponse({'error': 'order must be an order id'}, status=400)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        if last_event_id:
+            try:
+                last_id = int(last_event_id)
+            except ValueError:
+                return JsonResponse({'error': 'Last-Event-ID must be a number'}, status=400)
+        else:
+            last_id = await sync_to_async(latest_update_id)()
+
+        response = StreamingHttpResponse(event_stream(updates, last_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+# ---- SEARCH VIEW ----
+
+class SearchView(generics.GenericAPIView):
+    """View to search orders, customers and payments with one ranked query.
+
+    ``q`` is required (terms of at least 3 characters, all of which must
+    match); ``kind`` optionally limits results to a comma separated subset of
+    order, customer and payment. Results are scoped like the order views:
+    admins see everything, branch managers their branch, customers their own.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .models import SearchDocument
+        from .search import search, search_terms, MIN_TERM_LENGTH
+
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response({'error': f'q must contain a term of at least {MIN_TERM_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = [kind for kind in request.query_params.get('kind', '').split(',') if kind]
+        valid_kinds = dict(SearchDocument.KIND_CHOICES)
+        if any(kind not in valid_kinds for kind in kinds):
+            return Response({'error': f"kind must be one of {', '.join(valid_kinds)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search(request.user, query, kinds=kinds, limit=limit)
+        return Response({'success': True, 'query': query, 'count': len(results), 'results': results})
+
+
 # ---- ORDER STATS VIEW ----
 
 class OrderStatsView(generics.GenericAPIView):
-    """View to get order statistics including pending amount."""
+    """View to get order statistics including pending amount.
+
+    Admins and branch managers read the pre-aggregated daily branch rollups
+    (BranchDailyStats / BranchDailyServiceStats) instead of scanning orders;
+    customers' stats are computed from their own orders. Responses are cached
+    per scope and range until an order write invalidates them (see
+    orders/stats_cache.py); the X-Cache header says whether one was reused.
+    """
     permission_classes = [IsAuthenticated]
-    
+    CACHED_RANGES = ('7d', '1m', '1y')
+
     def get(self, request, *args, **kwargs):
         from rest_framework.response import Response
-        from django.db.models import Sum, Count, Q, F
-        from .models import OrderPayment
-        
+        from .stats_cache import GLOBAL_SCOPE, get_or_compute
+
         user = request.user
-        
+        time_range = request.query_params.get('range', '7d')
+        if user.is_superuser or getattr(user, 'role', None) == 'admin':
+            scope = GLOBAL_SCOPE
+        elif hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+            scope = f'branch:{user.branchmanager.branch_id}'
+        else:
+            scope = f'customer:{user.pk}'
+
+        if time_range not in self.CACHED_RANGES:
+            return Response(self._stats(user, time_range))
+        data, outcome = get_or_compute(scope, time_range, lambda: self._stats(user, time_range))
+        response = Response(data)
+        response['X-Cache'] = outcome.upper()
+        return response
+
+    def _stats(self, user, time_range):
+        """Compute the stats response data for ``user`` and ``time_range``."""
         # Get orders based on user role
+        branch = None
+        use_rollups = True
         if user.is_superuser or getattr(user, 'role', None) == 'admin':
             # Admin sees all orders
             orders = Order.objects.all()
         elif hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
             # Branch manager sees only their branch's orders
-            orders = Order.objects.filter(branch=user.branchmanager.branch)
+            branch = user.branchmanager.branch
+            orders = Order.objects.filter(branch=branch)
         else:
             # Customers see only their own orders
             orders = Order.objects.filter(customer_name=user)
-        
-        # Get time range from request
-        time_range = request.query_params.get('range', '7d')
+            use_rollups = False
         
         from django.utils import timezone
         import datetime
-        from django.db.models.functions import TruncDay, TruncMonth
         
         now = timezone.now()
         start_date = now - datetime.timedelta(days=7) # Default 7d
-        trunc_func = TruncDay('order_date')
+        by_month = False
         date_format = '%A' # Day name
         
         if time_range == '1m':
             start_date = now - datetime.timedelta(days=30)
-            trunc_func = TruncDay('order_date')
             date_format = '%d %b' # 12 Jan
         elif time_range == '1y':
             start_date = now - datetime.timedelta(days=365)
-            trunc_func = TruncMonth('order_date')
+            by_month = True
             date_format = '%B' # Month name
 
-        # Filter orders by date range
-        range_orders = orders.filter(order_date__gte=start_date)
+        if use_rollups:
+            chart_rows, service_rows, branch_rows, range_stats = self._rollup_stats(
+                branch, timezone.localtime(start_date).date(), by_month
+            )
+        else:
+            chart_rows, service_rows, branch_rows, range_stats = self._order_stats(
+                orders.filter(order_date__gte=start_date), by_month
+            )
 
         # 1. Chart Data (Orders & Income over time)
-        chart_data_raw = range_orders.annotate(
-            period=trunc_func
-        ).values('period').annotate(
-            orders=Count('order_id'),
-            income=Sum('total_amount', filter=Q(payment_status='paid')),
-        ).order_by('period')
-
         chart_data = []
-        for entry in chart_data_raw:
+        for entry in chart_rows:
             if entry['period']:
                 chart_data.append({
                     'label': entry['period'].strftime(date_format),
@@ -306,52 +823,30 @@ class OrderStatsView(generics.GenericAPIView):
                 })
 
         # 2. Service Distribution (Top 5)
-        # Using OrderItem to count service usage
-        from .models import OrderItem
-        service_dist_raw = OrderItem.objects.filter(
-            order__in=range_orders
-        ).values('service_type').annotate(
-            value=Count('id')
-        ).order_by('-value')[:5]
-
         service_distribution = [
             {'name': item['service_type'], 'value': item['value']}
-            for item in service_dist_raw
+            for item in service_rows
         ]
 
         # 3. Branch Performance
-        branch_perf_raw = range_orders.values(
-            'branch__name'
-        ).annotate(
-            orders=Count('order_id'),
-            income=Sum('total_amount', filter=Q(payment_status='paid'))
-        ).order_by('-income')[:5]
-
         branch_performance = [
             {
                 'branch': item['branch__name'], 
                 'orders': item['orders'], 
                 'income': float(item['income'] or 0)
             }
-            for item in branch_perf_raw
+            for item in branch_rows
         ]
 
-        # 4. Recent Activity (Latest 5 items from Orders, Deliveries, Payments)
-        # For simplicity, we'll just show recent Orders and their status changes
-        recent_activity_orders = orders.order_by('-order_date')[:5]
+        # 4. Recent Activity (latest 5 status changes from the status event log)
+        recent_events = status_events_for(user).order_by('-created_at', '-id')[:5]
         recent_activity = []
-        for o in recent_activity_orders:
+        for event in recent_events:
             recent_activity.append({
-                'action': f"Order #{str(o.order_id)[:8]} {o.status}",
-                'time': o.order_date, # Serializer will format this or we do it here
+                'action': f"Order #{str(event.order_id)[:8]} {event.to_status}",
+                'time': event.created_at, # Serializer will format this or we do it here
                 'type': 'order'
             })
-            
-        # Stats Cards (Totals for the selected range)
-        range_stats = range_orders.aggregate(
-            total_orders=Count('order_id'),
-            total_income=Sum('total_amount', filter=Q(payment_status='paid')),
-        )
         
         # ACTVE ORDERS: Should be a snapshot of CURRENT active orders, not filtered by date range
         # Also added 'dropped by user' to active statuses
@@ -362,7 +857,7 @@ class OrderStatsView(generics.GenericAPIView):
             ]
         ).count()
 
-        return Response({
+        return {
             'success': True,
             'time_range': time_range,
             'stats': {
@@ -376,16 +871,109 @@ class OrderStatsView(generics.GenericAPIView):
             'recent_activity': recent_activity, # Need frontend to format time
             # Keep legacy support for pending amounts block if needed, or remove if dashboard doesn't use it
              # 'pending_orders': ... (omitted for dashboard performance, use separate endpoint if needed)
+        }
+
+    def _rollup_stats(self, branch, start_day, by_month):
+        """Merge the daily branch rollups from ``start_day`` onwards."""
+        from django.db.models import Sum, F
+        from django.db.models.functions import TruncMonth
+        from .models import BranchDailyStats, BranchDailyServiceStats
+
+        daily = BranchDailyStats.objects.filter(day__gte=start_day)
+        services = BranchDailyServiceStats.objects.filter(day__gte=start_day)
+        if branch is not None:
+            daily = daily.filter(branch=branch)
+            services = services.filter(branch=branch)
+
+        chart_rows = daily.annotate(
+            period=TruncMonth('day') if by_month else F('day')
+        ).values('period').annotate(
+            orders=Sum('orders_count'),
+            income=Sum('paid_income'),
+        ).order_by('period')
+
+        service_rows = services.values('service_type').annotate(
+            value=Sum('items_count')
+        ).filter(value__gt=0).order_by('-value')[:5]
+
+        branch_rows = daily.values('branch__name').annotate(
+            orders=Sum('orders_count'),
+            income=Sum('paid_income'),
+        ).order_by('-income')[:5]
+
+        range_stats = daily.aggregate(
+            total_orders=Sum('orders_count'),
+            total_income=Sum('paid_income'),
+        )
+        return chart_rows, service_rows, branch_rows, range_stats
+
+    def _order_stats(self, range_orders, by_month):
+        """Aggregate stats directly over a (small) set of orders, e.g. one customer's."""
+        from django.db.models import Sum, Count, Q
+        from django.db.models.functions import TruncDay, TruncMonth
+        from .models import OrderItem
+
+        chart_rows = range_orders.annotate(
+            period=TruncMonth('order_date') if by_month else TruncDay('order_date')
+        ).values('period').annotate(
+            orders=Count('order_id'),
+            income=Sum('total_amount', filter=Q(payment_status='paid')),
+        ).order_by('period')
+
+        # Using OrderItem to count service usage
+        service_rows = OrderItem.objects.filter(
+            order__in=range_orders
+        ).values('service_type').annotate(
+            value=Count('id')
+        ).order_by('-value')[:5]
+
+        branch_rows = range_orders.values(
+            'branch__name'
+        ).annotate(
+            orders=Count('order_id'),
+            income=Sum('total_amount', filter=Q(payment_status='paid'))
+        ).order_by('-income')[:5]
+
+        range_stats = range_orders.aggregate(
+            total_orders=Count('order_id'),
+            total_income=Sum('total_amount', filter=Q(payment_status='paid')),
+        )
+        return chart_rows, service_rows, branch_rows, range_stats
+
+
+class OrderStatsCacheView(generics.GenericAPIView):
+    """View to report the hit, miss and coalesced counts of the OrderStatsView cache (admins only)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .stats_cache import counters
+
+        user = request.user
+        if not (user.is_superuser or getattr(user, 'role', None) == 'admin'):
+            return Response({'error': 'Only admins can view cache statistics'}, status=status.HTTP_403_FORBIDDEN)
+        counts = counters()
+        lookups = counts['hits'] + counts['misses'] + counts['coalesced']
+        return Response({
+            'success': True,
+            **counts,
+            'hit_ratio': round((counts['hits'] + counts['coalesced']) / lookups, 4) if lookups else None,
         })
 
 
 # ---- DELIVERY VIEWS ----
 
 class DeliveryListView(generics.ListAPIView):
-    """View to list all deliveries."""
+    """View to list all deliveries.
+
+    Pages with a ``cursor`` over (delivery_date, id); ``?page=N`` keeps the
+    page-number response for older clients.
+    """
     # pylint: disable=no-member
     serializer_class = DeliverySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DeliveryKeysetPagination
 
     def get_queryset(self):
         """
@@ -393,9 +981,14 @@ class DeliveryListView(generics.ListAPIView):
         Riders see only their assigned deliveries.
         """
         user = self.request.user
+        deliveries = Delivery.objects.select_related(
+            'order__customer_name', 'order__branch'
+        ).prefetch_related(
+            models.Prefetch('order__customer_name__addresses', queryset=UserAddress.objects.order_by('id'))
+        )
         if getattr(user, 'role', None) == 'rider':
-            return Delivery.objects.filter(delivery_person=user).order_by('-delivery_date')
-        return Delivery.objects.all().order_by('-delivery_date')
+            return deliveries.filter(delivery_person=user).order_by('-delivery_date')
+        return deliveries.order_by('-delivery_date')
 
 class DeliveryCreateView(generics.CreateAPIView):
     """View to create a new delivery."""
@@ -429,14 +1022,187 @@ class DeliveryUpdateView(generics.UpdateAPIView):
             order = instance.order
             # Only update if order is in 'pending pickup' state to avoid overwriting other statuses
             if order.status == 'pending pickup':
-                order.status = 'picked up'
-                order.save()
+                order.transition_to('picked up', actor=self.request.user, note='Pickup delivered')
                 
         # If delivery type is drop (delivery to customer) and status is delivered, update order status to 'delivered'
         if instance.delivery_type == 'drop' and instance.status == 'delivered':
             order = instance.order
-            order.status = 'delivered'
-            order.save()
+            if order.can_transition_to('delivered'):
+                order.transition_to('delivered', actor=self.request.user, note='Drop delivered')
+            else:
+                import logging
+                logging.getLogger(__name__).warning(
+                    f"[ORDER STATUS] Drop {instance.id} delivered but order {order.order_id} "
+                    f"is '{order.status}'; order status left unchanged"
+                )
+
+class SlotAvailabilityView(generics.GenericAPIView):
+    """View to list open pickup/delivery time slots of a branch for the next ``days`` days.
+
+    Reads the SlotCapacity counters only (one query); days and slots without a
+    counter row have the default capacity free. Slots that already started
+    today are reported as closed.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 31
+
+    def get(self, request, *args, **kwargs):
+        from datetime import datetime, timedelta
+        from django.utils import timezone
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .models import SlotCapacity, default_slot_capacity
+        from .serializers import OrderCreateSerializer
+
+        branch_id = request.query_params.get('branch')
+        if not branch_id or not str(branch_id).isdigit():
+            return Response({'error': 'branch is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = min(max(int(request.query_params.get('days', 7)), 1), self.MAX_DAYS)
+        except ValueError:
+            return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.localtime()
+        first_day = now.date()
+        last_day = first_day + timedelta(days=days - 1)
+        counters = {
+            (row.day, row.slot): row
+            for row in SlotCapacity.objects.filter(branch_id=branch_id, day__range=(first_day, last_day))
+        }
+        default_capacity = default_slot_capacity()
+
+        availability = []
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            slots = []
+            for slot, label in Delivery.TIME_SLOTS:
+                row = counters.get((day, slot))
+                capacity = row.capacity if row else default_capacity
+                reserved = row.reserved if row else 0
+                started = day == first_day and \
+                    datetime.combine(day, OrderCreateSerializer.SLOT_START_TIMES[slot]) <= now.replace(tzinfo=None)
+                slots.append({
+                    'slot': slot,
+                    'label': label,
+                    'capacity': capacity,
+                    'reserved': reserved,
+                    'available': max(capacity - reserved, 0),
+                    'open': not started and reserved < capacity,
+                })
+            availability.append({'date': day.isoformat(), 'slots': slots})
+
+        return Response({'success': True, 'branch': int(branch_id), 'days': availability})
+
+
+class DeliveryManifestView(generics.GenericAPIView):
+    """View to get a rider's planned route for a day, grouped by time slot.
+
+    Riders get their own manifest; admins and branch managers pass ``rider``.
+    ``date`` (YYYY-MM-DD) defaults to today. The planned sequence is cached
+    until one of the rider's deliveries changes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from collections import Counter
+        from datetime import date, datetime, time, timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        from rest_framework.response import Response
+        from rest_framework import status
+        from .models import OPEN_DELIVERY_STATUSES
+        from .routing import build_manifest, manifest_cache_key, parse_coordinates, MANIFEST_CACHE_TIMEOUT
+
+        user = request.user
+        role = getattr(user, 'role', None)
+        if role == 'rider':
+            rider_id = user.id
+        elif user.is_superuser or role in ('admin', 'branch_manager'):
+            rider_id = request.query_params.get('rider')
+            if not rider_id or not str(rider_id).isdigit():
+                return Response({'error': 'rider is required'}, status=status.HTTP_400_BAD_REQUEST)
+            rider_id = int(rider_id)
+        else:
+            return Response({'error': 'Only riders and staff can view manifests'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            day = date.fromisoformat(request.query_params['date']) if request.query_params.get('date') \
+                else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'date must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = manifest_cache_key(rider_id, day)
+        manifest = cache.get(cache_key)
+        cached = manifest is not None
+        if not cached:
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            end = start + timedelta(days=1)
+            deliveries = list(Delivery.objects.filter(
+                delivery_person_id=rider_id, status__in=OPEN_DELIVERY_STATUSES
+            ).filter(
+                models.Q(delivery_start_time__gte=start, delivery_start_time__lt=end)
+                | models.Q(delivery_start_time__isnull=True, delivery_date__gte=start, delivery_date__lt=end)
+            ).select_related('order__branch').order_by('id'))
+
+            # Start each slot's route at the branch most of the stops belong to
+            origin = None
+            if deliveries:
+                branches = Counter(delivery.order.branch for delivery in deliveries)
+                origin = parse_coordinates(branches.most_common(1)[0][0].map_link)
+
+            manifest = build_manifest(deliveries, Delivery.TIME_SLOTS, start=origin)
+            cache.set(cache_key, manifest, MANIFEST_CACHE_TIMEOUT)
+
+        return Response({
+            'success': True,
+            'rider': rider_id,
+            'date': day.isoformat(),
+            'slots': manifest,
+            'cached': cached,
+        })
+
+
+class DeliveryRebalanceView(generics.GenericAPIView):
+    """View to spread pending deliveries evenly across active riders.
+
+    Admins rebalance every branch (or ``branch`` from the body); branch managers
+    only their own branch. Only deliveries still pending and scheduled from
+    ``since`` (YYYY-MM-DD, default today) onwards are moved.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        from datetime import date
+        from rest_framework.response import Response
+        from rest_framework import status
+        from branches.models import Branch
+        from .assignment import pending_deliveries, rebalance_deliveries
+
+        user = request.user
+        if user.is_superuser or getattr(user, 'role', None) == 'admin':
+            branch = None
+            if request.data.get('branch'):
+                branch = Branch.objects.filter(id=request.data['branch']).first()
+                if branch is None:
+                    return Response({'error': 'Branch not found'}, status=status.HTTP_404_NOT_FOUND)
+        elif hasattr(user, 'branchmanager') and getattr(user, 'role', None) == 'branch_manager':
+            branch = user.branchmanager.branch
+        else:
+            return Response({'error': 'Only admins and branch managers can rebalance deliveries'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        since = None
+        if request.data.get('since'):
+            try:
+                since = date.fromisoformat(str(request.data['since']))
+            except ValueError:
+                return Response({'error': 'since must be a date in YYYY-MM-DD format'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        rebalanced, moved = rebalance_deliveries(pending_deliveries(since=since, branch=branch))
+        return Response({'success': True, 'rebalanced': rebalanced, 'moved': moved})
+
 
 class DeliveryDeleteView(generics.DestroyAPIView):
     """View to delete an existing delivery."""
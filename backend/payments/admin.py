@@ -1,7 +1,7 @@
 """Admin configuration for managing payments and subscriptions in the Django admin interface."""
 # payments/admin.py
 from django.contrib import admin
-from .models import Payment, Subscription
+from .models import Payment, PaymentCallback, Subscription
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -44,3 +44,12 @@ class SubscriptionAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(PaymentCallback)
+class PaymentCallbackAdmin(admin.ModelAdmin):
+    """Admin interface for inspecting the payment callback inbox."""
+    list_display = ['transaction_uuid', 'source', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'source']
+    search_fields = ['transaction_uuid']
+    readonly_fields = ['transaction_uuid', 'source', 'payload', 'received_at', 'claimed_at', 'processed_at']
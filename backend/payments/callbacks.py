@@ -0,0 +1,201 @@
+"""Inbox of eSewa payment callbacks.
+
+PaymentSuccessView (eSewa's redirect) and VerifyEsewaPaymentView (the
+frontend's confirmation) used to decode, verify, lock and allocate inside the
+request, so a storm of duplicate callbacks for one transaction all queued on
+the same payment and order rows. Now they record the callback with
+``record_callback``, of which each transaction keeps one live row. The
+redirect's signature is checked before it is stored and the customer is sent
+on at once; the frontend follows progress through PaymentProgressView, which
+reads the database and never locks. VerifyEsewaPaymentView claims and
+processes its callback inline when no worker has it, so it still answers with
+the receipt, and falls back to 202 when a worker is busy with it.
+
+``process_pending_callbacks`` (run by the process_payment_callbacks command)
+works through the inbox oldest first. Each callback is claimed with a
+conditional UPDATE, so several workers can share the queue. The worker
+verifies it: the signature for redirects, the amount for frontend
+confirmations. Then it drives ProcessPaymentView, which creates the order
+from ``order_data``, allocates the payment and marks it complete. Callbacks
+that fail to verify are rejected. Errors are retried up to MAX_ATTEMPTS
+times.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import Payment, PaymentCallback
+from .utils import EsewaPaymentUtils
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+CLAIM_TIMEOUT = timedelta(minutes=5)  # a claim older than this belongs to a dead worker
+
+
+class CallbackRejected(Exception):
+    """The callback failed verification and must not be retried."""
+
+
+def record_callback(transaction_uuid, source, payload):
+    """Add a callback to the inbox unless the transaction already has a live one.
+
+    Returns the transaction's live callback, or None when it has none (for
+    instance because the last one was rejected while this one was being
+    recorded).
+    """
+    PaymentCallback.objects.bulk_create(
+        [PaymentCallback(transaction_uuid=transaction_uuid, source=source, payload=payload)],
+        ignore_conflicts=True,
+    )
+    return live_callback(transaction_uuid)
+
+
+def live_callback(transaction_uuid):
+    """The transaction's callback that is waiting, in progress or done."""
+    return PaymentCallback.objects.filter(transaction_uuid=transaction_uuid).exclude(
+        status__in=['rejected', 'failed']
+    ).first()
+
+
+def _amount_matches(amount, payment):
+    try:
+        return Decimal(str(amount)) == payment.total_amount
+    except (InvalidOperation, TypeError):
+        return False
+
+
+def verify_callback(callback, payment):
+    """Check the callback against the payment. Raises CallbackRejected when it does not match."""
+    payload = callback.payload
+    if callback.source == 'redirect':
+        if not EsewaPaymentUtils.verify_signature(payload, payload.get('signature')):
+            raise CallbackRejected('Invalid signature')
+        amount = payload.get('total_amount')
+    else:
+        amount = payload.get('amount')
+    if not _amount_matches(str(amount).replace(',', ''), payment):
+        raise CallbackRejected(f'Payment amount mismatch: Rs.{amount}')
+
+
+def process_callback(callback):
+    """Verify one claimed callback and apply it to its payment.
+
+    Raises CallbackRejected for callbacks that fail verification, and any
+    other error for callbacks worth retrying.
+    """
+    from .views import PaymentSuccessView, ProcessPaymentView
+
+    payment = Payment.objects.filter(transaction_uuid=callback.transaction_uuid).first()
+    if payment is None:
+        raise CallbackRejected('Payment not found')
+    if payment.status == 'COMPLETE' and payment.processed_at:
+        logger.info(f"[PAYMENT_CALLBACK] Payment {payment.transaction_uuid} already processed")
+        return
+    verify_callback(callback, payment)
+
+    payload = callback.payload
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().get(pk=payment.pk)
+        if payment.status == 'COMPLETE':
+            logger.info(f"[PAYMENT_CALLBACK] Payment {payment.transaction_uuid} is already {payment.status}")
+            return
+        if callback.source == 'redirect':
+            payment.transaction_code = payload.get('transaction_code')
+            esewa_status = payload.get('status', 'COMPLETE')
+            if esewa_status != 'COMPLETE':
+                payment.status = esewa_status
+                payment.processed_at = timezone.now()
+                payment.save()
+                return
+        else:
+            ref_id = payload.get('transaction_code') or payload.get('refId')
+            payment.transaction_code = ref_id
+            payment.ref_id = ref_id
+        payment.save()
+
+    response = ProcessPaymentView().post(None, payment.transaction_uuid)
+    if response.status_code != 200:
+        raise RuntimeError(f'Processing failed with HTTP {response.status_code}: {response.content[:200]!r}')
+    if callback.source == 'redirect':
+        payment.refresh_from_db()
+        PaymentSuccessView()._update_subscription(payment)
+
+
+def release_stale_claims(now=None):
+    """Put callbacks claimed by workers that died back in the queue."""
+    now = now or timezone.now()
+    return PaymentCallback.objects.filter(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT).update(
+        status='received'
+    )
+
+
+def claim(callback):
+    """Take a waiting callback for this worker. False when another worker got it first."""
+    now = timezone.now()
+    claimed = PaymentCallback.objects.filter(pk=callback.pk, status='received').update(
+        status='processing', claimed_at=now, attempts=models.F('attempts') + 1
+    )
+    if claimed:
+        callback.status, callback.claimed_at = 'processing', now
+        callback.attempts += 1
+    return bool(claimed)
+
+
+def _finish(callback, status, error=''):
+    callback.status, callback.error = status, error
+    callback.processed_at = timezone.now() if status != 'received' else None
+    PaymentCallback.objects.filter(pk=callback.pk).update(
+        status=status, error=error, processed_at=callback.processed_at
+    )
+
+
+def handle_callback(callback):
+    """Process a claimed callback and record the outcome. Returns the callback's new status."""
+    try:
+        process_callback(callback)
+    except CallbackRejected as e:
+        logger.warning(f"[PAYMENT_CALLBACK] Rejected callback for {callback.transaction_uuid}: {e}")
+        _finish(callback, 'rejected', str(e))
+    except Exception as e:
+        logger.exception(f"[PAYMENT_CALLBACK] Callback for {callback.transaction_uuid} failed: %s", e)
+        _finish(callback, 'received' if callback.attempts < MAX_ATTEMPTS else 'failed', str(e))
+    else:
+        _finish(callback, 'processed')
+    return callback.status
+
+
+def process_pending_callbacks(batch_size=CALLBACK_BATCH_SIZE, limit=None, dry_run=False):
+    """Work through the waiting callbacks once, oldest first.
+
+    Each callback is tried at most once per call; one that fails waits for the
+    next. With ``dry_run`` the waiting callbacks are only counted. Returns
+    outcome counts.
+    """
+    totals = {'seen': 0, 'processed': 0, 'rejected': 0, 'retrying': 0, 'failed': 0, 'skipped': 0}
+    if not dry_run:
+        release_stale_claims()
+    queue = PaymentCallback.objects.filter(status='received').order_by('id')
+    last_id = 0
+    while limit is None or totals['seen'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals['seen'])
+        batch = list(queue.filter(id__gt=last_id)[:size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        totals['seen'] += len(batch)
+        if dry_run:
+            continue
+        for callback in batch:
+            if not claim(callback):
+                totals['skipped'] += 1
+                continue
+            outcome = handle_callback(callback)
+            totals['retrying' if outcome == 'received' else outcome] += 1
+        logger.info(f"[PAYMENT_CALLBACK] {totals['seen']} callbacks seen so far: {totals['processed']} processed, "
+                    f"{totals['rejected']} rejected")
+    return totals
@@ -0,0 +1,145 @@
+"""Client for eSewa's transaction status API.
+
+Status calls go through keep-alive sessions (one shared by the request
+handlers, one per reconciliation sweep) and a circuit breaker kept in the
+cache: after BREAKER_THRESHOLD consecutive failed calls the circuit opens and
+calls fail fast with EsewaUnavailable for BREAKER_COOLDOWN seconds. After
+that, one trial call is let through. Its success closes the circuit and its
+failure opens it again.
+
+``cached_status`` also remembers each answer for STATUS_CACHE_TIMEOUT
+seconds, so a page polling a pending payment does not call eSewa on every
+poll.
+
+Both live in the default cache. With a shared backend (CACHE_URL) all
+workers trip and reset one breaker; with LocMemCache each worker counts its
+own failures.
+"""
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 10  # seconds per status call
+SHARED_POOL_SIZE = 10
+STATUS_CACHE_TIMEOUT = 10
+BREAKER_THRESHOLD = 5  # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 30  # seconds the circuit stays open
+FAILURES_KEY = 'esewa-breaker:failures'
+OPEN_KEY = 'esewa-breaker:open'
+TRIPPED_KEY = 'esewa-breaker:tripped'
+TRIAL_KEY = 'esewa-breaker:trial'
+
+
+class EsewaUnavailable(Exception):
+    """eSewa is failing and the circuit breaker is open."""
+
+
+def esewa_session(pool_size=SHARED_POOL_SIZE):
+    """A keep-alive session holding up to ``pool_size`` connections, retrying gateway errors."""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session():
+    """This process's session for status calls made while handling requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = esewa_session()
+        return _session
+
+
+def circuit_open():
+    """Whether status calls are currently failing fast."""
+    return cache.get(OPEN_KEY) is not None
+
+
+def _before_call():
+    if circuit_open():
+        raise EsewaUnavailable('eSewa status checks are failing; try again shortly')
+    if cache.get(TRIPPED_KEY) is not None and not cache.add(TRIAL_KEY, 1, REQUEST_TIMEOUT * 3):
+        # Cooling down after an open circuit and another request is already trying eSewa
+        raise EsewaUnavailable('eSewa status checks are failing; try again shortly')
+
+
+def _record_success():
+    cache.delete_many([FAILURES_KEY, TRIPPED_KEY, TRIAL_KEY])
+
+
+def _record_failure():
+    cache.add(FAILURES_KEY, 0, None)
+    try:
+        failures = cache.incr(FAILURES_KEY)
+    except ValueError:
+        # Evicted between add() and incr()
+        failures = 1
+        cache.set(FAILURES_KEY, failures, None)
+    if failures >= BREAKER_THRESHOLD or cache.get(TRIPPED_KEY) is not None:
+        logger.warning(f"[ESEWA] {failures} status checks failed in a row; failing fast for {BREAKER_COOLDOWN}s")
+        cache.set(OPEN_KEY, 1, BREAKER_COOLDOWN)
+        cache.set(TRIPPED_KEY, 1, None)
+        cache.delete_many([FAILURES_KEY, TRIAL_KEY])
+
+
+def reset_breaker():
+    """Close the circuit and forget past failures."""
+    cache.delete_many([FAILURES_KEY, OPEN_KEY, TRIPPED_KEY, TRIAL_KEY])
+
+
+def fetch_status(session, transaction_uuid, total_amount):
+    """Ask eSewa about one transaction.
+
+    Returns the decoded answer, or None when the call failed. Raises
+    EsewaUnavailable without calling out while the circuit is open.
+    """
+    _before_call()
+    try:
+        response = session.get(settings.ESEWA_STATUS_CHECK_URL, params={
+            'product_code': settings.ESEWA_PRODUCT_CODE,
+            'total_amount': int(total_amount),
+            'transaction_uuid': transaction_uuid,
+        }, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"[ESEWA] Status check for {transaction_uuid} failed: {e}")
+        _record_failure()
+        return None
+    if response.status_code >= 500:
+        logger.warning(f"[ESEWA] Status check for {transaction_uuid} returned HTTP {response.status_code}")
+        _record_failure()
+        return None
+    # eSewa answered: whatever it said, it is up
+    _record_success()
+    if response.status_code != 200:
+        logger.warning(f"[ESEWA] Status check for {transaction_uuid} returned HTTP {response.status_code}")
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        logger.warning(f"[ESEWA] Status check for {transaction_uuid} returned invalid JSON")
+        return None
+
+
+def cached_status(transaction_uuid, total_amount):
+    """fetch_status through the shared session, reusing an answer from the last few seconds."""
+    key = f'esewa-status:{transaction_uuid}:{int(total_amount)}'
+    answer = cache.get(key)
+    if answer is None:
+        answer = fetch_status(shared_session(), transaction_uuid, total_amount)
+        if answer is not None:
+            cache.set(key, answer, STATUS_CACHE_TIMEOUT)
+    return answer
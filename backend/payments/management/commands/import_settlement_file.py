@@ -0,0 +1,70 @@
+"""
+Management command to complete pending payments from a settlement file.
+Reads a bank statement or eSewa settlement CSV as a stream, completes every
+PENDING payment a row confirms and writes the rows it could not use, with the
+reason, to an exceptions report.
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from payments.settlement import CHUNK_SIZE, FORMATS, SettlementFileError, import_settlement
+
+
+class Command(BaseCommand):
+    help = 'Complete pending bank or eSewa payments confirmed by a settlement CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Settlement CSV file ('-' reads standard input)")
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='bank',
+            help='bank for bank statements, esewa for eSewa settlement files',
+        )
+        parser.add_argument(
+            '--exceptions',
+            default=None,
+            help='Write the rows that completed nothing to this CSV file',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Rows matched per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Match the file and report without changing any payment',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be >= 1')
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8-sig')
+        exceptions = open(options['exceptions'], 'w', newline='', encoding='utf-8') if options['exceptions'] else None
+        try:
+            counts = import_settlement(stream, options['format'], exceptions=exceptions,
+                                       chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        except SettlementFileError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if exceptions:
+                exceptions.close()
+
+        self.stdout.write('\n' + '='*60)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No payments were changed'))
+            self.stdout.write(f"Would complete: {counts['matched']}")
+        else:
+            self.stdout.write(self.style.SUCCESS('SETTLEMENT IMPORT COMPLETE'))
+            self.stdout.write(f"Completed: {counts['completed']}")
+        self.stdout.write(f"Rows read: {counts['rows']}")
+        self.stdout.write(f"Exceptions: {counts['exceptions']}")
+        if options['exceptions']:
+            self.stdout.write(f"Exceptions report: {options['exceptions']}")
+        self.stdout.write('='*60)
@@ -0,0 +1,70 @@
+"""
+Management command to work through the payment callback inbox.
+eSewa redirects and frontend confirmations are only recorded when they
+arrive; this verifies each one and processes its payment. Run it from cron,
+or with --interval as a long-running worker. Several workers can run at once.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from payments.callbacks import CALLBACK_BATCH_SIZE, process_pending_callbacks
+
+
+class Command(BaseCommand):
+    help = 'Verify recorded payment callbacks and process their payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=CALLBACK_BATCH_SIZE,
+            help='Callbacks read per batch',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Process at most this many callbacks per pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Keep running, passing over the inbox every this many seconds (0 passes once)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the waiting callbacks without processing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be >= 1')
+        if options['interval'] < 0:
+            raise CommandError('--interval must be >= 0')
+
+        while True:
+            totals = process_pending_callbacks(
+                batch_size=options['batch_size'], limit=options['limit'], dry_run=options['dry_run'],
+            )
+            if totals['seen'] or not options['interval']:
+                self._summary(totals, options['dry_run'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def _summary(self, totals, dry_run):
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No callbacks were processed'))
+            self.stdout.write(f"Waiting: {totals['seen']}")
+        else:
+            self.stdout.write(self.style.SUCCESS('CALLBACK PROCESSING COMPLETE'))
+            self.stdout.write(f"Processed: {totals['processed']}")
+            self.stdout.write(f"Rejected: {totals['rejected']}")
+            self.stdout.write(f"Retrying later: {totals['retrying']}")
+            self.stdout.write(f"Failed: {totals['failed']}")
+            self.stdout.write(f"Taken by another worker: {totals['skipped']}")
+        self.stdout.write('='*60)
@@ -0,0 +1,81 @@
+"""
+Management command to reconcile eSewa payments left pending by abandoned browser tabs.
+Asks eSewa's status API about every payment pending for longer than
+ESEWA_RECONCILE_AFTER_MINUTES, processes the completed ones and closes the
+cancelled, refunded and expired ones. Run it from cron, or with --interval
+as a long-running worker.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from payments.esewa import esewa_session
+from payments.reconciliation import RECONCILE_BATCH_SIZE, RECONCILE_WORKERS, reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = 'Check pending eSewa payments with eSewa and apply their status'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RECONCILE_BATCH_SIZE,
+            help='Payments checked per batch',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=RECONCILE_WORKERS,
+            help='Concurrent status calls to eSewa',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Check at most this many payments per sweep',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running, sweeping every this many seconds (0 sweeps once)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Ask eSewa but show what would change without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be >= 1')
+        if options['interval'] < 0:
+            raise CommandError('--interval must be >= 0')
+
+        # One keep-alive session for every sweep
+        session = esewa_session(options['workers'])
+        while True:
+            totals = reconcile_pending_payments(
+                batch_size=options['batch_size'], workers=options['workers'], limit=options['limit'],
+                dry_run=options['dry_run'], session=session,
+            )
+            self._summary(totals, options['dry_run'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def _summary(self, totals, dry_run):
+        self.stdout.write('\n' + '='*60)
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('DRY RUN COMPLETE - No payments were changed'))
+            self.stdout.write(f"Would complete: {totals['completed']}")
+            self.stdout.write(f"Would close: {totals['closed']}")
+        else:
+            self.stdout.write(self.style.SUCCESS('RECONCILIATION COMPLETE'))
+            self.stdout.write(f"Completed: {totals['completed']}")
+            self.stdout.write(f"Closed: {totals['closed']}")
+        self.stdout.write(f"Checked: {totals['checked']}")
+        self.stdout.write(f"Still pending: {totals['unchanged']}")
+        self.stdout.write(f"Status check errors: {totals['errors']}")
+        self.stdout.write('='*60)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_payment_type_status_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_uuid', models.CharField(max_length=100)),
+                ('source', models.CharField(choices=[('redirect', 'eSewa redirect'), ('verify', 'Frontend verification')], max_length=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('received', 'Received'), ('processing', 'Processing'), ('processed', 'Processed'), ('rejected', 'Rejected'), ('failed', 'Failed')], default='received', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='payments_pa_status_8ee87c_idx'), models.Index(fields=['transaction_uuid', 'received_at'], name='payments_pa_transac_374c41_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['rejected', 'failed']), _negated=True), fields=('transaction_uuid',), name='unique_live_payment_callback')],
+            },
+        ),
+    ]
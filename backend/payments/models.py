@@ -55,6 +55,12 @@ class Payment(models.Model):
                 condition=models.Q(idempotency_key__isnull=False)
             )
         ]
+        indexes = [
+            # Keyset pagination of a user's payment history on (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id']),
+            # Staff queue of payments awaiting verification, newest first
+            models.Index(fields=['payment_type', 'status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Payment {self.transaction_uuid} - Rs.{self.total_amount}"
@@ -77,3 +83,50 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f"Subscription - Active: {self.is_active}"
+
+
+class PaymentCallback(models.Model):
+    """A payment gateway callback, recorded as received and processed later by a worker.
+
+    Only one live callback is kept per transaction; duplicates are dropped on
+    insert. Rejected and failed callbacks do not count, so a genuine callback
+    arriving after a forged one is still recorded.
+    """
+    SOURCE_CHOICES = [
+        ('redirect', 'eSewa redirect'),
+        ('verify', 'Frontend verification'),
+    ]
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('rejected', 'Rejected'),
+        ('failed', 'Failed'),
+    ]
+
+    transaction_uuid = models.CharField(max_length=100)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='received')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['transaction_uuid'],
+                name='unique_live_payment_callback',
+                condition=~models.Q(status__in=['rejected', 'failed'])
+            )
+        ]
+        indexes = [
+            # The worker's queue, oldest first
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['transaction_uuid', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f"Callback {self.transaction_uuid} ({self.source}) - {self.status}"
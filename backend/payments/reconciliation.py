@@ -0,0 +1,191 @@
+"""Background reconciliation of pending eSewa payments.
+
+A payment only moves past PENDING when the customer's browser comes back,
+through a callback processed from the inbox (see payments/callbacks.py) or
+through CheckPaymentStatusView. A customer who closes the tab leaves it
+pending for good. The sweep picks up eSewa payments that have been pending
+for a while, oldest first, in batches. It asks eSewa's status API about each
+batch through one keep-alive session and a bounded thread pool, then applies
+the answers:
+
+- COMPLETE payments are handed to ProcessPaymentView, the same path a
+  verified browser return takes. It creates the order from ``order_data``,
+  allocates the money to unpaid orders and marks the payment complete.
+- CANCELED and refunded payments get their final status with one
+  ``bulk_update``. So do NOT_FOUND payments older than
+  ESEWA_PENDING_EXPIRY_MINUTES, which eSewa no longer knows about.
+- Anything else (still PENDING, AMBIGUOUS, errors) is left for the next sweep.
+
+Only the HTTP calls run in the pool; all database work stays on the calling
+thread.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .esewa import EsewaUnavailable, circuit_open, esewa_session, fetch_status
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_BATCH_SIZE = 100
+RECONCILE_WORKERS = 8
+FINAL_STATUSES = {'CANCELED', 'FULL_REFUND', 'PARTIAL_REFUND'}
+
+
+def reconcile_after():
+    """How long a payment stays pending before the sweep looks at it."""
+    return timedelta(minutes=getattr(settings, 'ESEWA_RECONCILE_AFTER_MINUTES', 15))
+
+
+def pending_expiry():
+    """How long eSewa may answer NOT_FOUND before the payment is given up."""
+    return timedelta(minutes=getattr(settings, 'ESEWA_PENDING_EXPIRY_MINUTES', 60))
+
+
+def stale_pending_payments(now=None):
+    """eSewa payments pending for longer than reconcile_after(), oldest first."""
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        payment_type='esewa', status='PENDING', created_at__lt=now - reconcile_after(),
+    ).order_by('created_at', 'id')
+
+
+def _amount_matches(payment, answer):
+    try:
+        return Decimal(str(answer.get('total_amount'))) == payment.total_amount
+    except (InvalidOperation, TypeError):
+        return False
+
+
+def classify(payment, answer, now):
+    """Decide what to do with a payment given eSewa's answer: 'complete', a final status, or None."""
+    if not answer or answer.get('transaction_uuid', payment.transaction_uuid) != payment.transaction_uuid:
+        return None
+    esewa_status = answer.get('status')
+    if esewa_status == 'COMPLETE':
+        if not _amount_matches(payment, answer):
+            logger.error(f"[ESEWA RECONCILE] Amount mismatch for {payment.transaction_uuid}: "
+                         f"ours Rs.{payment.total_amount}, eSewa Rs.{answer.get('total_amount')}")
+            return None
+        return 'complete'
+    if esewa_status in FINAL_STATUSES:
+        return esewa_status
+    if esewa_status == 'NOT_FOUND' and payment.created_at < now - pending_expiry():
+        return 'NOT_FOUND'
+    return None
+
+
+def complete_payment(payment, ref_id):
+    """Record eSewa's reference and process the payment like a verified browser return."""
+    from .views import ProcessPaymentView
+
+    with transaction.atomic():
+        locked = Payment.objects.select_for_update().get(pk=payment.pk)
+        if locked.status == 'COMPLETE':
+            # The browser got there first
+            return False
+        if ref_id:
+            locked.ref_id = ref_id
+            locked.transaction_code = locked.transaction_code or ref_id
+            locked.save(update_fields=['ref_id', 'transaction_code', 'updated_at'])
+    response = ProcessPaymentView().post(None, payment.transaction_uuid)
+    if response.status_code != 200:
+        logger.error(f"[ESEWA RECONCILE] Processing {payment.transaction_uuid} failed: {response.content[:200]}")
+        return False
+    return True
+
+
+def apply_final_statuses(payments):
+    """Give ``payments`` (with ``status`` and ``ref_id`` already set) their final status in one write."""
+    if not payments:
+        return 0
+    now = timezone.now()
+    for payment in payments:
+        payment.updated_at = now
+    with transaction.atomic():
+        # Only rows still pending: a browser may have completed one meanwhile
+        still_pending = set(Payment.objects.select_for_update().filter(
+            pk__in=[payment.pk for payment in payments], status='PENDING'
+        ).values_list('pk', flat=True))
+        payments = [payment for payment in payments if payment.pk in still_pending]
+        Payment.objects.bulk_update(payments, ['status', 'ref_id', 'updated_at'], batch_size=500)
+        # bulk_update() sends no signals; the search documents show the status
+        from orders.search import index_payments
+        index_payments([payment.pk for payment in payments])
+    return len(payments)
+
+
+def _check(session, payment):
+    try:
+        return fetch_status(session, payment.transaction_uuid, payment.total_amount)
+    except EsewaUnavailable:
+        return None
+
+
+def reconcile_batch(payments, session, workers=RECONCILE_WORKERS, dry_run=False):
+    """Check one batch of payments with eSewa and apply the answers. Returns outcome counts."""
+    now = timezone.now()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        answers = list(pool.map(lambda payment: _check(session, payment), payments))
+
+    counts = {'checked': len(payments), 'completed': 0, 'closed': 0, 'unchanged': 0, 'errors': 0}
+    final = []
+    for payment, answer in zip(payments, answers):
+        if answer is None:
+            counts['errors'] += 1
+            continue
+        outcome = classify(payment, answer, now)
+        if outcome is None:
+            counts['unchanged'] += 1
+        elif outcome == 'complete':
+            if dry_run or complete_payment(payment, answer.get('ref_id')):
+                counts['completed'] += 1
+            else:
+                counts['unchanged'] += 1
+        else:
+            payment.status = outcome
+            payment.ref_id = answer.get('ref_id') or payment.ref_id
+            final.append(payment)
+
+    if dry_run:
+        counts['closed'] = len(final)
+    else:
+        counts['closed'] = apply_final_statuses(final)
+        counts['unchanged'] += len(final) - counts['closed']
+    return counts
+
+
+def reconcile_pending_payments(batch_size=RECONCILE_BATCH_SIZE, workers=RECONCILE_WORKERS, limit=None,
+                               dry_run=False, session=None):
+    """Sweep the stale pending eSewa payments once, ``batch_size`` at a time.
+
+    Each payment is checked at most once per sweep. The sweep stops early while
+    eSewa's circuit breaker is open. Returns the summed outcome counts.
+    """
+    session = session or esewa_session(workers)
+    totals = {'checked': 0, 'completed': 0, 'closed': 0, 'unchanged': 0, 'errors': 0}
+    payments = stale_pending_payments()
+    last = None
+    while limit is None or totals['checked'] < limit:
+        if circuit_open():
+            logger.warning(f"[ESEWA RECONCILE] eSewa is failing; stopping after {totals['checked']} checked")
+            break
+        page = payments
+        if last:
+            page = page.filter(models.Q(created_at__gt=last[0]) | models.Q(created_at=last[0], id__gt=last[1]))
+        size = batch_size if limit is None else min(batch_size, limit - totals['checked'])
+        batch = list(page[:size])
+        if not batch:
+            break
+        last = (batch[-1].created_at, batch[-1].id)
+        for outcome, count in reconcile_batch(batch, session, workers, dry_run=dry_run).items():
+            totals[outcome] += count
+        logger.info(f"[ESEWA RECONCILE] {totals['checked']} checked so far: {totals['completed']} completed, "
+                    f"{totals['closed']} closed")
+    return totals
@@ -0,0 +1,209 @@
+"""Reconciliation of pending payments against settlement files.
+
+Staff used to verify bank transfers one at a time through verify_bank_payment.
+``import_settlement`` instead reads a whole bank statement or eSewa
+settlement CSV and completes every PENDING payment it can match.
+
+The file is read as a stream, CHUNK_SIZE rows at a time, so memory stays
+flat however long it is. For each chunk:
+
+- eSewa rows that carry a signature are verified together with one keyed
+  HMAC (EsewaPaymentUtils.verify_signatures).
+- The payments the rows refer to are fetched with one query on the unique
+  ``transaction_uuid`` index. Status and amount are compared in memory.
+- The matched payments get the statement's reference with one
+  ``bulk_update``. Each is then handed to ProcessPaymentView, which creates
+  its order, allocates it to unpaid orders and marks it complete.
+
+A row's reference is the payment's transaction_uuid: either the whole
+reference column or a transaction UUID found inside it, as in bank remarks
+like "Laundry 251017-104512-ab12cd34". Every row that does not complete a
+payment is written to the exceptions report with the reason.
+"""
+import csv
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Payment
+from .utils import EsewaPaymentUtils
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+FORMATS = ('bank', 'esewa')
+EXCEPTION_FIELDS = ['line', 'reference', 'amount', 'reason', 'detail']
+# Header names accepted for each column, compared case-insensitively with spaces as underscores
+COLUMNS = {
+    'bank': {
+        'reference': ('reference', 'remarks', 'narration', 'description', 'transaction_uuid'),
+        'amount': ('amount', 'credit', 'deposit', 'total_amount'),
+        'bank_reference': ('bank_reference', 'transaction_code', 'cheque_no', 'ref_id'),
+    },
+    'esewa': {
+        'reference': ('transaction_uuid', 'product_id', 'reference'),
+        'amount': ('total_amount', 'amount'),
+        'bank_reference': ('ref_id', 'transaction_code', 'reference_code'),
+        'status': ('status',),
+    },
+}
+TRANSACTION_UUID = re.compile(r'\b\d{6}-\d{6}-[0-9a-f]{8}\b')
+
+
+class SettlementFileError(Exception):
+    """The file cannot be read as a settlement file of the given format."""
+
+
+def _column_map(fieldnames, file_format):
+    lowered = {re.sub(r'[\s-]+', '_', name.strip().lower()): name for name in fieldnames or ()}
+    columns = {}
+    for column, aliases in COLUMNS[file_format].items():
+        columns[column] = next((lowered[alias] for alias in aliases if alias in lowered), None)
+    missing = [column for column in ('reference', 'amount') if columns[column] is None]
+    if missing:
+        raise SettlementFileError(f"No {' or '.join(missing)} column in the {file_format} file header")
+    return columns
+
+
+def _reference(text):
+    text = (text or '').strip()
+    found = TRANSACTION_UUID.search(text)
+    return found.group(0) if found else text
+
+
+def _amount(text):
+    try:
+        return Decimal((text or '').replace(',', '').strip())
+    except InvalidOperation:
+        return None
+
+
+class SettlementImport:
+    """One pass over a settlement file. Counts outcomes and writes the exceptions report."""
+
+    def __init__(self, file_format, exceptions=None, dry_run=False):
+        if file_format not in FORMATS:
+            raise SettlementFileError(f'Unknown settlement format: {file_format}')
+        self.file_format = file_format
+        self.dry_run = dry_run
+        self.exceptions = csv.writer(exceptions) if exceptions is not None else None
+        if self.exceptions:
+            self.exceptions.writerow(EXCEPTION_FIELDS)
+        self.columns = {}
+        self.counts = {'rows': 0, 'matched': 0, 'completed': 0, 'exceptions': 0}
+
+    def _exception(self, line, reference, amount, reason, detail=''):
+        self.counts['exceptions'] += 1
+        if self.exceptions:
+            self.exceptions.writerow([line, reference, '' if amount is None else amount, reason, detail])
+
+    def _rows(self, reader):
+        """Yield ``(line, row, reference, amount)`` for each data row."""
+        for row in reader:
+            yield (reader.line_num, row, _reference(row.get(self.columns['reference'])),
+                   _amount(row.get(self.columns['amount'])))
+
+    def _value(self, row, column):
+        name = self.columns.get(column)
+        return (row.get(name) or '').strip() if name else ''
+
+    def run(self, stream, chunk_size=CHUNK_SIZE):
+        reader = csv.DictReader(stream)
+        self.columns = _column_map(reader.fieldnames, self.file_format)
+        rows = self._rows(reader)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            self.counts['rows'] += len(chunk)
+            self._import_chunk(chunk)
+            logger.info(f"[SETTLEMENT] {self.counts['rows']} rows read: {self.counts['completed']} completed, "
+                        f"{self.counts['exceptions']} exceptions")
+        return self.counts
+
+    def _valid_rows(self, chunk):
+        """Drop rows that cannot be used on their own, verifying eSewa signatures in one batch."""
+        rows = []
+        for line, row, reference, amount in chunk:
+            if not reference or amount is None:
+                self._exception(line, reference, amount, 'unparseable', 'Missing reference or amount')
+                continue
+            status = self._value(row, 'status').upper()
+            if status and status not in ('COMPLETE', 'SUCCESS'):
+                self._exception(line, reference, amount, 'not_complete', f'Settlement status {status}')
+                continue
+            rows.append((line, row, reference, amount))
+
+        signed = [(index, row) for index, (_, row, *_) in enumerate(rows) if row.get('signature')]
+        if self.file_format == 'esewa' and signed:
+            verified = EsewaPaymentUtils.verify_signatures([(row, row['signature']) for _, row in signed])
+            forged = {index for (index, _), ok in zip(signed, verified) if not ok}
+            for index in sorted(forged):
+                line, _, reference, amount = rows[index]
+                self._exception(line, reference, amount, 'bad_signature', 'Signature does not verify')
+            rows = [row for index, row in enumerate(rows) if index not in forged]
+        return rows
+
+    def _import_chunk(self, chunk):
+        rows = self._valid_rows(chunk)
+        payments = Payment.objects.filter(transaction_uuid__in={reference for _, _, reference, _ in rows}).only(
+            'id', 'transaction_uuid', 'total_amount', 'status', 'payment_type', 'transaction_code', 'ref_id'
+        )
+        by_reference = {payment.transaction_uuid: payment for payment in payments}
+
+        matched, taken = [], set()
+        for line, row, reference, amount in rows:
+            payment = by_reference.get(reference)
+            if payment is None:
+                self._exception(line, reference, amount, 'not_found', 'No payment with this reference')
+            elif payment.payment_type != self.file_format:
+                self._exception(line, reference, amount, 'wrong_type', f'{payment.payment_type} payment')
+            elif payment.status != 'PENDING':
+                self._exception(line, reference, amount, 'not_pending', f'Payment is {payment.status}')
+            elif amount != payment.total_amount:
+                self._exception(line, reference, amount, 'amount_mismatch', f'Expected Rs.{payment.total_amount}')
+            elif payment.pk in taken:
+                self._exception(line, reference, amount, 'duplicate', 'Payment already matched by an earlier row')
+            else:
+                bank_reference = self._value(row, 'bank_reference')
+                if bank_reference:
+                    payment.transaction_code = payment.ref_id = bank_reference[:50]
+                taken.add(payment.pk)
+                matched.append((line, reference, amount, payment))
+        self.counts['matched'] += len(matched)
+        if self.dry_run or not matched:
+            return
+        self._complete(matched)
+
+    def _complete(self, matched):
+        from .views import ProcessPaymentView
+
+        with transaction.atomic():
+            still_pending = set(Payment.objects.select_for_update().filter(
+                pk__in=[payment.pk for *_, payment in matched], status='PENDING'
+            ).values_list('pk', flat=True))
+            for line, reference, amount, payment in matched:
+                if payment.pk not in still_pending:
+                    self._exception(line, reference, amount, 'not_pending', 'Completed while the file was imported')
+            matched = [match for match in matched if match[3].pk in still_pending]
+            Payment.objects.bulk_update([payment for *_, payment in matched], ['transaction_code', 'ref_id'],
+                                        batch_size=500)
+
+        for line, reference, amount, payment in matched:
+            response = ProcessPaymentView().post(None, payment.transaction_uuid)
+            if response.status_code == 200:
+                self.counts['completed'] += 1
+            else:
+                logger.error(f"[SETTLEMENT] Processing {reference} failed: {response.content[:200]}")
+                self._exception(line, reference, amount, 'processing_failed', f'HTTP {response.status_code}')
+
+
+def import_settlement(stream, file_format, exceptions=None, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Complete the PENDING payments a settlement CSV confirms. Returns outcome counts.
+
+    ``exceptions`` is a text stream the exceptions report is written to as CSV.
+    """
+    return SettlementImport(file_format, exceptions, dry_run).run(stream, chunk_size)
@@ -1,3 +1,447 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from branches.models import Branch
+from orders.allocation import apply_advance_payments, wallet_balances
+from orders.models import CustomerWallet, Order, OrderPayment
+from .esewa import BREAKER_THRESHOLD
+from .models import Payment, PaymentCallback, Subscription
+from .views import ProcessPaymentView
+
+User = get_user_model()
+
+
+def _sign(data, secret_key=None):
+    message = ','.join(f'{field}={data[field]}' for field in data['signed_field_names'].split(','))
+    digest = hmac.new((secret_key or settings.ESEWA_SECRET_KEY).encode(), message.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+class PaymentListingQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='payer@example.com', password='testpassword',
+                                             first_name='Pay', last_name='Er', phone='9841000001')
+        self.admin = User.objects.create_user(email='staff@example.com', password='testpassword',
+                                              first_name='Staff', last_name='User', phone='9841000002', role='admin')
+        self.branch = Branch.objects.create(name='Test Branch', branch_id='TEST001', city='Kathmandu',
+                                            address='Test Address', phone='012345678', opening_date='2023-01-01')
+
+    def _create_payments(self, count):
+        for _ in range(count):
+            payment = Payment.objects.create(user=self.user, branch=self.branch, total_amount=300, amount=300,
+                                             payment_type='bank', status='PENDING')
+            order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=100)
+            OrderPayment.objects.create(order=order, payment=payment, amount_applied=100)
+
+    def _count_queries(self, url, user, params=None):
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_payment_history_query_count_does_not_grow_with_rows(self):
+        url = reverse('payment_history')
+        self._create_payments(1)
+        single_row_queries, _ = self._count_queries(url, self.user)
+        self._create_payments(6)
+        many_rows_queries, response = self._count_queries(url, self.user)
+        page_queries, _ = self._count_queries(url, self.user, {'page': 1})
+
+        self.assertEqual(single_row_queries, many_rows_queries)
+        self.assertLessEqual(page_queries, many_rows_queries + 1)
+        first = response.data['payments'][0]
+        self.assertEqual((first['orders_count'], first['amount_applied'], first['excess_amount']), (1, 100.0, 200.0))
+        self.assertEqual(first['branch_name'], 'Test Branch')
+
+    def test_pending_bank_payments_query_count_does_not_grow_with_rows(self):
+        url = reverse('pending_bank_payments')
+        self._create_payments(1)
+        single_row_queries, _ = self._count_queries(url, self.admin)
+        self._create_payments(6)
+        many_rows_queries, response = self._count_queries(url, self.admin)
+
+        self.assertEqual(single_row_queries, many_rows_queries)
+        self.assertEqual(len(response.data['pending_payments']), 7)
+        self.assertEqual(response.data['pending_payments'][0]['user_email'], 'payer@example.com')
+
+
+class EsewaStatusStub(BaseHTTPRequestHandler):
+    """Local stand-in for eSewa's transaction status endpoint."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    answers = {}
+    requests = []
+    failing = False
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        type(self).requests.append((self.client_address, params['transaction_uuid']))
+        if self.failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        answer = self.answers.get(params['transaction_uuid'], {'status': 'NOT_FOUND'})
+        body = json.dumps({'product_code': params['product_code'], 'transaction_uuid': params['transaction_uuid'],
+                           'total_amount': float(params['total_amount']), 'ref_id': None, **answer}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EsewaReconciliationTest(TestCase):
+    def setUp(self):
+        PaymentListingQueryCountTest.setUp(self)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), EsewaStatusStub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        EsewaStatusStub.requests = []
+        EsewaStatusStub.failing = False
+        # Cached answers and breaker state outlive each test's database
+        self.addCleanup(cache.clear)
+        status_url = override_settings(ESEWA_STATUS_CHECK_URL=f'http://127.0.0.1:{server.server_port}/status/')
+        status_url.enable()
+        self.addCleanup(status_url.disable)
+
+    def _pending(self, uuid, minutes_old, amount=300, **answer):
+        payment = Payment.objects.create(user=self.user, branch=self.branch, total_amount=amount, amount=amount,
+                                         payment_type='esewa', transaction_uuid=uuid)
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_old))
+        EsewaStatusStub.answers[uuid] = answer
+        return payment
+
+    def test_sweep_completes_closes_and_leaves_payments(self):
+        order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        paid = self._pending('esewa-paid', 30, status='COMPLETE', ref_id='REF1')
+        cancelled = self._pending('esewa-cancelled', 30, status='CANCELED')
+        expired = self._pending('esewa-expired', 120, status='NOT_FOUND')
+        waiting = self._pending('esewa-waiting', 30, status='NOT_FOUND')
+        mismatch = self._pending('esewa-mismatch', 30, status='COMPLETE', total_amount=1.0)
+        fresh = self._pending('esewa-fresh', 1, status='COMPLETE')
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_esewa_payments', '--batch-size', '2', '--workers', '2', stdout=out)
+
+        statuses = dict(Payment.objects.values_list('transaction_uuid', 'status'))
+        self.assertEqual(statuses, {
+            paid.transaction_uuid: 'COMPLETE', cancelled.transaction_uuid: 'CANCELED',
+            expired.transaction_uuid: 'NOT_FOUND', waiting.transaction_uuid: 'PENDING',
+            mismatch.transaction_uuid: 'PENDING', fresh.transaction_uuid: 'PENDING',
+        })
+        paid.refresh_from_db()
+        self.assertEqual(paid.ref_id, 'REF1')
+        self.assertIsNotNone(paid.processed_at)
+        order.refresh_from_db()
+        self.assertEqual((order.amount_paid, order.payment_status), (300, 'paid'))
+
+        # Each stale payment was checked once, over at most one connection per worker
+        checked = [uuid for _, uuid in EsewaStatusStub.requests]
+        self.assertEqual(sorted(checked), sorted(['esewa-paid', 'esewa-cancelled', 'esewa-expired',
+                                                  'esewa-waiting', 'esewa-mismatch']))
+        self.assertLessEqual(len({address for address, _ in EsewaStatusStub.requests}), 2)
+        self.assertIn('Completed: 1', out.getvalue())
+        self.assertIn('Closed: 2', out.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        self._pending('esewa-paid', 30, status='COMPLETE')
+        self._pending('esewa-cancelled', 30, status='CANCELED')
+
+        out = StringIO()
+        call_command('reconcile_esewa_payments', '--dry-run', stdout=out)
+
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {'PENDING'})
+        self.assertIn('Would complete: 1', out.getvalue())
+        self.assertIn('Would close: 1', out.getvalue())
+
+
+class CheckPaymentStatusTest(TestCase):
+    def setUp(self):
+        EsewaReconciliationTest.setUp(self)
+
+    def _check(self, uuid):
+        return self.client.get(reverse('check_payment_status', args=[uuid]))
+
+    def test_completes_payment_and_reuses_recent_answers(self):
+        payment = EsewaReconciliationTest._pending(self, 'esewa-check', 0, status='PENDING')
+        self.assertEqual(self._check('esewa-check').json()['status'], 'PENDING')
+        self.assertEqual(self._check('esewa-check').json()['status'], 'PENDING')
+        self.assertEqual(len(EsewaStatusStub.requests), 1)
+
+        # A remote COMPLETE goes through the same processing as a verified browser return
+        order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=200)
+        cache.clear()
+        EsewaStatusStub.answers['esewa-check'] = {'status': 'COMPLETE', 'ref_id': 'REF9'}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._check('esewa-check')
+        self.assertEqual(response.json(), {'success': True, 'status': 'COMPLETE', 'ref_id': 'REF9'})
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.assertIsNotNone(payment.processed_at)
+        self.assertEqual(order.payment_status, 'paid')
+        self.assertEqual(CustomerWallet.objects.get(user=self.user, branch=self.branch).balance, 100)
+        self.assertTrue(Subscription.objects.filter(user=self.user, payment=payment).exists())
+
+        # Complete payments are answered from the database
+        self._check('esewa-check')
+        self.assertEqual(len(EsewaStatusStub.requests), 2)
+
+    def test_fails_fast_while_esewa_is_down(self):
+        for number in range(BREAKER_THRESHOLD + 2):
+            EsewaReconciliationTest._pending(self, f'esewa-down-{number}', 0, status='PENDING')
+        EsewaStatusStub.failing = True
+
+        for number in range(BREAKER_THRESHOLD):
+            self.assertEqual(self._check(f'esewa-down-{number}').json()['success'], False)
+        response = self._check(f'esewa-down-{BREAKER_THRESHOLD}')
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.json()['retry_suggested'])
+        self.assertEqual(len(EsewaStatusStub.requests), BREAKER_THRESHOLD)
+
+        # Once the cooldown is over one trial call closes the circuit again
+        cache.delete('esewa-breaker:open')
+        EsewaStatusStub.failing = False
+        self.assertEqual(self._check(f'esewa-down-{BREAKER_THRESHOLD + 1}').json()['status'], 'PENDING')
+        self.assertEqual(self._check(f'esewa-down-{BREAKER_THRESHOLD}').json()['status'], 'PENDING')
+
+
+class PaymentCallbackInboxTest(TestCase):
+    def setUp(self):
+        PaymentListingQueryCountTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        self.payment = Payment.objects.create(user=self.user, branch=self.branch, total_amount=300, amount=300,
+                                              payment_type='esewa', transaction_uuid='esewa-callback')
+
+    def _redirect_data(self, total_amount='300.0', secret_key=None):
+        data = {'transaction_code': 'TC1', 'status': 'COMPLETE', 'total_amount': total_amount,
+                'transaction_uuid': 'esewa-callback', 'product_code': 'EPAYTEST',
+                'signed_field_names': 'transaction_code,status,total_amount,transaction_uuid,product_code,'
+                                      'signed_field_names'}
+        data['signature'] = _sign(data, secret_key)
+        return base64.b64encode(json.dumps(data).encode()).decode()
+
+    def _progress(self):
+        return self.client.get(reverse('payment_progress', args=['esewa-callback'])).json()
+
+    def test_duplicate_redirects_are_recorded_once_and_processed_by_the_worker(self):
+        for _ in range(3):
+            response = self.client.get(reverse('payment_success'), {'data': self._redirect_data()})
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('transaction_uuid=esewa-callback', response['Location'])
+
+        self.assertEqual(PaymentCallback.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'PENDING')
+        self.assertEqual(self._progress()['callback_status'], 'received')
+
+        # While a worker holds the callback the frontend's confirmation does not wait for it
+        PaymentCallback.objects.update(status='processing')
+        response = self.client.post(reverse('verify_esewa_payment'), {'transaction_uuid': 'esewa-callback',
+                                                                      'amount': '300'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['progress_url'], reverse('payment_progress', args=['esewa-callback']))
+        PaymentCallback.objects.update(status='received')
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_payment_callbacks', stdout=out)
+        self.assertIn('Processed: 1', out.getvalue())
+
+        progress = self._progress()
+        self.assertEqual((progress['status'], progress['processed'], progress['callback_status']),
+                         ('COMPLETE', True, 'processed'))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.amount_paid, self.order.payment_status), (300, 'paid'))
+        self.assertTrue(Subscription.objects.filter(user=self.user, payment=self.payment).exists())
+
+        # Late duplicates neither queue new work nor reprocess the payment
+        self.client.get(reverse('payment_success'), {'data': self._redirect_data()})
+        self.assertEqual(PaymentCallback.objects.count(), 1)
+        self.assertEqual(OrderPayment.objects.filter(payment=self.payment).count(), 1)
+
+    def test_forged_redirects_are_refused_and_confirmations_answer_synchronously(self):
+        response = self.client.get(reverse('payment_success'), {'data': self._redirect_data(secret_key='forged')})
+        self.assertEqual(response.json(), {'success': False, 'error': 'Invalid signature'})
+        self.assertFalse(PaymentCallback.objects.exists())
+
+        url = reverse('verify_esewa_payment')
+        response = self.client.post(url, {'transaction_uuid': 'esewa-callback', 'amount': '250',
+                                          'transaction_code': 'REF2'}, format='json')
+        self.assertEqual(response.json(), {'success': False, 'error': 'Payment amount mismatch: Rs.250'})
+
+        # The rejected callback does not block a genuine one, which is processed inline
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'transaction_uuid': 'esewa-callback', 'amount': '300',
+                                              'transaction_code': 'REF2'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['payment']['status'], 'COMPLETE')
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.ref_id), ('COMPLETE', 'REF2'))
+        self.assertEqual(self.order.payment_status, 'paid')
+        self.assertEqual(list(PaymentCallback.objects.order_by('id').values_list('status', flat=True)),
+                         ['rejected', 'processed'])
+
+        # Once complete the confirmation answers with the receipt straight away
+        response = self.client.post(url, {'transaction_uuid': 'esewa-callback', 'amount': '300'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentCallback.objects.count(), 2)
+
+
+class SettlementImportTest(TestCase):
+    def setUp(self):
+        PaymentListingQueryCountTest.setUp(self)
+        self.order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+
+    def _payment(self, payment_type='bank', amount=300):
+        return Payment.objects.create(user=self.user, branch=self.branch, total_amount=amount, amount=amount,
+                                      payment_type=payment_type)
+
+    def _import(self, content, *args):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path, report = f'{directory.name}/statement.csv', f'{directory.name}/exceptions.csv'
+        with open(path, 'w', encoding='utf-8') as statement:
+            statement.write(content)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_settlement_file', path, '--exceptions', report, *args, stdout=out)
+        with open(report, encoding='utf-8') as exceptions:
+            return out.getvalue(), {row[0]: row[3] for row in list(csv.reader(exceptions))[1:]}
+
+    def test_bank_statement_completes_matches_and_reports_the_rest(self):
+        paid, short, esewa = self._payment(), self._payment(amount=500), self._payment('esewa')
+        out, exceptions = self._import(
+            'Date,Remarks,Credit,Bank Reference\n'
+            f'2026-10-01,Laundry {paid.transaction_uuid},"300.00",BNK1\n'
+            f'2026-10-01,{paid.transaction_uuid},300,BNK1\n'
+            f'2026-10-01,{short.transaction_uuid},450,BNK2\n'
+            '2026-10-01,Rent for October,300,BNK3\n'
+            f'2026-10-01,{esewa.transaction_uuid},300,BNK4\n'
+            f'2026-10-02,{paid.transaction_uuid},n/a,BNK5\n',
+            '--chunk-size', '2',
+        )
+
+        paid.refresh_from_db()
+        self.assertEqual((paid.status, paid.transaction_code), ('COMPLETE', 'BNK1'))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+        self.assertEqual(set(Payment.objects.exclude(pk=paid.pk).values_list('status', flat=True)), {'PENDING'})
+        self.assertEqual(exceptions, {'3': 'duplicate', '4': 'amount_mismatch', '5': 'not_found',
+                                      '6': 'wrong_type', '7': 'unparseable'})
+        self.assertIn('Completed: 1', out)
+        self.assertIn('Exceptions: 5', out)
+
+    def test_esewa_settlement_verifies_signatures_and_dry_run_writes_nothing(self):
+        genuine, forged, cancelled = self._payment('esewa'), self._payment('esewa'), self._payment('esewa')
+        fields = 'transaction_uuid,total_amount,status,signed_field_names'
+        lines = ['transaction_uuid,total_amount,status,ref_id,signed_field_names,signature']
+        for payment, status_text, key in ((genuine, 'COMPLETE', None), (forged, 'COMPLETE', 'forged'),
+                                          (cancelled, 'CANCELED', None)):
+            data = {'transaction_uuid': payment.transaction_uuid, 'total_amount': '300.0', 'status': status_text,
+                    'signed_field_names': fields}
+            lines.append(f"{payment.transaction_uuid},300.0,{status_text},REF-{payment.pk},\"{fields}\","
+                         f"{_sign(data, key)}")
+        content = '\n'.join(lines) + '\n'
+
+        out, exceptions = self._import(content, '--format', 'esewa', '--dry-run')
+        self.assertIn('Would complete: 1', out)
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {'PENDING'})
+
+        out, exceptions = self._import(content, '--format', 'esewa')
+        self.assertEqual(exceptions, {'3': 'bad_signature', '4': 'not_complete'})
+        genuine.refresh_from_db()
+        self.assertEqual((genuine.status, genuine.ref_id), ('COMPLETE', f'REF-{genuine.pk}'))
+
+
+class CustomerWalletTest(TestCase):
+    def setUp(self):
+        PaymentListingQueryCountTest.setUp(self)
+
+    def _balance(self):
+        return CustomerWallet.objects.filter(user=self.user, branch=self.branch).values_list(
+            'balance', flat=True
+        ).first()
+
+    def test_wallet_follows_completion_allocation_and_deletion(self):
+        Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=300)
+        payment = Payment.objects.create(user=self.user, branch=self.branch, total_amount=500, amount=500,
+                                         payment_type='bank')
+        self.assertIsNone(self._balance())
+        with self.captureOnCommitCallbacks(execute=True):
+            ProcessPaymentView().post(None, payment.transaction_uuid)
+        self.assertEqual(self._balance(), 200)
+
+        order = Order.objects.create(customer_name=self.user, branch=self.branch, total_amount=150)
+        apply_advance_payments([order], self.user)
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, self._balance()), ('paid', 50))
+
+        order.delete()
+        self.assertEqual(self._balance(), 200)
+        self.assertEqual(wallet_balances(), {(self.user.id, self.branch.id): 200})
+
+        payment.delete()
+        self.assertEqual(self._balance(), 0)
+
+    def test_balance_endpoint_and_rebuild(self):
+        Payment.objects.create(user=self.user, branch=self.branch, total_amount=400, amount=400,
+                               payment_type='bank', status='COMPLETE')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('wallet_balance'))
+        self.assertEqual(response.data['balance'], '400.00')
+        self.assertEqual(response.data['wallets'][0]['branch_name'], 'Test Branch')
+        self.assertEqual(self.client.get(reverse('payment_history')).data['credit_balance'], 400.0)
+        self.assertEqual(self.client.get(reverse('wallet_balance'), {'user': self.admin.id}).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(reverse('wallet_balance'), {'branch': 'main'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        CustomerWallet.objects.update(balance=999)
+        out = StringIO()
+        call_command('rebuild_wallet_balances', '--dry-run', stdout=out)
+        self.assertIn('Would rebuild: 1 wallets', out.getvalue())
+        self.assertEqual(self._balance(), 999)
+        call_command('rebuild_wallet_balances', stdout=StringIO())
+        self.assertEqual(self._balance(), 400)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('wallet_balance'), {'user': self.user.id, 'branch': self.branch.id})
+        self.assertEqual(response.data['balance'], '400.00')
+        self.assertEqual(self.client.get(reverse('wallet_balance'), {'user': 'me'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        # Money is summed exactly, not as floats (0.1 + 0.2)
+        CustomerWallet.objects.update(balance='0.20')
+        CustomerWallet.objects.create(user=self.user, branch=None, balance='0.10')
+        response = self.client.get(reverse('wallet_balance'), {'user': self.user.id})
+        self.assertEqual((response.data['balance'], sorted(w['balance'] for w in response.data['wallets'])),
+                         ('0.30', ['0.10', '0.20']))
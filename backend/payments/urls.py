@@ -5,9 +5,11 @@ from .views import (
     PaymentSuccessView,
     PaymentFailureView,
     CheckPaymentStatusView,
+    PaymentProgressView,
     VerifyEsewaPaymentView,
     user_subscription_status,
     payment_history,
+    wallet_balance,
     verify_bank_payment,
     pending_bank_payments
 )
@@ -21,6 +23,8 @@ urlpatterns = [
     path('verify-bank/<str:transaction_uuid>/', verify_bank_payment, name='verify_bank_payment'),
     path('pending-bank/', pending_bank_payments, name='pending_bank_payments'),
     path('status/<str:transaction_uuid>/', CheckPaymentStatusView.as_view(), name='check_payment_status'),
+    path('progress/<str:transaction_uuid>/', PaymentProgressView.as_view(), name='payment_progress'),
     path('subscription/status/', user_subscription_status, name='subscription_status'),
     path('history/', payment_history, name='payment_history'),
+    path('wallet/', wallet_balance, name='wallet_balance'),
 ]
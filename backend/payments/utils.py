@@ -2,6 +2,7 @@
 import hmac
 import hashlib
 import base64
+from functools import lru_cache
 from django.conf import settings
 
 class EsewaPaymentUtils:
@@ -28,31 +29,38 @@ class EsewaPaymentUtils:
         # Convert to base64
         return base64.b64encode(signature).decode('utf-8')
     
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _keyed_hmac(secret_key):
+        """HMAC SHA256 state with the key already absorbed; copy() it for each message"""
+        return hmac.new(secret_key.encode('utf-8'), digestmod=hashlib.sha256)
+
+    @staticmethod
+    def signed_message(data):
+        """The message eSewa signs: the signed fields as name=value, in order"""
+        signed_fields = data.get('signed_field_names', '').split(',')
+        return ','.join(f"{field}={data[field]}" for field in signed_fields if field in data)
+
     @staticmethod
     def verify_signature(data, signature, secret_key=None):
         """
         Verify the signature received from eSewa
         """
+        return EsewaPaymentUtils.verify_signatures([(data, signature)], secret_key)[0]
+
+    @staticmethod
+    def verify_signatures(items, secret_key=None):
+        """
+        Verify many (data, signature) pairs with one keyed HMAC, returning a bool per pair
+        """
         if secret_key is None:
             secret_key = settings.ESEWA_SECRET_KEY
-        
-        # Extract signed field names and create message
-        signed_fields = data.get('signed_field_names', '').split(',')
-        message_parts = []
-        
-        for field in signed_fields:
-            if field in data:
-                message_parts.append(f"{field}={data[field]}")
-        
-        message = ','.join(message_parts)
-        
-        # Generate expected signature
-        expected_signature = hmac.new(
-            secret_key.encode('utf-8'),
-            message.encode('utf-8'),
-            hashlib.sha256
-        ).digest()
-        
-        expected_signature_b64 = base64.b64encode(expected_signature).decode('utf-8')
-        
-        return signature == expected_signature_b64
\ No newline at end of file
+        keyed = EsewaPaymentUtils._keyed_hmac(secret_key)
+
+        results = []
+        for data, signature in items:
+            mac = keyed.copy()
+            mac.update(EsewaPaymentUtils.signed_message(data).encode('utf-8'))
+            expected_signature_b64 = base64.b64encode(mac.digest()).decode('utf-8')
+            results.append(isinstance(signature, str) and hmac.compare_digest(signature, expected_signature_b64))
+        return results
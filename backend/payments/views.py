@@ -4,7 +4,7 @@ import json
 import base64
 import logging
 from datetime import datetime, timedelta
-import requests
+from decimal import Decimal
 from django.db import DatabaseError, transaction, IntegrityError, models
 from django.http import JsonResponse, HttpResponseRedirect
 from django.views.decorators.csrf import csrf_exempt
@@ -12,10 +12,12 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.urls import reverse
 from django.core.exceptions import ValidationError 
 from django.db.models import Q
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -266,103 +268,27 @@ class ProcessPaymentView(View):
                     if created_order:
                         logger.info(f"[PAYMENT_PROCESS] Order created successfully: {created_order.order_id}")
                 
-                # Get user's unpaid orders (pending AND partially paid) for the payment's branch
-                from orders.models import Order, OrderPayment
-                
-                # Get orders that are not fully paid (pending OR partially_paid)
-                unpaid_orders = Order.objects.select_for_update().filter(
-                    customer_name=payment.user,
-                    payment_status__in=['pending', 'partially_paid']
-                )
-                
-                # Filter by branch if specified
-                if payment.branch:
-                    unpaid_orders = unpaid_orders.filter(branch=payment.branch)
-                    logger.info(f"[PAYMENT_PROCESS] Filtering orders for branch: {payment.branch.name}")
-                
-                # Order by date (oldest first)
-                unpaid_orders = unpaid_orders.order_by('order_date')
-                
-                logger.info(f"[PAYMENT_PROCESS] Found {unpaid_orders.count()} unpaid orders for processing")
-                
-                # Check if there are no unpaid orders for this branch
-                if unpaid_orders.count() == 0 and payment.branch:
-                    logger.info(f"[PAYMENT_PROCESS] No unpaid orders found for branch {payment.branch.name}. This will be recorded as an advance payment.")
-                
-                # Distribute payment across orders
-                remaining_amount = payment.total_amount
-                orders_paid = []
-                
-                # If this is a payment specifically for an order (via order_data), prioritize that order
-                target_order = None
+                # Spread the payment over the user's unpaid orders at its branch, oldest first.
+                # A payment placed with an order (via order_data) pays only that order.
+                from orders.allocation import allocate_payment
+
+                order_ids = None
                 if payment.payment_source == 'order' and created_order:
-                    target_order = created_order
-                    logger.info(f"[PAYMENT_PROCESS] Prioritizing newly created order {target_order.order_id}")
-                
-                for order in unpaid_orders:
-                    if remaining_amount <= 0:
-                        logger.info(f"[PAYMENT_PROCESS] Payment amount fully distributed, stopping")
-                        break                    
-                    # Skip orders that are not the target order (if we have a target)
-                    if target_order and order.order_id != target_order.order_id:
-                        logger.debug(f"[PAYMENT_PROCESS] Skipping order {order.order_id} as it's not the target order")
-                        continue
-                    
-                    order_pending = order.total_amount
-                    
-                    # Check if order already has partial payments
-                    existing_payments = OrderPayment.objects.filter(order=order).aggregate(
-                        total_paid=models.Sum('amount_applied')
-                    )
-                    already_paid = existing_payments['total_paid'] or 0
-                    order_pending -= already_paid
-                    
-                    if order_pending <= 0:
-                        logger.debug(f"[PAYMENT_PROCESS] Order {order.order_id} already fully paid, skipping")
-                        continue
-                    
-                    # Apply payment to this order
-                    amount_to_apply = min(remaining_amount, order_pending)
-                    
-                    logger.info(f"[PAYMENT_PROCESS] Applying Rs.{amount_to_apply} to order {order.order_id} (Total: Rs.{order.total_amount}, Already Paid: Rs.{already_paid})")
-                    
-                    # Create OrderPayment record
-                    OrderPayment.objects.create(
-                        order=order,
-                        payment=payment,
-                        amount_applied=amount_to_apply
-                    )
-                    
-                    remaining_amount -= amount_to_apply
-                    
-                    # Update order payment status
-                    total_paid_for_order = already_paid + amount_to_apply
-                    old_status = order.payment_status
-                    
-                    if total_paid_for_order >= order.total_amount:
-                        order.payment_status = 'paid'
-                    elif total_paid_for_order > 0:
-                        order.payment_status = 'partially_paid'
-                    else:
-                        order.payment_status = 'pending'
-                    
-                    # If this payment is via eSewa and order was originally COD, update payment method
-                    if payment.payment_type == 'esewa' and order.payment_method == 'cash':
-                        old_payment_method = order.payment_method
-                        order.payment_method = 'esewa'
-                        logger.info(f"[PAYMENT_PROCESS] Updated order {order.order_id} payment method from {old_payment_method} to {order.payment_method}")
-                    
-                    order.save()
-                    
-                    logger.info(f"[PAYMENT_PROCESS] Order {order.order_id} status updated: {old_status} -> {order.payment_status}")
-                    
-                    orders_paid.append({
-                        'order_id': str(order.order_id),
-                        'amount_applied': float(amount_to_apply),
-                        'order_total': float(order.total_amount),
-                        'status': order.payment_status
-                    })
-                
+                    order_ids = [created_order.order_id]
+                    logger.info(f"[PAYMENT_PROCESS] Prioritizing newly created order {created_order.order_id}")
+
+                allocations = allocate_payment(payment, order_ids=order_ids)
+                if not allocations and payment.branch:
+                    logger.info(f"[PAYMENT_PROCESS] No unpaid orders found for branch {payment.branch.name}. This will be recorded as an advance payment.")
+
+                orders_paid = [{
+                    'order_id': str(order.order_id),
+                    'amount_applied': float(amount),
+                    'order_total': float(order.total_amount),
+                    'status': order.payment_status
+                } for _, order, amount in allocations]
+                remaining_amount = payment.total_amount - sum((amount for _, _, amount in allocations), 0)
+
                 # Mark payment as complete
                 if payment.status != 'COMPLETE':
                     old_status = payment.status
@@ -370,6 +296,9 @@ class ProcessPaymentView(View):
                     payment.processed_at = timezone.now()
                     payment.save()
                     logger.info(f"[PAYMENT_PROCESS] Payment status updated: {old_status} -> COMPLETE at {payment.processed_at}")
+                    # Orders paid above were pushed by the allocation; push the payment too
+                    from orders.realtime import publish_payment
+                    publish_payment(payment)
                 
                 logger.info(f"[PAYMENT_PROCESS] Payment processing completed successfully - {len(orders_paid)} orders updated, Remaining amount: Rs.{remaining_amount}")
                 
@@ -415,12 +344,13 @@ class ProcessPaymentView(View):
         # If orders_paid not provided, fetch from database
         if orders_paid is None:
             order_payments = OrderPayment.objects.filter(payment=payment).select_related('order')
+            archived_payments = payment.archived_order_payments.select_related('order')
             orders_paid = [{
                 'order_id': str(op.order.order_id),
                 'amount_applied': float(op.amount_applied),
                 'order_total': float(op.order.total_amount),
                 'status': op.order.payment_status
-            } for op in order_payments]
+            } for op in [*order_payments, *archived_payments]]
         
         return JsonResponse({
             'success': True,
@@ -514,7 +444,9 @@ class ProcessPaymentView(View):
 class PaymentSuccessView(View):
     """Handle successful payment response from eSewa"""
     def get(self, request):
-        """Process successful payment with idempotency"""
+        """Record eSewa's callback for the worker and send the customer on to the success page"""
+        from .callbacks import record_callback
+
         try:
             # Get the encoded data from query parameters
             data_param = request.GET.get('data')
@@ -525,42 +457,25 @@ class PaymentSuccessView(View):
             decoded_data = base64.b64decode(data_param).decode('utf-8')
             payment_response = json.loads(decoded_data)
 
-            # Verify signature
+            # Verify signature before anything is stored
             signature = payment_response.get('signature')
             if not EsewaPaymentUtils.verify_signature(payment_response, signature):
                 return JsonResponse({'success': False, 'error': 'Invalid signature'})
 
             transaction_uuid = payment_response.get('transaction_uuid')
-            
-            # Use atomic transaction with row locking to prevent race conditions
-            with transaction.atomic():
-                #pylint: disable=no-member
-                payment = Payment.objects.select_for_update().get(transaction_uuid=transaction_uuid)
-                
-                # Idempotency check: if already processed, return success without re-processing
-                if payment.status == 'COMPLETE' and payment.processed_at:
-                    logger.info(f"Payment {transaction_uuid} already processed at {payment.processed_at}")
-                    # For order payments, redirect to order success page with transaction UUID
-                    if payment.payment_source == 'order':
-                        success_redirect_url = f"{settings.FRONTEND_URL}/customer/orders/success?transaction_uuid={transaction_uuid}"
-                        return HttpResponseRedirect(success_redirect_url)
-                    else:
-                        # For payment page payments, redirect to payment success page
-                        success_redirect_url = f"{settings.FRONTEND_URL}/customer/payment/success?transaction_uuid={transaction_uuid}"
-                        return HttpResponseRedirect(success_redirect_url)
-
-                # Update payment status
-                payment.status = payment_response.get('status', 'COMPLETE')
-                payment.transaction_code = payment_response.get('transaction_code')
-                payment.processed_at = timezone.now()
-                payment.save()
-
-                # Create or update subscription if payment is complete
-                if payment.status == 'COMPLETE':
-                    self._update_subscription(payment)
+            #pylint: disable=no-member
+            payment_source = Payment.objects.filter(transaction_uuid=transaction_uuid).values_list(
+                'payment_source', flat=True
+            ).first()
+            if payment_source is None:
+                return JsonResponse({'success': False, 'error': 'Payment not found'})
+
+            # The worker checks the amount and processes it; the success page polls for the outcome
+            record_callback(transaction_uuid, 'redirect', payment_response)
+            logger.info(f"[PAYMENT_CALLBACK] eSewa redirect recorded for {transaction_uuid}")
 
             # Redirect to appropriate success page based on payment source
-            if payment.payment_source == 'order':
+            if payment_source == 'order':
                 success_redirect_url = f"{settings.FRONTEND_URL}/customer/orders/success?transaction_uuid={transaction_uuid}"
                 return HttpResponseRedirect(success_redirect_url)
             else:
@@ -569,9 +484,6 @@ class PaymentSuccessView(View):
                 return HttpResponseRedirect(success_redirect_url)
 
         except Exception as e:
-            from django.core.exceptions import ObjectDoesNotExist
-            if isinstance(e, ObjectDoesNotExist):
-                return JsonResponse({'success': False, 'error': 'Payment not found'})
             logger.exception("Error in PaymentSuccessView: %s", e)
             return JsonResponse({'success': False, 'error': str(e)})
 
@@ -600,7 +512,14 @@ class PaymentSuccessView(View):
 class VerifyEsewaPaymentView(View):
     """Verify eSewa payment from frontend with idempotency"""
     def post(self, request):
-        """Verify and process eSewa payment parameters"""
+        """Record the eSewa payment parameters and process them unless a worker already has them.
+
+        The callback goes through the inbox like eSewa's redirect. When no
+        worker has claimed it, it is processed here and the receipt returned as
+        before; otherwise the answer is 202 with the progress URL to poll.
+        """
+        from .callbacks import claim, handle_callback, record_callback
+
         try:
             data = json.loads(request.body)
             
@@ -617,34 +536,33 @@ class VerifyEsewaPaymentView(View):
                     'error': 'Missing required eSewa parameters'
                 })
             
-            # Use atomic transaction with row locking
-            with transaction.atomic():
-                payment = Payment.objects.select_for_update().get(transaction_uuid=transaction_uuid)
-                
-                # Idempotency check: if already processed, return receipt
-                if payment.status == 'COMPLETE' and payment.processed_at:
-                    logger.info(f"Payment {transaction_uuid} already verified at {payment.processed_at}")
-                    # Return full receipt with orders
-                    process_view = ProcessPaymentView()
-                    return process_view._get_payment_receipt(payment)
-                
-                # Verify the amount matches
-                if float(amount) != float(payment.total_amount):
-                    return JsonResponse({
-                        'success': False, 
-                        'error': 'Payment amount mismatch'
-                    })
-                
-                # Update payment with eSewa transaction details
-                logger.info(f"[PAYMENT_VERIFY] Updating payment with eSewa details - Ref ID: {ref_id}")
-                payment.transaction_code = ref_id
-                payment.ref_id = ref_id
-                payment.save()
-            
-            # Process payment and distribute across orders
-            logger.info(f"[PAYMENT_VERIFY] Initiating payment processing for {transaction_uuid}")
-            process_view = ProcessPaymentView()
-            return process_view.post(request, transaction_uuid)
+            payment = Payment.objects.get(transaction_uuid=transaction_uuid)
+
+            # Idempotency check: if already processed, return receipt
+            if payment.status == 'COMPLETE' and payment.processed_at:
+                logger.info(f"Payment {transaction_uuid} already verified at {payment.processed_at}")
+                return ProcessPaymentView()._get_payment_receipt(payment)
+
+            callback = record_callback(transaction_uuid, 'verify', {
+                'transaction_uuid': transaction_uuid, 'amount': str(amount), 'transaction_code': ref_id,
+            })
+            logger.info(f"[PAYMENT_VERIFY] Callback recorded for {transaction_uuid}")
+            if callback and callback.status == 'received' and claim(callback):
+                handle_callback(callback)
+
+            if callback and callback.status == 'rejected':
+                return JsonResponse({'success': False, 'error': callback.error})
+            if callback and callback.status == 'processed':
+                payment.refresh_from_db()
+                if payment.status == 'COMPLETE':
+                    return ProcessPaymentView()._get_payment_receipt(payment)
+            # Still waiting for (or being handled by) a worker
+            return JsonResponse({
+                'success': True,
+                'status': callback.status if callback else 'received',
+                'transaction_uuid': transaction_uuid,
+                'progress_url': reverse('payment_progress', args=[transaction_uuid]),
+            }, status=202)
             
         except Payment.DoesNotExist:
             return JsonResponse({
@@ -656,34 +574,6 @@ class VerifyEsewaPaymentView(View):
                 'success': False, 
                 'error': 'Invalid JSON data'
             })
-        except DatabaseError as e:
-            # Handle database locking errors
-            error_msg = str(e).lower()
-            if 'locked' in error_msg or 'database is locked' in error_msg:
-                logger.warning(f"[PAYMENT_VERIFY] Database locked, payment may have been processed: {transaction_uuid}")
-                
-                # Try to fetch payment status without locking (read-only)
-                try:
-                    payment = Payment.objects.get(transaction_uuid=transaction_uuid)
-                    if payment.status == 'COMPLETE' and payment.processed_at:
-                        logger.info(f"[PAYMENT_VERIFY] Payment {transaction_uuid} was already processed successfully")
-                        # Return success even though we hit a lock - payment is complete
-                        process_view = ProcessPaymentView()
-                        return process_view._get_payment_receipt(payment)
-                except Payment.DoesNotExist:
-                    pass
-                
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Database is temporarily busy. Your payment may have been processed. Please check your order status.',
-                    'retry_suggested': True
-                }, status=503)
-            else:
-                logger.exception(f"[PAYMENT_VERIFY] Database error: {e}")
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Database error: {str(e)}'
-                }, status=500)
         except Exception as e:
             logger.exception("Error verifying eSewa payment: %s", e)
             return JsonResponse({
@@ -735,62 +625,109 @@ class PaymentFailureView(View):
         })
 
 
+class PaymentProgressView(View):
+    """Where a payment's callback has got to, read from the database without locking"""
+    def get(self, request, transaction_uuid):
+        """Return the payment status and the state of its latest callback"""
+        from .models import PaymentCallback
+
+        #pylint: disable=no-member
+        payment = Payment.objects.filter(transaction_uuid=transaction_uuid).values(
+            'status', 'ref_id', 'processed_at'
+        ).first()
+        if payment is None:
+            return JsonResponse({'success': False, 'error': 'Payment not found'}, status=404)
+        callback = PaymentCallback.objects.filter(transaction_uuid=transaction_uuid).order_by('-id').values(
+            'status', 'error'
+        ).first()
+        return JsonResponse({
+            'success': True,
+            'transaction_uuid': transaction_uuid,
+            'status': payment['status'],
+            'ref_id': payment['ref_id'],
+            'processed': payment['processed_at'] is not None,
+            'callback_status': callback['status'] if callback else None,
+            'callback_error': (callback['error'] or None) if callback else None,
+        })
+
+
 class CheckPaymentStatusView(View):
     """Permission Status Checked"""
     def get(self, request, transaction_uuid):
-        """Check the status of the payment with locking"""
-        try:
-            with transaction.atomic():
-                #pylint: disable=no-member
-                payment = Payment.objects.select_for_update().get(transaction_uuid=transaction_uuid)
+        """Check the status of the payment with eSewa.
 
-                # If already complete, return cached status
-                if payment.status == 'COMPLETE':
-                    return JsonResponse({
-                        'success': True,
-                        'status': payment.status,
-                        'ref_id': payment.ref_id
-                    })
+        No lock is held while eSewa is asked: the payment is read, eSewa is
+        called (or its answer from the last few seconds reused), and only a
+        changed status is written under a short row lock. A payment eSewa
+        reports COMPLETE is processed through reconciliation.complete_payment.
+        """
+        from .esewa import EsewaUnavailable, cached_status
 
-                # Check status with eSewa API
-                status_url = f"{settings.ESEWA_STATUS_CHECK_URL}?product_code={settings.ESEWA_PRODUCT_CODE}&total_amount={int(payment.total_amount)}&transaction_uuid={transaction_uuid}"
+        try:
+            #pylint: disable=no-member
+            payment = Payment.objects.get(transaction_uuid=transaction_uuid)
 
-                response = requests.get(status_url, timeout=10)
+            # If already complete, return cached status
+            if payment.status == 'COMPLETE':
+                return JsonResponse({
+                    'success': True,
+                    'status': payment.status,
+                    'ref_id': payment.ref_id
+                })
 
-                if response.status_code == 200:
-                    status_data = response.json()
+            try:
+                status_data = cached_status(transaction_uuid, payment.total_amount)
+            except EsewaUnavailable:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'eSewa is not responding right now. Please check again in a minute.',
+                    'retry_suggested': True
+                }, status=503)
+            if status_data is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Failed to check payment status'
+                })
 
-                    # Update payment status
-                    new_status = status_data.get('status', 'PENDING')
-                    if payment.status != new_status:
+            new_status = status_data.get('status', 'PENDING')
+            if new_status == 'COMPLETE':
+                # Completed on eSewa's side: build the order, allocate the payment and credit
+                # the wallet the same way a verified browser return does
+                from .reconciliation import complete_payment
+                complete_payment(payment, status_data.get('ref_id'))
+                payment.refresh_from_db()
+                if payment.status != 'COMPLETE':
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Payment is complete on eSewa but could not be processed. Please check again shortly.',
+                        'retry_suggested': True
+                    }, status=500)
+            elif payment.status != new_status:
+                with transaction.atomic():
+                    payment = Payment.objects.select_for_update().get(pk=payment.pk)
+                    # Someone else may have moved it on while eSewa was asked
+                    if payment.status not in (new_status, 'COMPLETE'):
                         payment.status = new_status
                         payment.ref_id = status_data.get('ref_id')
-                        if new_status == 'COMPLETE':
-                            payment.processed_at = timezone.now()
                         payment.save()
 
-                    # Update subscription if payment is complete
-                    if payment.status == 'COMPLETE':
-                        subscription, created = Subscription.objects.get_or_create(
-                            user=payment.user,
-                            defaults={
-                                'payment': payment,
-                                'is_active': True,
-                                'start_date': timezone.now(),
-                                'end_date': timezone.now() + timedelta(days=365)
-                            }
-                        )
+            # Update subscription if payment is complete
+            if payment.status == 'COMPLETE':
+                subscription, created = Subscription.objects.get_or_create(
+                    user=payment.user,
+                    defaults={
+                        'payment': payment,
+                        'is_active': True,
+                        'start_date': timezone.now(),
+                        'end_date': timezone.now() + timedelta(days=365)
+                    }
+                )
 
-                    return JsonResponse({
-                        'success': True,
-                        'status': payment.status,
-                        'ref_id': payment.ref_id
-                    })
-                else:
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Failed to check payment status'
-                    })
+            return JsonResponse({
+                'success': True,
+                'status': payment.status,
+                'ref_id': payment.ref_id
+            })
 
         except Payment.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Payment not found'})
@@ -921,10 +858,11 @@ def pending_bank_payments(request):
         page_size = int(request.GET.get('page_size', 20))
         
         # Get all pending bank payments
+        # Served by the (payment_type, status, created_at) index; user and branch come in the same query
         pending_payments = Payment.objects.filter(
             payment_type='bank',
             status='PENDING'
-        ).order_by('-created_at')
+        ).select_related('user', 'branch').order_by('-created_at')
         
         # Filter by branch if specified
         if branch_id:
@@ -945,7 +883,7 @@ def pending_bank_payments(request):
                 'user_email': payment.user.email,
                 'amount': float(payment.total_amount),
                 'branch_name': payment.branch.name if payment.branch else None,
-                'branch_id': payment.branch.id if payment.branch else None,
+                'branch_id': payment.branch_id,
                 'created_at': payment.created_at.isoformat(),
                 'status': payment.status,
                 'payment_source': payment.payment_source,
@@ -1065,17 +1003,28 @@ def payment_history(request):
         page = int(request.GET.get('page', 1))
         page_size = int(request.GET.get('page_size', 10))
         
-        # Build query
-        payments = Payment.objects.filter(user=request.user).order_by('-created_at')
-        logger.info(f"[PAYMENT_HISTORY] Found {payments.count()} payments for user {request.user.id} ({request.user.email})")
+        # Build query; the applied totals of live and archived allocations are annotated per row
+        from orders.models import applied_amount_subquery, applied_orders_subquery
+        payments = Payment.objects.filter(user=request.user).select_related('branch').annotate(
+            total_applied=applied_amount_subquery(),
+            orders_count=applied_orders_subquery(),
+        ).order_by('-created_at')
 
         # Apply filters
         if search:
-            payments = payments.filter(
-                Q(transaction_uuid__icontains=search) |
-                Q(transaction_code__icontains=search) |
-                Q(ref_id__icontains=search)
-            )
+            from orders.search import MIN_TERM_LENGTH, matching_ids
+            if len(search.strip()) >= MIN_TERM_LENGTH:
+                # Look the references up in the search index instead of scanning three columns;
+                # the text is matched as one substring, as the column filters did
+                payment_ids = [int(pk) for pk in matching_ids(request.user, 'payment', search, phrase=True)]
+                payments = payments.filter(pk__in=payment_ids)
+            else:
+                # Too short for the index; fall back to scanning this user's payments
+                payments = payments.filter(
+                    Q(transaction_uuid__icontains=search) |
+                    Q(transaction_code__icontains=search) |
+                    Q(ref_id__icontains=search)
+                )
         
         if payment_type:
             payments = payments.filter(payment_type=payment_type)
@@ -1083,23 +1032,34 @@ def payment_history(request):
         if status:
             payments = payments.filter(status=status)
         
-        # Paginate
-        from django.core.paginator import Paginator
-        paginator = Paginator(payments, page_size)
-        page_obj = paginator.get_page(page)
+        # Paginate: keyset cursor by default, page numbers when ?page= is sent
+        from orders.pagination import PaymentKeysetPagination
+        if PaymentKeysetPagination.uses_page_numbers(request):
+            from django.core.paginator import Paginator
+            paginator = Paginator(payments, page_size)
+            page_obj = paginator.get_page(page)
+            pagination = {
+                'current_page': page_obj.number,
+                'total_pages': paginator.num_pages,
+                'total_count': paginator.count,
+                'has_next': page_obj.has_next(),
+                'has_previous': page_obj.has_previous(),
+            }
+        else:
+            paginator = PaymentKeysetPagination()
+            page_obj = paginator.paginate_queryset(payments, request)
+            pagination = {
+                'next_cursor': paginator.next_cursor,
+                'next': paginator.get_next_link(),
+                'has_next': paginator.has_next,
+            }
         
         # Serialize payments
         payments_data = []
         for payment in page_obj:
-            # Get count of orders paid by this payment and total amount applied
-            order_payments = OrderPayment.objects.filter(payment=payment)
-            orders_count = order_payments.count()
-            
-            # Calculate total amount applied to orders
-            amount_applied = order_payments.aggregate(
-                total=models.Sum('amount_applied')
-            )['total'] or 0
-            
+            orders_count = payment.orders_count
+            amount_applied = payment.total_applied
+
             # Calculate excess amount (overpayment not applied to any order)
             excess_amount = float(payment.total_amount) - float(amount_applied)
             
@@ -1119,7 +1079,7 @@ def payment_history(request):
                 'payment_type': payment.payment_type,
                 'payment_source': payment.payment_source,  # 'order' or 'payment_page'
                 'branch_name': payment.branch.name if payment.branch else None,
-                'branch_id': payment.branch.id if payment.branch else None,
+                'branch_id': payment.branch_id,
                 'orders_count': orders_count,  # Number of orders this payment was applied to
                 'status': payment.status,
                 'ref_id': payment.ref_id,
@@ -1127,21 +1087,74 @@ def payment_history(request):
                 'updated_at': payment.updated_at.isoformat(),
             })
         
+        from orders.models import CustomerWallet
+        credit_balance = CustomerWallet.objects.filter(user=request.user).aggregate(
+            total=models.Sum('balance', default=0)
+        )['total']
+
         return Response({
             'success': True,
             'payments': payments_data,
-            'pagination': {
-                'current_page': page_obj.number,
-                'total_pages': paginator.num_pages,
-                'total_count': paginator.count,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
-            }
+            'credit_balance': float(credit_balance),  # Unapplied money across all branches
+            'pagination': pagination,
         })
         
+    except NotFound as e:
+        # A cursor that does not decode to a payment position
+        return Response({'success': False, 'error': str(e.detail)}, status=404)
     except Exception as e:
         logger.exception("Error fetching payment history: %s", e)
         return Response({
             'success': False,
             'error': 'Failed to fetch payment history'
+        }, status=500)  # ``status`` is the query parameter here
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def wallet_balance(request):
+    """Get the authenticated user's credit (completed payments not yet applied to orders), per branch"""
+    try:
+        user_id = request.user.id
+        if request.GET.get('user'):
+            # Staff may look up any customer's wallet
+            if not request.user.is_staff:
+                return Response({
+                    'success': False,
+                    'error': 'You do not have permission to view other wallets'
+                }, status=status.HTTP_403_FORBIDDEN)
+            try:
+                user_id = int(request.GET['user'])
+            except ValueError:
+                return Response({'success': False, 'error': 'user must be a user id'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        from orders.models import CustomerWallet
+        wallets = CustomerWallet.objects.filter(user_id=user_id).select_related('branch')
+        if request.GET.get('branch'):
+            try:
+                wallets = wallets.filter(branch_id=int(request.GET['branch']))
+            except ValueError:
+                return Response({'success': False, 'error': 'branch must be a branch id'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        # Balances are summed as Decimal and sent as strings, like the serializers' DecimalFields
+        wallets = list(wallets)
+        wallets_data = [{
+            'branch_id': wallet.branch_id,
+            'branch_name': wallet.branch.name if wallet.branch else None,
+            'balance': str(wallet.balance),
+        } for wallet in wallets]
+
+        return Response({
+            'success': True,
+            'balance': str(sum((wallet.balance for wallet in wallets), Decimal('0.00'))),
+            'wallets': wallets_data,
+        })
+
+    except Exception as e:
+        logger.exception("Error fetching wallet balance: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to fetch wallet balance'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -144,3 +144,22 @@ class BulkCloth(models.Model):
     def __str__(self):
         return f"{self.cloth_type} - {self.price_per_kg} per kg"
 
+
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+@receiver(post_save, sender=WashType)
+@receiver(post_delete, sender=WashType)
+@receiver(post_save, sender=ClothName)
+@receiver(post_delete, sender=ClothName)
+@receiver(post_save, sender=ClothType)
+@receiver(post_delete, sender=ClothType)
+@receiver(post_save, sender=SystemSettings)
+def invalidate_pricing_matrix(sender, instance, **kwargs):
+    """Make every process reload the pricing matrix on its next quote."""
+    from .pricing import invalidate_matrix
+    invalidate_matrix()
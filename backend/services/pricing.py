@@ -0,0 +1,178 @@
+"""In-process quote engine backed by a dense pricing matrix.
+
+The active PricingRule rows (WashType × ClothName × ClothType) are loaded into
+one flat ``array('q')`` of prices in paisa, indexed by the positions of the
+active wash types, cloth names and cloth types, together with the pickup,
+delivery and urgent costs from SystemSettings. Pricing an item is then a few
+dict lookups and one array read, so a whole cart is priced without a query.
+
+Each process keeps its own copy of the matrix and reloads it when the
+version key in the cache changes; saves and deletes of pricing rules, their
+three dimensions and the system settings bump that key (see the signals in
+services/models.py). Other workers only see the bump when the cache is shared
+(CACHE_URL in settings.py).
+"""
+import uuid
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+
+VERSION_CACHE_KEY = 'pricing-matrix-version'
+MISSING = -1
+CENT = Decimal('0.01')
+
+
+def to_paisa(amount):
+    """Convert a rupee amount to whole paisa."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paisa):
+    return (Decimal(paisa) / 100).quantize(CENT)
+
+
+def _key(value):
+    """Normalise a dimension reference: ids stay ints, names are matched case-insensitively."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.isdigit() else value.casefold()
+    return None
+
+
+class PricingMatrix:
+    """Dense ``wash type × cloth name × cloth type`` price table plus the service fees."""
+
+    def __init__(self, wash_types, cloth_names, cloth_types, rules, fees, version=None):
+        """``wash_types``, ``cloth_names`` and ``cloth_types`` are ``(id, name)`` pairs,
+        ``rules`` are ``(wash_type_id, cloth_name_id, cloth_type_id, price)`` and
+        ``fees`` maps 'pickup', 'delivery' and 'urgent' to their cost."""
+        self.version = version
+        dimensions = [sorted(rows) for rows in (wash_types, cloth_names, cloth_types)]
+        self.dimensions = [self._index(rows) for rows in dimensions]
+        self.shape = tuple(len(rows) for rows in dimensions)
+        self.prices = array('q', [MISSING]) * (self.shape[0] * self.shape[1] * self.shape[2])
+        for wash_type_id, cloth_name_id, cloth_type_id, price in rules:
+            offset = self._offset(wash_type_id, cloth_name_id, cloth_type_id)
+            if offset is not None:
+                self.prices[offset] = to_paisa(price)
+        self.fees = {name: to_paisa(cost) for name, cost in fees.items()}
+
+    @staticmethod
+    def _index(rows):
+        """Map each row's id and name to its position; the lowest id wins a shared name."""
+        index = {}
+        for position, (row_id, name) in enumerate(rows):
+            index[row_id] = position
+            index.setdefault(name.strip().casefold(), position)
+        return index
+
+    def _offset(self, wash_type, cloth_name, cloth_type):
+        positions = []
+        for index, value in zip(self.dimensions, (wash_type, cloth_name, cloth_type)):
+            position = index.get(_key(value))
+            if position is None:
+                return None
+            positions.append(position)
+        i, j, k = positions
+        return (i * self.shape[1] + j) * self.shape[2] + k
+
+    def price(self, wash_type, cloth_name, cloth_type):
+        """Unit price in paisa of a combination (ids or names), or None if it is not priced."""
+        offset = self._offset(wash_type, cloth_name, cloth_type)
+        if offset is None or self.prices[offset] == MISSING:
+            return None
+        return self.prices[offset]
+
+    @property
+    def rule_count(self):
+        return sum(1 for price in self.prices if price != MISSING)
+
+    def quote(self, items, pickup=False, delivery=False, urgent=False, discount=0):
+        """Price a cart.
+
+        ``items`` are dicts with ``wash_type``, ``cloth_name`` (or
+        ``service_type``), ``cloth_type`` (or ``material``) and ``quantity``,
+        the dimensions given as ids or names. Items without an active pricing
+        rule are returned with ``unit_price`` None, listed in ``unpriced`` and
+        left out of the subtotal.
+        """
+        lines, unpriced, subtotal = [], [], 0
+        for index, item in enumerate(items):
+            cloth_name = item.get('cloth_name', item.get('service_type'))
+            cloth_type = item.get('cloth_type', item.get('material'))
+            quantity = item.get('quantity') or 0
+            unit = self.price(item.get('wash_type'), cloth_name, cloth_type)
+            line = {
+                'index': index, 'wash_type': item.get('wash_type'), 'cloth_name': cloth_name,
+                'cloth_type': cloth_type, 'quantity': quantity, 'unit_price': None, 'total_price': None,
+            }
+            if unit is None:
+                unpriced.append(index)
+            else:
+                line['unit_price'] = to_rupees(unit)
+                line['total_price'] = to_rupees(unit * quantity)
+                subtotal += unit * quantity
+            lines.append(line)
+
+        fees = {
+            'pickup_cost': self.fees['pickup'] if pickup else 0,
+            'delivery_cost': self.fees['delivery'] if delivery else 0,
+            'urgent_cost': self.fees['urgent'] if urgent else 0,
+        }
+        discount = to_paisa(discount or 0)
+        total = max(subtotal + sum(fees.values()) - discount, 0)
+        return {
+            'items': lines,
+            'unpriced': unpriced,
+            'subtotal': to_rupees(subtotal),
+            **{name: to_rupees(cost) for name, cost in fees.items()},
+            'discount': to_rupees(discount),
+            'total': to_rupees(total),
+            'version': self.version,
+        }
+
+
+_matrix = None
+_matrix_version = None
+
+
+def invalidate_matrix():
+    """Tell every process to reload its pricing matrix on the next quote."""
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def load_matrix(version=None):
+    """Build a PricingMatrix from the active pricing rules and the system settings (five queries)."""
+    from .models import ClothName, ClothType, PricingRule, SystemSettings, WashType
+
+    # Read, not get_settings(): creating the row here would bump the version being loaded
+    settings = SystemSettings.objects.first() or SystemSettings()
+    return PricingMatrix(
+        WashType.objects.filter(is_active=True).values_list('id', 'name'),
+        ClothName.objects.filter(is_active=True).values_list('id', 'name'),
+        ClothType.objects.filter(is_active=True).values_list('id', 'name'),
+        PricingRule.objects.filter(is_active=True).values_list(
+            'wash_type_id', 'cloth_name_id', 'cloth_type_id', 'price'
+        ),
+        {'pickup': settings.pickup_cost, 'delivery': settings.delivery_cost, 'urgent': settings.urgent_cost},
+        version=version,
+    )
+
+
+def get_matrix():
+    """Return this process's pricing matrix, reloading it when pricing has changed."""
+    global _matrix, _matrix_version
+
+    version = cache.get_or_set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    if _matrix is None or version != _matrix_version:
+        _matrix = load_matrix(version)
+        _matrix_version = version
+    return _matrix
+
+
+def quote_cart(items, pickup=False, delivery=False, urgent=False, discount=0):
+    """Price a cart with the current matrix (see PricingMatrix.quote)."""
+    return get_matrix().quote(items, pickup=pickup, delivery=delivery, urgent=urgent, discount=discount)
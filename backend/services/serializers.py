@@ -69,6 +69,39 @@ class PricingLookupSerializer(serializers.Serializer):
     cloth_type = serializers.IntegerField()
 
 
+class QuoteItemSerializer(serializers.Serializer):
+    """One cart line to price; dimensions are ids or names.
+
+    ``service_type`` and ``material`` are accepted in place of ``cloth_name``
+    and ``cloth_type`` so an order's ``services`` list can be quoted as is.
+    """
+    wash_type = serializers.CharField()
+    cloth_name = serializers.CharField(required=False)
+    service_type = serializers.CharField(required=False)
+    cloth_type = serializers.CharField(required=False)
+    material = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        attrs['cloth_name'] = attrs.pop('cloth_name', None) or attrs.pop('service_type', None)
+        attrs['cloth_type'] = attrs.pop('cloth_type', None) or attrs.pop('material', None)
+        attrs.pop('service_type', None)
+        attrs.pop('material', None)
+        errors = {name: ['This field is required.'] for name in ('cloth_name', 'cloth_type') if not attrs[name]}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class QuoteSerializer(serializers.Serializer):
+    """A cart to price with the pricing matrix."""
+    items = QuoteItemSerializer(many=True, allow_empty=False)
+    pickup_enabled = serializers.BooleanField(required=False, default=False)
+    delivery_enabled = serializers.BooleanField(required=False, default=False)
+    is_urgent = serializers.BooleanField(required=False, default=False)
+    discount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, default=0)
+
+
 class DeliveryTypeSerializer(serializers.ModelSerializer):
     """Serializer for the DeliveryType model."""
     class Meta:
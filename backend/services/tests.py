@@ -1,3 +1,85 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import ClothName, ClothType, PricingRule, SystemSettings, WashType
+from .pricing import get_matrix, invalidate_matrix, quote_cart
+
+User = get_user_model()
+
+
+class PricingMatrixTest(TestCase):
+    def setUp(self):
+        # The matrix outlives each test's database; make the next test reload it
+        self.addCleanup(invalidate_matrix)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='quote@example.com', password='testpassword',
+                                             first_name='Quote', last_name='User', phone='9841000000')
+        self.client.force_authenticate(user=self.user)
+        self.dry, self.normal = WashType.objects.create(name='Dry Wash'), WashType.objects.create(name='Normal Wash')
+        self.shirt, self.saree = ClothName.objects.create(name='Shirt'), ClothName.objects.create(name='Saree')
+        self.cotton, self.silk = ClothType.objects.create(name='Cotton'), ClothType.objects.create(name='Silk')
+        PricingRule.objects.create(wash_type=self.dry, cloth_name=self.shirt, cloth_type=self.cotton, price='120.50')
+        PricingRule.objects.create(wash_type=self.normal, cloth_name=self.saree, cloth_type=self.silk, price=300)
+        PricingRule.objects.create(wash_type=self.dry, cloth_name=self.saree, cloth_type=self.silk, price=450,
+                                   is_active=False)
+
+    def test_prices_by_id_or_name_without_queries(self):
+        matrix = get_matrix()
+        self.assertEqual(matrix.shape, (2, 2, 2))
+        self.assertEqual(matrix.rule_count, 2)
+        with self.assertNumQueries(0):
+            self.assertIs(get_matrix(), matrix)
+            self.assertEqual(matrix.price(self.dry.id, self.shirt.id, self.cotton.id), 12050)
+            self.assertEqual(matrix.price(' dry wash', 'SHIRT', str(self.cotton.id)), 12050)
+            self.assertIsNone(matrix.price('Dry Wash', 'Saree', 'Silk'))
+            self.assertIsNone(matrix.price('Steam', 'Shirt', 'Cotton'))
+
+    def test_quote_prices_the_cart_and_fees(self):
+        quote = quote_cart([
+            {'wash_type': 'Dry Wash', 'service_type': 'Shirt', 'material': 'Cotton', 'quantity': 2},
+            {'wash_type': self.normal.id, 'cloth_name': self.saree.id, 'cloth_type': self.silk.id, 'quantity': 1},
+            {'wash_type': 'Dry Wash', 'cloth_name': 'Saree', 'cloth_type': 'Silk', 'quantity': 1},
+        ], pickup=True, urgent=True, discount=100)
+
+        self.assertEqual(quote['unpriced'], [2])
+        self.assertEqual(str(quote['items'][0]['total_price']), '241.00')
+        self.assertEqual(str(quote['subtotal']), '541.00')
+        self.assertEqual(str(quote['pickup_cost']), '200.00')
+        self.assertEqual(str(quote['delivery_cost']), '0.00')
+        self.assertEqual(str(quote['total']), '1141.00')
+
+    def test_matrix_reloads_only_when_pricing_changes(self):
+        matrix = get_matrix()
+        self.assertIs(get_matrix(), matrix)
+
+        rule = PricingRule.objects.get(wash_type=self.normal)
+        rule.price = 350
+        rule.save()
+        self.assertIsNot(get_matrix(), matrix)
+        self.assertEqual(get_matrix().price('Normal Wash', 'Saree', 'Silk'), 35000)
+
+        settings = SystemSettings.get_settings()
+        settings.urgent_cost = 650
+        settings.save()
+        self.assertEqual(str(quote_cart([], urgent=True)['total']), '650.00')
+
+        self.shirt.is_active = False
+        self.shirt.save()
+        self.assertIsNone(get_matrix().price('Dry Wash', 'Shirt', 'Cotton'))
+
+    def test_quote_endpoint(self):
+        url = reverse('pricing-quote')
+        response = self.client.post(url, {
+            'items': [{'wash_type': 'Dry Wash', 'service_type': 'Shirt', 'material': 'Cotton', 'quantity': 3}],
+            'delivery_enabled': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'][0]['unit_price'], '120.50')
+        self.assertEqual(response.data['total'], '561.50')
+
+        response = self.client.post(url, {'items': [{'wash_type': 'Dry Wash', 'quantity': 0}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', response.data['items'][0])
@@ -25,6 +25,7 @@ urlpatterns = [
     path('pricing-rules/', PricingRuleViewSet.as_view({'get': 'list', 'post': 'create'})),
     path('pricing-rules/<int:pk>/', PricingRuleViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})),
     path('pricing-rules/lookup/', PricingRuleViewSet.as_view({'get': 'lookup'})),
+    path('pricing-rules/quote/', PricingRuleViewSet.as_view({'post': 'quote'}), name='pricing-quote'),
 
     # Services (legacy)
     path('services/', ServiceViewSet.as_view({'get': 'list', 'post': 'create'})),
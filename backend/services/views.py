@@ -12,7 +12,7 @@ from .serializers import (
     ServiceSerializer, WashTypeSerializer, DeliveryTypeSerializer,
     ServiceCostSerializer, IndividualClothSerializer, BulkClothSerializer,
     SystemSettingsSerializer, ClothNameSerializer, ClothTypeSerializer,
-    PricingRuleSerializer
+    PricingRuleSerializer, QuoteSerializer
 )
 
 
@@ -103,7 +103,7 @@ class PricingRuleViewSet(viewsets.ModelViewSet):
 
     def get_permissions(self):
         # GET is allowed for authenticated users, but create/update/delete requires admin
-        if self.action in ['list', 'retrieve', 'lookup']:
+        if self.action in ['list', 'retrieve', 'lookup', 'quote']:
             return [IsAuthenticated()]
         return [IsAdminUser()]
 
@@ -125,16 +125,34 @@ class PricingRuleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            rule = PricingRule.objects.get(
-                wash_type_id=wash_type_id,
-                cloth_name_id=cloth_name_id,
-                cloth_type_id=cloth_type_id,
-                is_active=True
-            )
-            return Response({'price': str(rule.price)})
-        except PricingRule.DoesNotExist:
+        from .pricing import get_matrix, to_rupees
+
+        price = get_matrix().price(wash_type_id, cloth_name_id, cloth_type_id)
+        if price is None:
             return Response({'price': None, 'message': 'No pricing rule found'})
+        return Response({'price': str(to_rupees(price))})
+
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """Price a whole cart, including pickup, delivery and urgent costs, in one call."""
+        from .pricing import quote_cart
+
+        serializer = QuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        quote = quote_cart(
+            data['items'], pickup=data['pickup_enabled'], delivery=data['delivery_enabled'],
+            urgent=data['is_urgent'], discount=data['discount'],
+        )
+        # Amounts as strings, like the lookup price
+        for line in quote['items']:
+            for field in ('unit_price', 'total_price'):
+                if line[field] is not None:
+                    line[field] = str(line[field])
+        for field in ('subtotal', 'pickup_cost', 'delivery_cost', 'urgent_cost', 'discount', 'total'):
+            quote[field] = str(quote[field])
+        return Response(quote)
 
 
 class ServiceViewSet(viewsets.ModelViewSet):
@@ -147,8 +147,24 @@ class TestAuthenticationView(GenericAPIView):
             'is_active': user.is_active,
             'date_joined': user.date_joined.isoformat(),
             'last_login': user.last_login.isoformat() if user.last_login else None,
+            'is_vip': user.is_vip,
+            'stats': self._get_spend_stats(user),
         }
         return Response(data, status=status.HTTP_200_OK)
+
+    def _get_spend_stats(self, user):
+        """Read the customer's spend stats from the incremental spend ledger."""
+        from django.utils import timezone
+        from orders.models import CustomerSpend, CustomerLifetimeSpend, spend_month
+
+        month = CustomerSpend.objects.filter(user=user, month=spend_month(timezone.now())).first()
+        lifetime = CustomerLifetimeSpend.objects.filter(user=user).first()
+        return {
+            'month_orders': month.order_count if month else 0,
+            'month_spent': float(month.total_spent) if month else 0.0,
+            'lifetime_orders': lifetime.order_count if lifetime else 0,
+            'lifetime_spent': float(lifetime.total_spent) if lifetime else 0.0,
+        }
     
 
 class PasswordResetRequestView(GenericAPIView):